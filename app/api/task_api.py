@@ -1,17 +1,59 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+import asyncio
+import base64
+import json
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from prometheus_client import Counter, Gauge
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.models import Task
+from app.cache.idempotency import DEDUP_KIND_KEY, DEDUP_KIND_CONTENT, content_key, claim_key, release_key
+from app.cache.rate_limit import take_tokens
+from app.cache.task_cache import TERMINAL_STATUSES, get_cached_task, get_cached_tasks, cache_task, cache_tasks
+from app.consumer.handlers import handlers
+from app.consumer.relay import notify_relay
+from app.consumer.retry import replay_failed_tasks
+from app.core.config import settings
+from app.db.models import Task, TaskArchive, TaskOutbox
 from app.db.models import async_session
-from app.schemas import TASK_STATUS_CANCELED, TASK_STATUS_PENDING, TASK_STATUS_PROCESSING, TaskCreate, TaskResponse
-from app.queue.redis_queue import enqueue_task
+from app.events.task_events import task_event_hub, task_events, publish_task_event
+from app.schemas import (
+    TASK_STATUS_CANCELED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SCHEDULED,
+    TASK_STATUSES,
+    TaskCreate,
+    TaskResponse,
+    TaskBatchResponse,
+    TaskListResponse,
+    TaskReplayResponse,
+    TaskStatusResponse
+)
+from app.queue.backlog_cache import BacklogCache
+from app.queue.cancel_set import mark_canceled
+from app.queue.delay_queue import unschedule_task
 from app.utils.logging import setup_logger
+from app.utils.tracing import traced, set_span_attribute, current_traceparent
 from app.utils.metrics import (
-    metrics_task_status,
+    metrics_db_commit_duration,
+    metrics_task_status_change_count,
+    metrics_task_dedup_count,
+    metrics_task_admission_reject_count,
     metrics_task_create_request_count,
     metrics_task_create_success_count,
     metrics_task_create_fail_count,
+    metrics_task_create_batch_task_count,
+    metrics_task_create_batch_size,
+    metrics_task_create_batch_duration,
     metrics_task_get_request_count,
+    metrics_task_status_request_count,
+    metrics_task_status_lookup_size,
+    metrics_task_list_request_count,
+    metrics_task_export_row_count,
+    metrics_task_events_request_count,
     metrics_task_cancel_request_count,
     metrics_task_cancel_success_count,
     metrics_task_cancel_fail_count
@@ -21,78 +63,402 @@ logger = setup_logger(__name__)
 
 router = APIRouter()
 
+# admission reasons
+ADMISSION_RATE = "rate"
+ADMISSION_BACKLOG = "backlog"
+ADMISSION_WAIT = "wait"
+
+# backlog of the queues seen by the admission guard, sampled in the background
+backlog_cache = BacklogCache(settings.task_admission_refresh_interval)
+
 async def get_db():
     async with async_session() as db:
         yield db
 
+def resolve_run_at(task: TaskCreate) -> Optional[datetime]:
+    # time the task becomes ready, None if it is ready now; a naive run_at is taken as UTC
+    if task.run_at and task.delay_seconds is not None:
+        raise ValueError("Only one of run_at and delay_seconds may be set")
+
+    now = datetime.now(timezone.utc)
+    if task.delay_seconds is not None:
+        if task.delay_seconds < 0:
+            raise ValueError("delay_seconds must not be negative")
+        run_at = now + timedelta(seconds=task.delay_seconds)
+    elif task.run_at:
+        run_at = task.run_at if task.run_at.tzinfo else task.run_at.replace(tzinfo=timezone.utc)
+    else:
+        return None
+    return run_at if run_at > now else None
+
+def rate_limit_client(request: Request) -> str:
+    # clients are told apart by their api key, or by their address without one
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def reject(reason: str, retry_after: float, detail: str):
+    metrics_task_admission_reject_count.labels(reason).inc()
+    metrics_task_create_fail_count.inc()
+    logger.warning(f"Task submission rejected: {detail}.")
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
+
+async def admit(request: Optional[Request], cost: int):
+    # the backlog guard only reads the local sample, the rate limit is one script call;
+    # without redis the rate limit lets submissions in rather than failing them
+    if settings.task_admission_max_backlog > 0 or settings.task_admission_max_wait > 0:
+        depth, wait = backlog_cache.sample()
+        if 0 < settings.task_admission_max_backlog <= depth:
+            reject(ADMISSION_BACKLOG, settings.task_admission_refresh_interval, "Task backlog is full")
+        if 0 < settings.task_admission_max_wait <= wait:
+            reject(ADMISSION_WAIT, wait - settings.task_admission_max_wait, "Task queue wait is too long")
+
+    if settings.task_rate_limit <= 0 or request is None:
+        return
+    try:
+        allowed, retry_after = await take_tokens(
+            rate_limit_client(request), settings.task_rate_limit, settings.task_rate_limit_burst, cost
+        )
+    except Exception as e:
+        logger.warning(f"Task rate limit error: {e}")
+        return
+    if not allowed:
+        reject(ADMISSION_RATE, retry_after, "Task rate limit exceeded")
+
+def dedup_key(task: TaskCreate, key: Optional[str]) -> Optional[Tuple[str, str, int]]:
+    # kind, key and ttl of the dedup key of a submission, None if it is not deduplicated
+    if key:
+        return DEDUP_KIND_KEY, key, settings.task_idempotency_ttl
+    if settings.task_dedup_window > 0:
+        return DEDUP_KIND_CONTENT, content_key(task), settings.task_dedup_window
+    return None
+
+async def replay_task(task_id: str, task: TaskCreate, response: Response, db: AsyncSession):
+    # the task created by an earlier submission of the same request
+    existing = await get_cached_task(task_id) or await find_task(task_id, db)
+    if not existing:
+        # the first submission is still being saved
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Task with this idempotency key is being created")
+    if (existing.content, existing.type, existing.queue) != (task.content, task.type, task.queue):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Idempotency key was used for a different task"
+        )
+
+    response.headers["Idempotent-Replayed"] = "true"
+    logger.info(f"Task {existing.id} replayed for a duplicate submission.", extra={"task_id": existing.id})
+    return existing
+
+async def release_dedup_key(dedup: Optional[Tuple[str, str, int]]):
+    if not dedup:
+        return
+    try:
+        await release_key(dedup[0], dedup[1])
+    except Exception as e:
+        logger.warning(f"Task dedup key release error: {e}")
+
 @router.post("/task", response_model=TaskResponse, status_code=status.HTTP_201_CREATED)
-async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_db)):
+@traced("task.create")
+async def create_task(
+    task: TaskCreate,
+    db: AsyncSession = Depends(get_db),
+    response: Response = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    request: Request = None,
+):
     metrics_task_create_request_count.inc()
 
-    new_task = Task(task.content)
+    # check task type
+    if task.type not in handlers:
+        metrics_task_create_fail_count.inc()
+        logger.warning(f"Unknown task type {task.type}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown task type")
+
+    # check task queue
+    if task.queue not in settings.task_queues:
+        metrics_task_create_fail_count.inc()
+        logger.warning(f"Unknown task queue {task.queue}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown task queue")
+
+    # check schedule
+    try:
+        run_at = resolve_run_at(task)
+    except ValueError as e:
+        metrics_task_create_fail_count.inc()
+        logger.warning(f"Invalid task schedule: {e}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    await admit(request, 1)
+
+    new_task = Task(
+        task.content,
+        status=TASK_STATUS_SCHEDULED if run_at else TASK_STATUS_PENDING,
+        task_type=task.type,
+        queue=task.queue,
+        run_at=run_at,
+        idempotency_key=idempotency_key,
+    )
+
+    set_span_attribute("task_id", new_task.id)
 
-    # save task to the database
+    # claim the dedup key before anything is written, a retried submission gets the first task back
+    dedup = dedup_key(task, idempotency_key)
+    if dedup:
+        kind, key, ttl = dedup
+        try:
+            owner_id = await claim_key(kind, key, new_task.id, ttl)
+        except Exception as e:
+            # the database constraint still catches a duplicate idempotency key
+            logger.warning(f"Task dedup key error: {e}")
+            owner_id = new_task.id
+        if owner_id != new_task.id:
+            metrics_task_dedup_count.labels(kind, "hit").inc()
+            return await replay_task(owner_id, task, response, db)
+        metrics_task_dedup_count.labels(kind, "miss").inc()
+
+    # save task to the database, with its queue push in the outbox of the same transaction;
+    # the relay pushes it to the queue, or to the scheduled set until it is due
     try:
         db.add(new_task)
-        await db.commit()
-        await db.refresh(new_task)
+        db.add(TaskOutbox(new_task.id, new_task.queue, run_at=run_at, trace=current_traceparent()))
+        with metrics_db_commit_duration.labels("create").time():
+            await db.commit()
     except Exception as e:
         await db.rollback()
 
+        # a submission with the same key got to the database first, e.g. while redis was down
+        if idempotency_key and isinstance(e, IntegrityError):
+            existing = await Task.get_by_idempotency_key(idempotency_key, db)
+            if existing:
+                await release_dedup_key(dedup)
+                metrics_task_dedup_count.labels(DEDUP_KIND_KEY, "hit").inc()
+                return await replay_task(existing.id, task, response, db)
+
+        await release_dedup_key(dedup)
         metrics_task_create_fail_count.inc()
         logger.error(f"Task creation error: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task creation error")
 
-    # add task to the queue
-    try:
-        await enqueue_task(new_task.id)
-    except Exception as e:
-        # rollback task creation if enqueue fails
-        db.delete(new_task)
-        await db.commit()
+    notify_relay()
+    await cache_task(new_task)
+
+    metrics_task_status_change_count.labels(new_task.status).inc()
+    metrics_task_create_success_count.inc()
+    logger.info(f"Task created with ID: {new_task.id}", extra={"task_id": new_task.id, "status": new_task.status})
+    return new_task
 
+@router.post("/tasks/batch", response_model=TaskBatchResponse, status_code=status.HTTP_201_CREATED)
+@traced("task.create_batch")
+async def create_tasks(tasks: List[TaskCreate], db: AsyncSession = Depends(get_db), request: Request = None):
+    metrics_task_create_request_count.inc()
+    metrics_task_create_batch_task_count.inc(len(tasks))
+
+    # check batch size
+    if not tasks:
         metrics_task_create_fail_count.inc()
-        logger.error(f"Task creation error: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task creation error")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Task batch is empty")
+    if len(tasks) > settings.task_batch_max_size:
+        metrics_task_create_fail_count.inc()
+        logger.warning(f"Task batch of {len(tasks)} exceeds limit {settings.task_batch_max_size}.")
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Task batch exceeds limit of {settings.task_batch_max_size}"
+        )
+
+    # check each task type, queue and schedule, each task keeps its resolved run_at; the batch is
+    # created as a whole, so one invalid task rejects it with the index and error of every invalid task
+    errors = []
+    checked_tasks = []
+    for index, task in enumerate(tasks):
+        if task.type not in handlers:
+            errors.append({"index": index, "error": "Unknown task type"})
+        elif task.queue not in settings.task_queues:
+            errors.append({"index": index, "error": "Unknown task queue"})
+        else:
+            try:
+                checked_tasks.append(task.model_copy(update={"run_at": resolve_run_at(task), "delay_seconds": None}))
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+    if errors:
+        metrics_task_create_fail_count.inc()
+        logger.warning(f"Invalid tasks in batch: {errors}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
+    tasks = checked_tasks
+
+    await admit(request, len(tasks))
+
+    metrics_task_create_batch_size.observe(len(tasks))
+    with metrics_task_create_batch_duration.time():
+        # save tasks to the database with one multi-row insert, and their queue pushes to the outbox
+        try:
+            new_tasks = await Task.create_many(tasks, db)
+            await TaskOutbox.add_many(new_tasks, current_traceparent(), db)
+            with metrics_db_commit_duration.labels("create").time():
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+
+            metrics_task_create_fail_count.inc()
+            logger.error(f"Task batch creation error: {e}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task batch creation error")
 
-    metrics_task_status.labels(new_task.status).inc()
+    notify_relay()
+    await cache_tasks(new_tasks)
+
+    scheduled_count = sum(1 for new_task in new_tasks if new_task.run_at)
+    metrics_task_status_change_count.labels(TASK_STATUS_SCHEDULED).inc(scheduled_count)
+    metrics_task_status_change_count.labels(TASK_STATUS_PENDING).inc(len(new_tasks) - scheduled_count)
     metrics_task_create_success_count.inc()
-    logger.info(f"Task created with ID: {new_task.id}")
-    return new_task
+    logger.info(f"Task batch created with {len(new_tasks)} tasks.")
+    return {"tasks": new_tasks}
+
+def encode_cursor(task) -> str:
+    # opaque cursor pointing right after the given task
+    data = json.dumps({"created_at": task.created_at.isoformat(), "id": task.id})
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(data["created_at"]), data["id"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+async def export_tasks(filters: dict, after: Optional[Tuple[datetime, str]]):
+    # page through the rows with a fresh session per page, so neither the rows
+    # nor a transaction are held for the whole export
+    while True:
+        async with async_session() as db:
+            tasks = await Task.list_page(db, settings.task_export_batch_size, after=after, **filters)
+        for task in tasks:
+            yield TaskResponse.model_validate(task).model_dump_json() + "\n"
+        metrics_task_export_row_count.inc(len(tasks))
+        if len(tasks) < settings.task_export_batch_size:
+            return
+        after = (tasks[-1].created_at, tasks[-1].id)
+
+@router.get("/tasks", response_model=TaskListResponse)
+async def list_tasks(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    output_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    metrics_task_list_request_count.inc()
+
+    # check filters
+    if status_filter and status_filter not in TASK_STATUSES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown task status")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    filters = {
+        "status": status_filter,
+        "created_after": created_after,
+        "created_before": created_before,
+        "descending": order == "desc",
+    }
+
+    # stream every matching task as one JSON object per line
+    if output_format == "ndjson":
+        return StreamingResponse(export_tasks(filters, after), media_type="application/x-ndjson")
+
+    # fetch one more row than requested to know whether there is a next page
+    limit = min(limit, settings.task_list_max_limit)
+    try:
+        tasks = await Task.list_page(db, limit + 1, after=after, **filters)
+    except Exception as e:
+        logger.error(f"Task list error: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task list error")
+
+    next_cursor = encode_cursor(tasks[limit - 1]) if len(tasks) > limit else None
+    return {"tasks": tasks[:limit], "next_cursor": next_cursor}
+
+async def find_task(task_id: str, db: AsyncSession):
+    # tasks moved out by the archiver are still found in the archive
+    task = await Task.get(task_id, db)
+    if not task:
+        task = await TaskArchive.get(task_id, db)
+    return task
 
 @router.get("/task/{task_id}", response_model=TaskResponse)
 async def get_task(task_id: str, db: AsyncSession = Depends(get_db)):
     metrics_task_get_request_count.inc()
 
+    # serve from cache if possible
+    task = await get_cached_task(task_id)
+    if task:
+        return task
+
     # find task by id
-    task = await Task.get(task_id, db)
+    task = await find_task(task_id, db)
 
     if not task:
         logger.error(f"Task {task_id} not found.")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
 
+    await cache_task(task)
     return task
 
+async def find_tasks(task_ids: List[str], db: AsyncSession) -> Dict[str, Task]:
+    # one query per chunk, ids not in the task table are looked up in the archive
+    tasks = {}
+    for start in range(0, len(task_ids), settings.task_status_chunk_size):
+        chunk = task_ids[start:start + settings.task_status_chunk_size]
+        for task in await Task.get_many(chunk, db):
+            tasks[task.id] = task
+        archived = [task_id for task_id in chunk if task_id not in tasks]
+        if archived:
+            for task in await TaskArchive.get_many(archived, db):
+                tasks[task.id] = task
+    return tasks
+
+@router.post("/tasks/status", response_model=TaskStatusResponse, response_model_exclude_none=True)
+async def get_task_statuses(task_ids: List[str], compact: bool = False, db: AsyncSession = Depends(get_db)):
+    metrics_task_status_request_count.inc()
+
+    # a repeated id is looked up once
+    task_ids = list(dict.fromkeys(task_ids))
+    if len(task_ids) > settings.task_status_max_ids:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Too many task ids")
+    metrics_task_status_lookup_size.observe(len(task_ids))
+
+    # serve from cache if possible, only the misses are read from the database
+    tasks = await get_cached_tasks(task_ids)
+    misses = [task_id for task_id in task_ids if task_id not in tasks]
+    if misses:
+        try:
+            found = await find_tasks(misses, db)
+        except Exception as e:
+            logger.error(f"Task status error: {e}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task status error")
+        await cache_tasks(list(found.values()))
+        tasks.update(found)
+
+    # the order of the request, unknown ids listed apart
+    missing = [task_id for task_id in task_ids if task_id not in tasks]
+    if compact:
+        return {"statuses": {task_id: tasks[task_id].status for task_id in task_ids if task_id in tasks}, "missing": missing}
+    return {"tasks": [tasks[task_id] for task_id in task_ids if task_id in tasks], "missing": missing}
+
 @router.patch("/task/{task_id}/cancel", response_model=TaskResponse)
 async def cancel_task(task_id: str, db: AsyncSession = Depends(get_db)):
     metrics_task_cancel_request_count.inc()
 
-    # find task by id
-    task = await Task.get(task_id, db)
-
-    # check if task exists and is cancelable
-    if not task:
-        logger.error(f"Task {task_id} not found.")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-    if task.status not in [TASK_STATUS_PENDING, TASK_STATUS_PROCESSING]:
-        logger.warning(f"Task {task_id} cannot be canceled as it is already {task.status}.")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Task cannot be canceled")
-
-    # cancel task
+    # cancel task, only a pending or processing task moves to canceled
     try:
-        task.status = TASK_STATUS_CANCELED
-        await db.commit()
-        await db.refresh(task)
+        task = await Task.transition(task_id, TASK_STATUS_CANCELED, db)
+        with metrics_db_commit_duration.labels("cancel").time():
+            await db.commit()
     except Exception as e:
         await db.rollback()
 
@@ -100,7 +466,128 @@ async def cancel_task(task_id: str, db: AsyncSession = Depends(get_db)):
         logger.error(f"Task {task_id} cancel error: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task cancel error")
 
-    metrics_task_status.labels(task.status).inc()
+    # find out why the task was not canceled
+    if not task:
+        task = await find_task(task_id, db)
+        if not task:
+            logger.error(f"Task {task_id} not found.")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+        logger.warning(f"Task {task_id} cannot be canceled as it is already {task.status}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Task cannot be canceled")
+
+    # drop a scheduled task from its set, a task promoted in the meantime is skipped by the consumer
+    if task.run_at:
+        try:
+            await unschedule_task(task.id, task.queue)
+        except Exception as e:
+            logger.warning(f"Task {task_id} unschedule error: {e}")
+
+    # stop the consumer running the task and let others skip it at dequeue, best effort as the
+    # consumer still finds the task canceled when it completes or claims it
+    if settings.task_cancel_propagation_enabled:
+        try:
+            await mark_canceled(task.id)
+        except Exception as e:
+            logger.warning(f"Task {task_id} cancel propagation error: {e}")
+
+    await cache_task(task)
+    await publish_task_event(task)
+
+    metrics_task_status_change_count.labels(task.status).inc()
     metrics_task_cancel_success_count.inc()
-    logger.info(f"Task {task_id} canceled.")
+    logger.info(f"Task {task_id} canceled.", extra={"task_id": task_id, "status": task.status})
     return task
+
+@router.post("/tasks/failed/replay", response_model=TaskReplayResponse)
+async def replay_failed(
+    limit: Optional[int] = Query(None, ge=1),
+    queue: Optional[str] = None,
+    task_type: Optional[str] = Query(None, alias="type"),
+):
+    # move dead-lettered tasks back to their queues with fresh attempts, in committed batches
+    try:
+        count = await replay_failed_tasks(settings.task_replay_batch_size, limit=limit, queue=queue, task_type=task_type)
+    except Exception as e:
+        logger.error(f"Task replay error: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Task replay error")
+
+    logger.info(f"Replayed {count} failed tasks.", extra={"count": count})
+    return {"replayed": count}
+
+async def current_task(task_id: str, db: AsyncSession) -> Optional[TaskResponse]:
+    # a terminal task never changes, anything else is read from the database,
+    # a stale cached status could miss the event that was published before subscribing
+    task = await get_cached_task(task_id)
+    if task and task.status in TERMINAL_STATUSES:
+        return task
+    task = await find_task(task_id, db)
+    return TaskResponse.model_validate(task) if task else None
+
+async def sse_events(task: TaskResponse, events: asyncio.Queue):
+    async for event in task_events(task, events):
+        if event is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"event: status\ndata: {event.model_dump_json()}\n\n"
+
+@router.get("/task/{task_id}/events")
+async def stream_task_events(task_id: str, db: AsyncSession = Depends(get_db)):
+    metrics_task_events_request_count.inc()
+
+    # subscribe before reading the current state, so no transition in between is lost
+    events = task_event_hub.subscribe(task_id)
+    try:
+        task = await current_task(task_id, db)
+    except Exception:
+        task_event_hub.unsubscribe(task_id, events)
+        raise
+    if not task:
+        task_event_hub.unsubscribe(task_id, events)
+        logger.error(f"Task {task_id} not found.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+
+    # the background task also runs when the client disconnects
+    return StreamingResponse(
+        sse_events(task, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(task_event_hub.unsubscribe, task_id, events),
+    )
+
+async def send_task_events(websocket: WebSocket, task: TaskResponse, events: asyncio.Queue):
+    async for event in task_events(task, events):
+        if event is not None:
+            await websocket.send_text(event.model_dump_json())
+
+async def wait_disconnect(websocket: WebSocket):
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+@router.websocket("/task/{task_id}/ws")
+async def task_events_websocket(websocket: WebSocket, task_id: str):
+    metrics_task_events_request_count.inc()
+    await websocket.accept()
+
+    events = task_event_hub.subscribe(task_id)
+    try:
+        async with async_session() as db:
+            task = await current_task(task_id, db)
+        if not task:
+            logger.error(f"Task {task_id} not found.")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Task not found")
+            return
+
+        # send until the task is done or the client goes away
+        sender = asyncio.create_task(send_task_events(websocket, task, events))
+        receiver = asyncio.create_task(wait_disconnect(websocket))
+        done, pending = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        if sender in done and sender.exception() is None:
+            await websocket.close()
+    finally:
+        task_event_hub.unsubscribe(task_id, events)
@@ -0,0 +1,29 @@
+import hashlib
+import json
+from app.queue.redis_client import redis
+from app.schemas import TaskCreate
+
+IDEMPOTENCY_KEY_PREFIX = "task_idempotency:"
+
+# kinds of dedup keys: sent by the client, or derived from the task content
+DEDUP_KIND_KEY = "key"
+DEDUP_KIND_CONTENT = "content"
+
+def idempotency_key(kind: str, key: str) -> str:
+    return f"{IDEMPOTENCY_KEY_PREFIX}{kind}:{key}"
+
+def content_key(task: TaskCreate) -> str:
+    # the same content, type and queue, schedules are left out as a delay differs on every retry
+    payload = json.dumps([task.type, task.queue, task.content])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def claim_key(kind: str, key: str, task_id: str, ttl: int) -> str:
+    # SET NX: the task id the key belongs to, task_id if it was free
+    if await redis.set(idempotency_key(kind, key), task_id, nx=True, ex=ttl):
+        return task_id
+    # expired in between, the database constraint still catches a duplicate key
+    return await redis.get(idempotency_key(kind, key)) or task_id
+
+async def release_key(kind: str, key: str):
+    # free the key of a failed submission so a retry can create the task
+    await redis.delete(idempotency_key(kind, key))
@@ -0,0 +1,47 @@
+import hashlib
+from typing import Tuple
+from app.queue.redis_client import redis
+
+RATE_LIMIT_KEY_PREFIX = "task_rate:"
+
+# refill and take tokens of one bucket in one atomic step, with the clock of redis so every API
+# instance agrees; KEYS[1] is the bucket, ARGV the rate per second, the burst and the cost.
+# a full bucket lets in a cost above the burst and the debt is paid back by the refill.
+# returns [allowed, seconds until the cost is available]
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= math.min(cost, burst) then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (math.min(cost, burst) - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+_token_bucket_script = None
+
+def rate_limit_key(client: str) -> str:
+    # api keys are hashed, so they are not readable from redis
+    return f"{RATE_LIMIT_KEY_PREFIX}{hashlib.sha256(client.encode()).hexdigest()[:32]}"
+
+async def take_tokens(client: str, rate: float, burst: int, cost: int = 1) -> Tuple[bool, float]:
+    # whether the client may submit cost tasks now, else the seconds until it may
+    global _token_bucket_script
+    if _token_bucket_script is None:
+        _token_bucket_script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    allowed, wait = await _token_bucket_script(keys=[rate_limit_key(client)], args=[rate, burst, cost])
+    return bool(allowed), float(wait)
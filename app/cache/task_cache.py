@@ -0,0 +1,152 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.queue.redis_client import redis
+from app.schemas import TASK_STATUS_COMPLETED, TASK_STATUS_CANCELED, TaskResponse
+from app.utils.logging import setup_logger
+from app.utils.metrics import (
+    metrics_task_cache_hit_count,
+    metrics_task_cache_miss_count,
+    metrics_task_cache_eviction_count
+)
+
+logger = setup_logger(__name__)
+
+CACHE_KEY_PREFIX = "task:"
+
+# a task in one of these statuses never changes again
+TERMINAL_STATUSES = [TASK_STATUS_COMPLETED, TASK_STATUS_CANCELED]
+
+class LocalCache:
+    # in-process LRU cache with a TTL per entry
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            metrics_task_cache_eviction_count.labels("expired").inc()
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value, ttl: float):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            metrics_task_cache_eviction_count.labels("size").inc()
+
+    def clear(self):
+        self.entries.clear()
+
+local_cache = LocalCache(settings.task_cache_local_size)
+
+def cache_key(task_id: str) -> str:
+    return f"{CACHE_KEY_PREFIX}{task_id}"
+
+def cache_ttl(status: str) -> int:
+    # terminal tasks can be kept much longer than in-flight ones
+    if status in TERMINAL_STATUSES:
+        return settings.task_cache_terminal_ttl
+    return settings.task_cache_ttl
+
+def local_cache_ttl(status: str) -> float:
+    # in-flight tasks change in other processes, keep them only briefly
+    if status in TERMINAL_STATUSES:
+        return settings.task_cache_terminal_ttl
+    return min(settings.task_cache_local_ttl, settings.task_cache_ttl)
+
+async def get_cached_task(task_id: str) -> Optional[TaskResponse]:
+    if not settings.task_cache_enabled:
+        return None
+
+    # first tier: in-process
+    key = cache_key(task_id)
+    task = local_cache.get(key)
+    if task:
+        metrics_task_cache_hit_count.labels("local").inc()
+        return task
+
+    # second tier: redis
+    try:
+        data = await redis.get(key)
+    except Exception as e:
+        logger.warning(f"Task {task_id} cache read error: {e}")
+        data = None
+    if not data:
+        metrics_task_cache_miss_count.inc()
+        return None
+
+    metrics_task_cache_hit_count.labels("redis").inc()
+    task = TaskResponse.model_validate_json(data)
+    local_cache.set(key, task, local_cache_ttl(task.status))
+    return task
+
+async def get_cached_tasks(task_ids: List[str]) -> Dict[str, TaskResponse]:
+    # the cached tasks among task_ids by id: the in-process tier, then one MGET per chunk of the rest
+    # in a single pipelined round trip
+    if not settings.task_cache_enabled or not task_ids:
+        return {}
+    tasks = {}
+    for task_id in task_ids:
+        task = local_cache.get(cache_key(task_id))
+        if task:
+            tasks[task_id] = task
+    if tasks:
+        metrics_task_cache_hit_count.labels("local").inc(len(tasks))
+
+    misses = [task_id for task_id in task_ids if task_id not in tasks]
+    if not misses:
+        return tasks
+    chunk_size = max(settings.task_status_chunk_size, 1)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for start in range(0, len(misses), chunk_size):
+                pipe.mget([cache_key(task_id) for task_id in misses[start:start + chunk_size]])
+            values = [value for chunk in await pipe.execute() for value in chunk]
+    except Exception as e:
+        logger.warning(f"Task cache read error: {e}")
+        values = [None] * len(misses)
+
+    hits = 0
+    for task_id, data in zip(misses, values):
+        if not data:
+            continue
+        task = TaskResponse.model_validate_json(data)
+        local_cache.set(cache_key(task_id), task, local_cache_ttl(task.status))
+        tasks[task_id] = task
+        hits += 1
+    if hits:
+        metrics_task_cache_hit_count.labels("redis").inc(hits)
+    if len(misses) > hits:
+        metrics_task_cache_miss_count.inc(len(misses) - hits)
+    return tasks
+
+async def cache_task(task):
+    await cache_tasks([task])
+
+async def cache_tasks(tasks: List):
+    if not settings.task_cache_enabled or not tasks:
+        return
+
+    # write through both tiers, redis with one pipelined round trip
+    try:
+        responses = [TaskResponse.model_validate(task) for task in tasks]
+        for response in responses:
+            local_cache.set(cache_key(response.id), response, local_cache_ttl(response.status))
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for response in responses:
+                pipe.set(cache_key(response.id), response.model_dump_json(), ex=cache_ttl(response.status))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Task cache write error: {e}")
@@ -0,0 +1,3 @@
+from app.consumer.worker import main
+
+main()
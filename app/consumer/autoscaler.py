@@ -0,0 +1,96 @@
+import asyncio
+import math
+import time
+from typing import Callable
+from app.core.config import settings
+from app.db.database import pool_saturation
+from app.queue.redis_queue import queue_backlog
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_consumer_scale_count
+
+logger = setup_logger(__name__)
+
+# workers scale down only once the backlog and the wait are below this share of their targets,
+# so a load right at the target does not flap between two sizes
+SCALE_DOWN_RATIO = 0.5
+
+# share of the workers released by one scale down
+SCALE_DOWN_STEP = 0.25
+
+class Autoscaler:
+    # target number of workers from the backlog of the queues: bursts scale up at once to the workers
+    # the backlog needs, lulls scale down a step at a time after a longer cooldown
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        target_backlog: int,
+        target_wait: float,
+        max_pool_saturation: float,
+        up_cooldown: float,
+        down_cooldown: float,
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers, min_workers)
+        self.target_backlog = target_backlog
+        self.target_wait = target_wait
+        self.max_pool_saturation = max_pool_saturation
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.changed_at = -math.inf
+
+    def decide(self, workers: int, depth: int, wait: float, saturation: float, now: float) -> int:
+        # depth is the share of ready tasks of this process, wait the age of the oldest one
+        target = workers
+        if workers < self.min_workers or workers > self.max_workers:
+            target = min(max(workers, self.min_workers), self.max_workers)
+        elif depth > workers * self.target_backlog or wait > self.target_wait:
+            # more workers would only wait for a database connection
+            if saturation >= self.max_pool_saturation or now - self.changed_at < self.up_cooldown:
+                return workers
+            target = min(max(workers + 1, math.ceil(depth / self.target_backlog)), self.max_workers)
+        elif depth <= workers * self.target_backlog * SCALE_DOWN_RATIO and wait <= self.target_wait * SCALE_DOWN_RATIO:
+            if now - self.changed_at < self.down_cooldown:
+                return workers
+            target = max(workers - max(math.floor(workers * SCALE_DOWN_STEP), 1), self.min_workers)
+
+        if target != workers:
+            self.changed_at = now
+        return target
+
+async def run_autoscaler(stopped: asyncio.Event, workers: Callable[[], int], scale: Callable[[int], None]):
+    # workers gives the running workers of this process and scale sets their target
+    logger.info("Autoscaler started.")
+    autoscaler = Autoscaler(
+        settings.task_autoscale_min_workers,
+        settings.task_autoscale_max_workers,
+        settings.task_autoscale_target_backlog,
+        settings.task_autoscale_target_wait,
+        settings.task_autoscale_max_pool_saturation,
+        settings.task_autoscale_up_cooldown,
+        settings.task_autoscale_down_cooldown,
+    )
+    while not stopped.is_set():
+        try:
+            depth, oldest = await queue_backlog()
+        except Exception as e:
+            logger.error(f"Autoscaler backlog error: {e}")
+        else:
+            # every consumer process sees the whole backlog and takes its share of it
+            depth = math.ceil(depth / max(settings.task_consumer_processes, 1))
+            wait = max(time.time() - oldest, 0) if oldest else 0.0
+            saturation = pool_saturation()
+            current = workers()
+            target = autoscaler.decide(current, depth, wait, saturation, time.monotonic())
+            if target != current:
+                metrics_consumer_scale_count.labels("up" if target > current else "down").inc()
+                logger.info(
+                    f"Scaling consumer workers from {current} to {target}, "
+                    f"backlog {depth}, wait {wait:.3f}s, pool saturation {saturation:.2f}."
+                )
+                scale(target)
+        try:
+            await asyncio.wait_for(stopped.wait(), settings.task_autoscale_interval)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Autoscaler stopped.")
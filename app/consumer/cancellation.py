@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Dict, Set
+from app.consumer.handlers import HANDLER_MODE_ASYNC, handlers
+from app.queue.cancel_set import TASK_CANCEL_CHANNEL
+from app.queue.redis_client import redis
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_cancel_running_count, metrics_task_cancel_reclaimed_seconds
+
+logger = setup_logger(__name__)
+
+# weight of the latest handler duration in the running average per task type
+DURATION_SMOOTHING = 0.1
+
+class TaskCanceled(Exception):
+    pass
+
+class RunningTasks:
+    # handler runs of this process by task id, so a cancel can stop the one holding the task.
+    # only an async handler is interrupted; a cancel stops awaiting a thread or process handler and
+    # frees its worker, but the handler keeps its pool thread or process until it returns
+    def __init__(self, recent_size: int):
+        self.runs: Dict[str, asyncio.Task] = {}
+        self.canceled: Set[str] = set()
+        # cancels of tasks not running here yet, a task claimed right after its cancel is stopped at start
+        self.recent: OrderedDict = OrderedDict()
+        self.recent_size = recent_size
+        # running average of handler durations per task type, to estimate the time a cancel frees
+        self.durations: Dict[str, float] = {}
+
+    def observe(self, task_type: str, duration: float):
+        average = self.durations.get(task_type)
+        self.durations[task_type] = duration if average is None else average + DURATION_SMOOTHING * (duration - average)
+
+    def cancel(self, task_id: str):
+        run = self.runs.get(task_id)
+        if run is None:
+            self.recent[task_id] = None
+            self.recent.move_to_end(task_id)
+            while len(self.recent) > self.recent_size:
+                self.recent.popitem(last=False)
+            return
+        self.canceled.add(task_id)
+        run.cancel()
+
+    async def run(self, task, handler: Awaitable):
+        if task.id in self.recent:
+            del self.recent[task.id]
+            handler.close()
+            raise TaskCanceled(f"Task {task.id} canceled")
+
+        run = asyncio.ensure_future(handler)
+        self.runs[task.id] = run
+        start = time.monotonic()
+        try:
+            result = await run
+        except asyncio.CancelledError:
+            # canceled through the api, a shutdown of the worker is not in canceled
+            if task.id not in self.canceled:
+                raise
+            elapsed = time.monotonic() - start
+            # a pool handler still runs to completion, so no time is reclaimed from the pool
+            handler = handlers.get(task.type)
+            if handler and handler.mode != HANDLER_MODE_ASYNC:
+                reclaimed = 0.0
+            else:
+                reclaimed = max(self.durations.get(task.type, 0.0) - elapsed, 0.0)
+            metrics_task_cancel_running_count.inc()
+            metrics_task_cancel_reclaimed_seconds.inc(reclaimed)
+            raise TaskCanceled(f"Task {task.id} canceled after {elapsed:.3f}s, about {reclaimed:.3f}s reclaimed")
+        finally:
+            self.runs.pop(task.id, None)
+            self.canceled.discard(task.id)
+
+        self.observe(task.type, time.monotonic() - start)
+        return result
+
+running_tasks = RunningTasks(10000)
+
+async def run_cancel_listener(stopped: asyncio.Event):
+    # every consumer process listens, only the one running the task has something to stop
+    logger.info("Cancel listener started.")
+    while not stopped.is_set():
+        try:
+            async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(TASK_CANCEL_CHANNEL)
+                while not stopped.is_set():
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        running_tasks.cancel(message["data"])
+        except Exception as e:
+            logger.error(f"Cancel listener error: {e}")
+            try:
+                await asyncio.wait_for(stopped.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+    logger.info("Cancel listener stopped.")
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, NamedTuple
+from app.core.config import settings
+from app.schemas import TASK_TYPE_DEFAULT
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_handler_duration
+from app.utils.profiling import task_profiler
+from app.utils.tracing import start_span
+
+logger = setup_logger(__name__)
+
+# handler modes
+HANDLER_MODE_ASYNC = "async"      # coroutine run on the event loop, for I/O-bound work
+HANDLER_MODE_THREAD = "thread"    # function run in the thread pool, for blocking I/O
+HANDLER_MODE_PROCESS = "process"  # function run in the process pool, for CPU-bound work
+
+class TaskHandler(NamedTuple):
+    func: Callable
+    mode: str
+
+# registered handlers, keyed by task type
+handlers: Dict[str, TaskHandler] = {}
+
+thread_pool: ThreadPoolExecutor = None
+process_pool: ProcessPoolExecutor = None
+
+def register_handler(task_type: str, mode: str = HANDLER_MODE_ASYNC):
+    # process handlers are pickled by name, so they must be module-level functions
+    def decorator(func: Callable) -> Callable:
+        if mode not in (HANDLER_MODE_ASYNC, HANDLER_MODE_THREAD, HANDLER_MODE_PROCESS):
+            raise ValueError(f"Unknown handler mode {mode}")
+        handlers[task_type] = TaskHandler(func, mode)
+        return func
+    return decorator
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = ThreadPoolExecutor(
+            max_workers=settings.task_thread_pool_size, thread_name_prefix="task-handler"
+        )
+    return thread_pool
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global process_pool
+    if process_pool is None:
+        # recycle worker processes to bound memory growth of long-running handlers, python 3.11+
+        kwargs = {}
+        if settings.task_process_max_tasks_per_child:
+            if sys.version_info >= (3, 11):
+                kwargs["max_tasks_per_child"] = settings.task_process_max_tasks_per_child
+            else:
+                logger.warning("max_tasks_per_child requires python 3.11, process pool workers are not recycled.")
+        process_pool = ProcessPoolExecutor(max_workers=settings.task_process_pool_size or None, **kwargs)
+    return process_pool
+
+def shutdown_pools():
+    global thread_pool, process_pool
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=False, cancel_futures=True)
+        thread_pool = None
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        process_pool = None
+
+async def run_handler(task):
+    handler = handlers.get(task.type)
+    if not handler:
+        raise ValueError(f"No handler for task type {task.type}")
+
+    with start_span("task.handler", type=task.type, mode=handler.mode), metrics_task_handler_duration.labels(task.type).time():
+        async with task_profiler.profile(task):
+            if handler.mode == HANDLER_MODE_ASYNC:
+                return await handler.func(task.content)
+
+            pool = get_thread_pool() if handler.mode == HANDLER_MODE_THREAD else get_process_pool()
+            return await asyncio.get_running_loop().run_in_executor(pool, handler.func, task.content)
+
+@register_handler(TASK_TYPE_DEFAULT)
+async def sleep_handler(content: str):
+    # simulate task processing
+    await asyncio.sleep(3)
+
+@register_handler("hash", mode=HANDLER_MODE_PROCESS)
+def hash_handler(content: str) -> str:
+    # CPU-bound example, about 3 seconds of repeated hashing
+    digest = content.encode()
+    deadline = time.monotonic() + 3
+    while time.monotonic() < deadline:
+        for _ in range(10000):
+            digest = hashlib.sha256(digest).digest()
+    return digest.hex()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from app.consumer.cancellation import running_tasks
+from app.consumer.retry import fail_task
+from app.core.config import settings
+from app.db.models import Task
+from app.db.models import async_session
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_lease_expired_count, metrics_db_commit_duration
+
+logger = setup_logger(__name__)
+
+async def renew_leases() -> int:
+    # one update for every task this process is running, a task not renewed in time is taken as lost
+    task_ids = list(running_tasks.runs)
+    if not task_ids:
+        return 0
+    async with async_session() as db:
+        try:
+            count = await Task.renew_leases(task_ids, db)
+            with metrics_db_commit_duration.labels("lease").time():
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Tasks {task_ids} lease renew error: {e}")
+            return 0
+    return count
+
+async def reap_expired_leases() -> int:
+    # a processing task whose lease expired counts as a failed attempt, retried or dead-lettered;
+    # concurrent reapers race on the same compare-and-set, only one moves each task
+    async with async_session() as db:
+        try:
+            tasks = await Task.expired_leases(datetime.now(timezone.utc), settings.task_lease_reaper_batch_size, db)
+        except Exception as e:
+            logger.error(f"Expired lease read error: {e}")
+            return 0
+
+        # a rollback in fail_task expires the loaded rows, keep what is needed
+        expired = [(task.id, task.queue, task.failed_attempts) for task in tasks]
+        count = 0
+        for task_id, queue, failed_attempts in expired:
+            if await fail_task(task_id, queue, failed_attempts, "Lease expired", db):
+                count += 1
+    if count:
+        metrics_task_lease_expired_count.inc(count)
+        logger.warning(f"Requeued {count} tasks with an expired lease.")
+    return count
+
+async def run_lease_keeper(stopped: asyncio.Event):
+    # every consumer process renews its own leases several times per lease and reaps expired ones
+    logger.info("Lease keeper started.")
+    renew_interval = settings.task_lease_seconds / 3
+    reap_at = 0.0
+    while not stopped.is_set():
+        await renew_leases()
+        if time.monotonic() >= reap_at:
+            reap_at = time.monotonic() + settings.task_lease_reaper_interval
+            await reap_expired_leases()
+        try:
+            await asyncio.wait_for(stopped.wait(), min(renew_interval, settings.task_lease_reaper_interval))
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Lease keeper stopped.")
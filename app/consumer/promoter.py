@@ -0,0 +1,66 @@
+import asyncio
+import time
+from app.cache.task_cache import cache_tasks
+from app.core.config import settings
+from app.db.models import Task
+from app.db.models import async_session
+from app.events.task_events import publish_task_events
+from app.queue.delay_queue import due_tasks, promote_tasks
+from app.schemas import TASK_STATUS_PENDING
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_status_change_count, metrics_task_schedule_lag, metrics_db_commit_duration
+
+logger = setup_logger(__name__)
+
+async def promote_queue(queue: str) -> int:
+    # promote due tasks in batches until the queue has nothing due
+    promoted_count = 0
+    while True:
+        due = await due_tasks(queue, settings.task_schedule_batch_size)
+        if not due:
+            return promoted_count
+        due_times = dict(due)
+        task_ids = list(due_times)
+
+        # only a pending task can be claimed, so tasks are marked pending before they reach the ready
+        # queue; a failed update leaves them in the set for the next poll
+        async with async_session() as db:
+            try:
+                tasks = await Task.transition_many(task_ids, TASK_STATUS_PENDING, db)
+                with metrics_db_commit_duration.labels("promote").time():
+                    await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Tasks {task_ids} promote status error: {e}")
+                return promoted_count
+
+        # tasks already pending are pushed too, their earlier push failed; canceled ones are skipped by
+        # the consumer as their claim fails
+        promoted = await promote_tasks(task_ids, queue)
+        promoted_count += len(promoted)
+
+        now = time.time()
+        for task_id in promoted:
+            metrics_task_schedule_lag.observe(max(now - due_times[task_id], 0))
+
+        await cache_tasks(tasks)
+        await publish_task_events(tasks)
+        metrics_task_status_change_count.labels(TASK_STATUS_PENDING).inc(len(tasks))
+
+        if len(due) < settings.task_schedule_batch_size:
+            return promoted_count
+
+async def run_promoter(stopped: asyncio.Event):
+    # every consumer process runs one promoter, the promote script keeps them from moving a task twice
+    logger.info("Promoter started.")
+    while not stopped.is_set():
+        for queue in settings.task_queues:
+            try:
+                await promote_queue(queue)
+            except Exception as e:
+                logger.error(f"promote {queue} queue error: {e}")
+        try:
+            await asyncio.wait_for(stopped.wait(), settings.task_schedule_poll_interval)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Promoter stopped.")
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from typing import Dict, List
+from app.core.config import settings
+from app.db.models import TaskOutbox
+from app.db.models import async_session
+from app.queue.delay_queue import schedule_tasks
+from app.queue.redis_queue import enqueue_tasks
+from app.utils.logging import setup_logger
+from app.utils.metrics import (
+    metrics_task_outbox_relay_count,
+    metrics_task_outbox_relay_fail_count,
+    metrics_task_outbox_relay_lag,
+    metrics_db_commit_duration
+)
+
+logger = setup_logger(__name__)
+
+# set after a create commits in this process, so an embedded relay does not wait for its next poll
+outbox_written: asyncio.Event = None
+
+def notify_relay():
+    if outbox_written:
+        outbox_written.set()
+
+async def relay_batch() -> int:
+    # push one batch of outbox rows to their queues and delete them in the transaction holding their
+    # locks; a failed push or commit leaves the rows for the next run, a task pushed twice is only
+    # claimed once
+    async with async_session() as db:
+        try:
+            entries = await TaskOutbox.lock_batch(settings.task_outbox_batch_size, db)
+            if not entries:
+                await db.rollback()
+                return 0
+
+            queue_entries: Dict[str, List[TaskOutbox]] = {}
+            queue_due_times: Dict[str, Dict[str, float]] = {}
+            for entry in entries:
+                if entry.run_at:
+                    queue_due_times.setdefault(entry.queue, {})[entry.task_id] = entry.run_at.timestamp()
+                else:
+                    queue_entries.setdefault(entry.queue, []).append(entry)
+
+            # one push per queue, scheduled tasks to the scheduled sets
+            for queue, ready in queue_entries.items():
+                await enqueue_tasks([entry.task_id for entry in ready], queue, [entry.trace for entry in ready])
+            for queue, due_times in queue_due_times.items():
+                await schedule_tasks(due_times, queue)
+
+            created_at = [entry.created_at for entry in entries]
+            await TaskOutbox.delete_many([entry.id for entry in entries], db)
+            with metrics_db_commit_duration.labels("relay").time():
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            metrics_task_outbox_relay_fail_count.inc()
+            logger.error(f"Task outbox relay error: {e}")
+            return 0
+
+    now = time.time()
+    for created in created_at:
+        if created:
+            metrics_task_outbox_relay_lag.observe(max(now - created.timestamp(), 0))
+    metrics_task_outbox_relay_count.inc(len(entries))
+    return len(entries)
+
+async def wait_written(stopped: asyncio.Event, timeout: float):
+    # until a local create commits, the relay is stopped or the poll interval passes
+    written = asyncio.ensure_future(outbox_written.wait())
+    stop = asyncio.ensure_future(stopped.wait())
+    try:
+        await asyncio.wait([written, stop], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        written.cancel()
+        stop.cancel()
+
+async def run_outbox_relay(stopped: asyncio.Event):
+    # every consumer process runs one relay, locked rows keep them from pushing the same batch together
+    global outbox_written
+    outbox_written = asyncio.Event()
+    logger.info("Outbox relay started.")
+    while not stopped.is_set():
+        outbox_written.clear()
+        count = await relay_batch()
+        # a full batch means more are waiting
+        if count < settings.task_outbox_batch_size:
+            await wait_written(stopped, settings.task_outbox_poll_interval)
+    logger.info("Outbox relay stopped.")
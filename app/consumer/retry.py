@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache.task_cache import cache_task, cache_tasks
+from app.consumer.relay import notify_relay
+from app.core.config import settings
+from app.db.database import init_db, close_db
+from app.db.models import Task, TaskOutbox
+from app.db.models import async_session
+from app.events.task_events import publish_task_event, publish_task_events
+from app.schemas import TASK_STATUS_SCHEDULED, TASK_STATUS_PENDING, TASK_STATUS_FAILED
+from app.utils.logging import setup_logger
+from app.utils.tracing import current_traceparent
+from app.utils.metrics import (
+    metrics_task_status_change_count,
+    metrics_task_retry_count,
+    metrics_task_dead_letter_count,
+    metrics_task_replay_count,
+    metrics_db_commit_duration
+)
+
+logger = setup_logger(__name__)
+
+# longest error message kept on a task
+LAST_ERROR_MAX_LENGTH = 1000
+
+def backoff_delay(failed_attempts: int) -> float:
+    # exponential backoff with full jitter, so tasks failing together do not retry together
+    ceiling = min(settings.task_retry_backoff_base * 2 ** (failed_attempts - 1), settings.task_retry_backoff_max)
+    return random.uniform(0, ceiling)
+
+async def fail_task(task_id: str, queue: str, failed_attempts: int, error: str, db: AsyncSession) -> Optional[Task]:
+    # a failed attempt waits for its retry in the scheduled set, so no worker is held during the
+    # backoff; after the last one the task is dead-lettered as failed. failed_attempts is the count
+    # before this one, errors are only logged as the lease reaper tries again later.
+    # the retry reaches the scheduled set through the outbox, committed with its status
+    failed_attempts += 1
+    values = {"failed_attempts": failed_attempts, "last_error": error[:LAST_ERROR_MAX_LENGTH]}
+    if failed_attempts < settings.task_max_attempts:
+        to_status = TASK_STATUS_SCHEDULED
+        values["run_at"] = datetime.now(timezone.utc) + timedelta(seconds=backoff_delay(failed_attempts))
+    else:
+        to_status = TASK_STATUS_FAILED
+
+    try:
+        task = await Task.transition(task_id, to_status, db, values=values)
+        if task and task.status == TASK_STATUS_SCHEDULED:
+            db.add(TaskOutbox(task.id, queue, run_at=task.run_at, trace=current_traceparent()))
+        with metrics_db_commit_duration.labels("retry").time():
+            await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Task {task_id} retry error: {e}")
+        return None
+
+    # it was canceled or already handled by someone else
+    if not task:
+        return None
+
+    if task.status == TASK_STATUS_SCHEDULED:
+        notify_relay()
+        metrics_task_retry_count.inc()
+        logger.warning(
+            f"Task {task_id} retry {failed_attempts} of {settings.task_max_attempts - 1} at {task.run_at.isoformat()}.",
+            extra={"task_id": task_id, "status": task.status}
+        )
+    else:
+        metrics_task_dead_letter_count.inc()
+        logger.error(
+            f"Task {task_id} failed after {failed_attempts} attempts.",
+            extra={"task_id": task_id, "status": task.status}
+        )
+
+    await cache_task(task)
+    await publish_task_event(task)
+    metrics_task_status_change_count.labels(task.status).inc()
+    return task
+
+async def replay_batch(batch_size: int, queue: str = None, task_type: str = None) -> int:
+    # move one batch of dead-lettered tasks back to their queues, through the outbox like a create
+    async with async_session() as db:
+        try:
+            tasks = await Task.replay_failed(batch_size, db, queue=queue, task_type=task_type)
+            if tasks:
+                await TaskOutbox.add_many(tasks, current_traceparent(), db)
+            with metrics_db_commit_duration.labels("replay").time():
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Task replay error: {e}")
+            raise e
+    if not tasks:
+        return 0
+
+    notify_relay()
+    await cache_tasks(tasks)
+    await publish_task_events(tasks)
+    metrics_task_status_change_count.labels(TASK_STATUS_PENDING).inc(len(tasks))
+    metrics_task_replay_count.inc(len(tasks))
+    return len(tasks)
+
+async def replay_failed_tasks(batch_size: int, limit: int = None, queue: str = None, task_type: str = None) -> int:
+    # replay in committed batches until nothing is left or limit tasks are replayed
+    total = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        count = await replay_batch(size, queue=queue, task_type=task_type)
+        total += count
+        if count < size:
+            break
+    logger.info(f"Replayed {total} failed tasks.")
+    return total
+
+async def run_once(batch_size: int, limit: int, queue: str, task_type: str):
+    await init_db()
+    try:
+        await replay_failed_tasks(batch_size, limit=limit, queue=queue, task_type=task_type)
+    finally:
+        await close_db()
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.consumer.retry", description="Replay dead-lettered tasks.")
+    parser.add_argument("--batch-size", type=int, default=settings.task_replay_batch_size, help="number of tasks replayed per statement")
+    parser.add_argument("--limit", type=int, default=None, help="replay at most this many tasks, all by default")
+    parser.add_argument("--queue", default=None, help="only replay tasks of this queue")
+    parser.add_argument("--type", dest="task_type", default=None, help="only replay tasks of this type")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run_once(args.batch_size, args.limit, args.queue, args.task_type))
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,437 @@
 import asyncio
+import time
+from typing import Awaitable, Callable, List, Set
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache.task_cache import cache_task, cache_tasks
+from app.consumer.autoscaler import run_autoscaler
+from app.consumer.cancellation import TaskCanceled, running_tasks, run_cancel_listener
+from app.consumer.handlers import run_handler, shutdown_pools
+from app.consumer.lease import run_lease_keeper
+from app.consumer.promoter import run_promoter
+from app.consumer.relay import run_outbox_relay
+from app.consumer.retry import fail_task
+from app.db.archiver import run_archiver
 from app.db.models import Task
 from app.db.models import async_session
-from app.queue.redis_queue import dequeue_task
+from app.events.task_events import publish_task_event, publish_task_events
+from app.queue.cancel_set import canceled_task_ids
+from app.queue.message import QueueMessage
+from app.queue.redis_queue import enqueue_tasks, dequeue_tasks, dequeue_messages, ack_tasks
+from app.schemas import TASK_STATUS_PROCESSING, TASK_STATUS_COMPLETED
 from app.utils.logging import setup_logger
+from app.utils.tracing import start_span, set_span_attribute
 from app.core.config import settings
 from app.utils.metrics import (
-    metrics_task_status,
-    metrics_task_processing_duration,
+    metrics_task_status_change_count,
+    metrics_task_claim_duration,
+    metrics_task_total_duration,
+    metrics_db_commit_duration,
     metrics_task_processing_success_count,
-    metrics_task_processing_fail_count
+    metrics_task_processing_fail_count,
+    metrics_task_cancel_skipped_count,
+    metrics_consumer_workers,
+    metrics_consumer_workers_target,
+    metrics_consumer_in_flight,
+    metrics_consumer_buffer_depth,
+    metrics_consumer_slot_utilization
 )
 
-# metrics
+# consumer modes
+CONSUMER_MODE_SINGLE = "single"
+CONSUMER_MODE_BATCH = "batch"
+CONSUMER_MODE_PREFETCH = "prefetch"
+
+# running workers of this process, they stop taking new tasks once stopping is set
+consumer_tasks: List[asyncio.Task] = []
+stopping = False
+
+# workers the autoscaler asked to leave, the next ones to poll the queue go
+retiring = 0
+
+# background jobs of this process: outbox relay of created tasks, promoter of scheduled tasks, archiver
+# of old tasks, cancel listener, lease keeper of running tasks, autoscaler of the workers
+background_tasks: List[asyncio.Task] = []
+background_stopped: asyncio.Event = None
+
+# in-flight tasks and slots of all prefetch workers of this process
+in_flight_count = 0
+slot_count = 0
 
 logger = setup_logger(__name__)
 
+def observe_completed(tasks: List):
+    # submit to complete, including queue wait, claim, handler and commits
+    now = time.time()
+    for task in tasks:
+        if task.created_at:
+            metrics_task_total_duration.labels(task.queue).observe(max(now - task.created_at.timestamp(), 0))
+
+def task_error(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
 async def process_task(task_id: str, db: AsyncSession):
-    # fetch task
-    task = await Task.get(task_id, db)
+    # claim task, only a pending task moves to processing
+    try:
+        with start_span("task.claim"), metrics_task_claim_duration.time():
+            task = await Task.transition(task_id, TASK_STATUS_PROCESSING, db)
+            with metrics_db_commit_duration.labels("claim").time():
+                await db.commit()
+    except Exception as e:
+        await db.rollback()
+        metrics_task_processing_fail_count.inc()
+        logger.error(f"Task {task_id} processing error: {e}")
+        return
+
+    if not task:
+        logger.warning(f"Task {task_id} not found or already processed or canceled.")
+        return
+    await cache_task(task)
+    await publish_task_event(task)
+    metrics_task_status_change_count.labels(task.status).inc()
+
+    # process task, a failed attempt is retried or dead-lettered
+    queue, failed_attempts = task.queue, task.failed_attempts
+    try:
+        logger.info(f"Task {task_id} processing...", extra={"task_id": task_id, "status": task.status})
+        start = time.monotonic()
+        await running_tasks.run(task, run_handler(task))
+
+        # complete task, unless it was canceled in the meantime
+        with start_span("task.complete"):
+            task = await Task.transition(task_id, TASK_STATUS_COMPLETED, db)
+            with metrics_db_commit_duration.labels("complete").time():
+                await db.commit()
+    except TaskCanceled:
+        logger.warning(f"Task {task_id} canceled during processing.")
+        return
+    except Exception as e:
+        await db.rollback()
+        metrics_task_processing_fail_count.inc()
+        logger.error(f"Task {task_id} processing error: {e}")
+        await fail_task(task_id, queue, failed_attempts, task_error(e), db)
+        return
 
-    # check task status
     if not task:
-        logger.warning(f"Task {task_id} not found.")
+        logger.warning(f"Task {task_id} canceled during processing.")
         return
-    if task.status != "pending":
-        logger.warning(f"Task {task_id} already processed or canceled.")
+    await cache_task(task)
+    await publish_task_event(task)
+    metrics_task_status_change_count.labels(task.status).inc()
+    metrics_task_processing_success_count.inc()
+    observe_completed([task])
+    logger.info(
+        f"Task {task_id} completed.",
+        extra={"task_id": task_id, "status": task.status, "duration": round(time.monotonic() - start, 6)}
+    )
+
+async def process_tasks(task_ids: List[str], db: AsyncSession):
+    # claim pending tasks with one update
+    try:
+        with start_span("task.claim", count=len(task_ids)), metrics_task_claim_duration.time():
+            tasks = await Task.transition_many(task_ids, TASK_STATUS_PROCESSING, db)
+            with metrics_db_commit_duration.labels("claim").time():
+                await db.commit()
+    except Exception as e:
+        await db.rollback()
+        metrics_task_processing_fail_count.inc(len(task_ids))
+        logger.error(f"Tasks {task_ids} claim error: {e}")
         return
-    
-    # process task
-    with metrics_task_processing_duration.time():
+
+    skipped_ids = set(task_ids) - {task.id for task in tasks}
+    if skipped_ids:
+        logger.warning(f"Tasks {sorted(skipped_ids)} not found or already processed or canceled.")
+    if not tasks:
+        return
+    await cache_tasks(tasks)
+    await publish_task_events(tasks)
+    metrics_task_status_change_count.labels(TASK_STATUS_PROCESSING).inc(len(tasks))
+    logger.info(f"Tasks {[task.id for task in tasks]} processing...")
+
+    # process claimed tasks concurrently
+    results = await asyncio.gather(*(running_tasks.run(task, run_handler(task)) for task in tasks), return_exceptions=True)
+    completed_ids = []
+    for task, result in zip(tasks, results):
+        if isinstance(result, TaskCanceled):
+            logger.warning(f"Task {task.id} canceled during processing.")
+        elif isinstance(result, Exception):
+            metrics_task_processing_fail_count.inc()
+            logger.error(f"Task {task.id} processing error: {result}")
+            await fail_task(task.id, task.queue, task.failed_attempts, task_error(result), db)
+        else:
+            completed_ids.append(task.id)
+    if not completed_ids:
+        return
+
+    # write completions back with one update
+    try:
+        with start_span("task.complete", count=len(completed_ids)):
+            completed_tasks = await Task.transition_many(completed_ids, TASK_STATUS_COMPLETED, db)
+            with metrics_db_commit_duration.labels("complete").time():
+                await db.commit()
+    except Exception as e:
+        await db.rollback()
+        metrics_task_processing_fail_count.inc(len(completed_ids))
+        logger.error(f"Tasks {completed_ids} complete error: {e}")
+        return
+
+    await cache_tasks(completed_tasks)
+    await publish_task_events(completed_tasks)
+    metrics_task_status_change_count.labels(TASK_STATUS_COMPLETED).inc(len(completed_tasks))
+    metrics_task_processing_success_count.inc(len(completed_tasks))
+    observe_completed(completed_tasks)
+    logger.info(f"Tasks {[task.id for task in completed_tasks]} completed.")
+
+async def ack_processed(task_ids: List[str]):
+    # a failed ack only means the task is delivered again and skipped by its status
+    try:
+        await ack_tasks(task_ids)
+    except Exception as e:
+        logger.error(f"ack task error: {e}")
+
+async def skip_canceled(task_ids: List[str]) -> Set[str]:
+    # tasks canceled while queued are acked without a claim, saving a database round trip each
+    if not settings.task_cancel_propagation_enabled or not task_ids:
+        return set()
+    try:
+        skipped_ids = await canceled_task_ids(task_ids)
+    except Exception as e:
+        # the claim still skips them by status
+        logger.error(f"get canceled tasks error: {e}")
+        return set()
+
+    if skipped_ids:
+        metrics_task_cancel_skipped_count.inc(len(skipped_ids))
+        logger.info(f"Skipped canceled tasks {sorted(skipped_ids)}.")
+        await ack_processed(list(skipped_ids))
+    return skipped_ids
+
+async def requeue_tasks(messages: List[QueueMessage]):
+    # put tasks back to the queue they came from
+    queue_task_ids = {}
+    for message in messages:
+        queue_task_ids.setdefault(message.queue, []).append(message.task_id)
+
+    for queue, task_ids in queue_task_ids.items():
         try:
-            logger.info(f"Task {task_id} processing...")
-            task.status = "processing"
-            await db.commit()
-            metrics_task_status.labels(task.status).inc()
-
-            await asyncio.sleep(3)
-
-            task.status = "completed"
-            await db.commit()
-            metrics_task_status.labels(task.status).inc()
-            metrics_task_processing_success_count.inc()
-            logger.info(f"Task {task_id} completed.")
+            await enqueue_tasks(task_ids, queue)
+            await ack_tasks(task_ids)
+            logger.info(f"Requeued {len(task_ids)} prefetched tasks to {queue} queue.")
         except Exception as e:
-            await db.rollback()
-            metrics_task_processing_fail_count.inc()
-            logger.error(f"Task {task_id} processing error: {e}")
+            logger.error(f"Tasks {task_ids} requeue error: {e}")
+
+async def process_message(message: QueueMessage):
+    # the processing span continues the trace of the request that enqueued the task
+    with start_span("task.process", traceparent=message.trace, task_id=message.task_id, queue=message.queue):
+        if message.enqueued_at:
+            set_span_attribute("queue_wait", round(max(time.time() - message.enqueued_at, 0), 6))
+        async with async_session() as db:
+            await process_task(message.task_id, db)
+    await ack_processed([message.task_id])
+
+def retire() -> bool:
+    global retiring
+    if retiring > 0:
+        retiring -= 1
+        return True
+    return False
 
 async def run_consumer():
-    while True:
+    while not stopping and not retire():
         try:
-            task_id = await dequeue_task()
+            messages = await dequeue_messages(1, settings.queue_pop_timeout)
         except Exception as e:
             logger.error(f"get task error: {e}")
         else:
-            if task_id:
-                async with async_session() as db:
-                    await process_task(task_id, db)
-            else:
-                await asyncio.sleep(1)
-
-def start_consumer():
-    for _ in range(settings.task_consumer_workers):
-        asyncio.create_task(run_consumer())
+            skipped_ids = await skip_canceled([message.task_id for message in messages])
+            for message in messages:
+                if message.task_id not in skipped_ids:
+                    await process_message(message)
+
+async def run_batch_consumer():
+    while not stopping and not retire():
+        try:
+            task_ids = await dequeue_tasks(settings.task_consumer_batch_size, settings.task_consumer_batch_max_wait)
+        except Exception as e:
+            logger.error(f"get tasks error: {e}")
+            await asyncio.sleep(1)
+        else:
+            skipped_ids = await skip_canceled(task_ids)
+            task_ids = [task_id for task_id in task_ids if task_id not in skipped_ids]
+            if task_ids:
+                with start_span("task.process_batch", count=len(task_ids)):
+                    async with async_session() as db:
+                        await process_tasks(task_ids, db)
+                await ack_processed(task_ids)
+
+def update_slot_metrics():
+    metrics_consumer_in_flight.set(in_flight_count)
+    metrics_consumer_slot_utilization.set(in_flight_count / slot_count if slot_count else 0)
+
+async def prefetch_tasks(buffer: asyncio.Queue, space: asyncio.Event):
+    while not stopping and not retire():
+        # only fetch what the buffer can hold, a full buffer leaves tasks to other consumers
+        free = buffer.maxsize - buffer.qsize()
+        if free <= 0:
+            space.clear()
+            await space.wait()
+            continue
+
+        try:
+            messages = await dequeue_messages(free, settings.queue_pop_timeout)
+        except Exception as e:
+            logger.error(f"get tasks error: {e}")
+            await asyncio.sleep(1)
+            continue
+
+        skipped_ids = await skip_canceled([message.task_id for message in messages])
+        for message in messages:
+            if message.task_id in skipped_ids:
+                continue
+            buffer.put_nowait(message)
+            metrics_consumer_buffer_depth.inc()
+
+    # tell the executor no more tasks are coming
+    await buffer.put(None)
+
+async def process_prefetched_task(message: QueueMessage, slots: asyncio.Semaphore):
+    global in_flight_count
+    in_flight_count += 1
+    update_slot_metrics()
+    try:
+        await process_message(message)
+    finally:
+        in_flight_count -= 1
+        update_slot_metrics()
+        slots.release()
+
+async def run_prefetch_consumer():
+    global slot_count
+    buffer = asyncio.Queue(maxsize=settings.task_consumer_prefetch_size)
+    space = asyncio.Event()
+    slots = asyncio.Semaphore(settings.task_consumer_max_in_flight)
+    in_flight = set()
+
+    slot_count += settings.task_consumer_max_in_flight
+    update_slot_metrics()
+    fetcher = asyncio.create_task(prefetch_tasks(buffer, space))
+    try:
+        while True:
+            # take a task from the buffer only once a slot is free
+            await slots.acquire()
+            message = await buffer.get()
+            space.set()
+            if message is None:
+                slots.release()
+                break
+            metrics_consumer_buffer_depth.dec()
+
+            run = asyncio.create_task(process_prefetched_task(message, slots))
+            in_flight.add(run)
+            run.add_done_callback(in_flight.discard)
+
+        # drain tasks still running
+        await asyncio.gather(*in_flight)
+    finally:
+        fetcher.cancel()
+        for run in in_flight:
+            run.cancel()
+        slot_count -= settings.task_consumer_max_in_flight
+        update_slot_metrics()
+
+        # hand back tasks prefetched but never started, e.g. after the drain timeout
+        messages = []
+        while not buffer.empty():
+            message = buffer.get_nowait()
+            if message:
+                messages.append(message)
+        if messages:
+            metrics_consumer_buffer_depth.dec(len(messages))
+            await requeue_tasks(messages)
+
+def consumer_worker() -> Callable[[], Awaitable]:
+    if settings.task_consumer_mode == CONSUMER_MODE_BATCH:
+        return run_batch_consumer
+    if settings.task_consumer_mode == CONSUMER_MODE_PREFETCH:
+        return run_prefetch_consumer
+    return run_consumer
+
+def worker_done(task: asyncio.Task):
+    # a retired worker leaves the running ones
+    if task in consumer_tasks:
+        consumer_tasks.remove(task)
+    metrics_consumer_workers.set(len(consumer_tasks))
+
+def add_workers(count: int):
+    consumer = consumer_worker()
+    for _ in range(count):
+        task = asyncio.create_task(consumer())
+        task.add_done_callback(worker_done)
+        consumer_tasks.append(task)
+    metrics_consumer_workers.set(len(consumer_tasks))
+
+def active_workers() -> int:
+    return len(consumer_tasks) - retiring
+
+def scale_workers(target: int):
+    # new workers start right away, surplus ones leave after the task they hold
+    global retiring
+    current = active_workers()
+    if target > current:
+        # keep workers asked to leave but still running before starting new ones
+        kept = min(retiring, target - current)
+        retiring -= kept
+        add_workers(target - current - kept)
+    elif target < current:
+        retiring += current - target
+    metrics_consumer_workers_target.set(target)
+
+def start_consumer(workers: int = None) -> List[asyncio.Task]:
+    global stopping, retiring, background_stopped
+    stopping = False
+    retiring = 0
+
+    add_workers(workers or settings.task_consumer_workers)
+    metrics_consumer_workers_target.set(len(consumer_tasks))
+    logger.info(f"Started {len(consumer_tasks)} consumer workers.")
+
+    if not background_tasks:
+        background_stopped = asyncio.Event()
+        if settings.task_outbox_relay_enabled:
+            background_tasks.append(asyncio.create_task(run_outbox_relay(background_stopped)))
+        if settings.task_schedule_promoter_enabled:
+            background_tasks.append(asyncio.create_task(run_promoter(background_stopped)))
+        if settings.task_archive_enabled:
+            background_tasks.append(asyncio.create_task(run_archiver(background_stopped)))
+        if settings.task_cancel_propagation_enabled:
+            background_tasks.append(asyncio.create_task(run_cancel_listener(background_stopped)))
+        if settings.task_lease_enabled:
+            background_tasks.append(asyncio.create_task(run_lease_keeper(background_stopped)))
+        if settings.task_autoscale_enabled:
+            background_tasks.append(asyncio.create_task(run_autoscaler(background_stopped, active_workers, scale_workers)))
+    return list(consumer_tasks)
+
+async def stop_consumer(timeout: float):
+    global stopping
+    stopping = True
+
+    # stop background jobs first, promoted tasks would only wait for the next start
+    if background_tasks:
+        background_stopped.set()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        background_tasks.clear()
+
+    # let workers finish the tasks they hold, they exit at their next queue poll
+    if consumer_tasks:
+        logger.info(f"Draining {len(consumer_tasks)} consumer workers...")
+        _, pending = await asyncio.wait(consumer_tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Canceled {len(pending)} consumer workers after {timeout}s drain timeout.")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    consumer_tasks.clear()
+    shutdown_pools()
+    metrics_consumer_workers.set(0)
+    metrics_consumer_workers_target.set(0)
+    logger.info("Consumer stopped.")
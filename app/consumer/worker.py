@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+from typing import List
+from prometheus_client import start_http_server
+from app.consumer.task_consumer import start_consumer, stop_consumer
+from app.core.config import settings
+from app.db.database import init_db, close_db
+from app.utils.logging import setup_logger
+from app.utils.profiling import task_profiler
+from app.utils.metrics import multiprocess_enabled, multiprocess_registry, clear_multiprocess_dir, mark_process_dead
+
+logger = setup_logger(__name__)
+
+async def serve(workers: int):
+    # stop on SIGTERM (supervisor, docker, parent process) or SIGINT
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    # SIGUSR1 turns task profiling on or off
+    loop.add_signal_handler(signal.SIGUSR1, task_profiler.toggle)
+
+    await init_db()
+    start_consumer(workers)
+
+    await stop.wait()
+    await stop_consumer(settings.task_consumer_drain_timeout)
+    await close_db()
+
+def run_process(index: int, workers: int, serve_metrics: bool = True):
+    # every process exposes its own metrics, unless the parent serves them for all processes
+    if serve_metrics and settings.task_consumer_metrics_port:
+        start_http_server(settings.task_consumer_metrics_port + index, registry=multiprocess_registry())
+
+    logger.info(f"Consumer process {index} starting with {workers} workers.")
+    asyncio.run(serve(workers))
+    logger.info(f"Consumer process {index} stopped.")
+
+def run_processes(processes: int, workers: int):
+    serve_metrics = not multiprocess_enabled()
+    children: List[multiprocessing.Process] = [
+        multiprocessing.Process(target=run_process, args=(index, workers, serve_metrics), name=f"consumer-{index}")
+        for index in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    # in multiprocess mode the parent serves the metrics of every child on one port
+    if not serve_metrics and settings.task_consumer_metrics_port:
+        start_http_server(settings.task_consumer_metrics_port, registry=multiprocess_registry())
+
+    # forward stop signals so every child drains its workers
+    def forward(signum, frame):
+        logger.info(f"Received signal {signum}, stopping {len(children)} consumer processes...")
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    def forward_toggle(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGUSR1)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGUSR1, forward_toggle)
+
+    for child in children:
+        child.join()
+        mark_process_dead(child.pid)
+        if child.exitcode:
+            logger.error(f"Consumer process {child.name} exited with code {child.exitcode}.")
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.consumer", description="Run task consumer processes.")
+    parser.add_argument("--processes", type=int, default=settings.task_consumer_processes, help="number of consumer processes")
+    parser.add_argument("--workers", type=int, default=settings.task_consumer_workers, help="number of consumer workers per process")
+    args = parser.parse_args(argv)
+    # the autoscaler of every process takes its share of the backlog
+    settings.task_consumer_processes = args.processes
+
+    # files of a previous run would be added to the new totals
+    if multiprocess_enabled():
+        clear_multiprocess_dir()
+
+    if args.processes <= 1:
+        run_process(0, args.workers)
+    else:
+        run_processes(args.processes, args.workers)
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+from app.core.config import settings
+from app.db.database import init_db, close_db
+from app.db.models import TaskArchive
+from app.db.models import async_session
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_archive_row_count, metrics_task_archive_run_duration, metrics_task_archive_last_run_rows, metrics_db_commit_duration
+
+logger = setup_logger(__name__)
+
+async def archive_tasks(
+    max_age: float,
+    batch_size: int,
+    delete_only: bool = False,
+    stopped: asyncio.Event = None,
+) -> int:
+    # move terminal tasks created more than max_age seconds ago, one committed batch at a time so
+    # row locks are held briefly; pause between batches to leave room for the regular load
+    action = "deleted" if delete_only else "archived"
+    created_before = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+    total = 0
+    start = time.monotonic()
+
+    while stopped is None or not stopped.is_set():
+        async with async_session() as db:
+            try:
+                count = await TaskArchive.archive_batch(created_before, batch_size, db, delete_only=delete_only)
+                with metrics_db_commit_duration.labels("archive").time():
+                    await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Task archive batch error: {e}")
+                break
+
+        total += count
+        metrics_task_archive_row_count.labels(action).inc(count)
+        if count < batch_size:
+            break
+        await asyncio.sleep(settings.task_archive_batch_pause)
+
+    duration = time.monotonic() - start
+    metrics_task_archive_run_duration.observe(duration)
+    metrics_task_archive_last_run_rows.set(total)
+    logger.info(f"Task archive run {action} {total} tasks in {duration:.2f}s.")
+    return total
+
+async def run_archiver(stopped: asyncio.Event):
+    # every consumer process may run one, concurrent runs skip each other's locked rows
+    logger.info("Archiver started.")
+    while not stopped.is_set():
+        await archive_tasks(
+            settings.task_archive_max_age,
+            settings.task_archive_batch_size,
+            delete_only=settings.task_archive_delete,
+            stopped=stopped,
+        )
+        try:
+            await asyncio.wait_for(stopped.wait(), settings.task_archive_interval)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Archiver stopped.")
+
+async def run_once(max_age: float, batch_size: int, delete_only: bool):
+    await init_db()
+    try:
+        await archive_tasks(max_age, batch_size, delete_only=delete_only)
+    finally:
+        await close_db()
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.db.archiver", description="Archive old terminal tasks once.")
+    parser.add_argument("--max-age", type=float, default=settings.task_archive_max_age, help="archive tasks created more than this many seconds ago")
+    parser.add_argument("--batch-size", type=int, default=settings.task_archive_batch_size, help="number of tasks moved per statement")
+    parser.add_argument("--delete", action="store_true", default=settings.task_archive_delete, help="delete tasks instead of archiving them")
+    args = parser.parse_args(argv)
+
+    asyncio.run(run_once(args.max_age, args.batch_size, args.delete))
+
+if __name__ == "__main__":
+    main()
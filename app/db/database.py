@@ -6,3 +6,11 @@ async def init_db():
 
 async def close_db():
     await engine.dispose()
+
+def pool_saturation() -> float:
+    # share of the connection pool checked out, 0 for pools without a fixed size such as NullPool
+    pool = engine.pool
+    if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+        return 0.0
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    return pool.checkedout() / capacity if capacity > 0 else 0.0
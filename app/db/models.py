@@ -1,35 +1,87 @@
 import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 from fastapi import Depends
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, Index, ARRAY, any_, bindparam, insert, update, delete, tuple_
 from sqlalchemy.sql import func
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from app.core.config import settings
-from app.schemas import TASK_STATUS_PENDING
+from app.db.pool import engine_options
+from app.schemas import TASK_STATUS_SCHEDULED, TASK_STATUS_PENDING, TASK_STATUS_PROCESSING, TASK_STATUS_COMPLETED, TASK_STATUS_CANCELED, TASK_STATUS_FAILED, TASK_TERMINAL_STATUSES, TASK_TYPE_DEFAULT, TASK_QUEUE_DEFAULT, TaskCreate
 
 # async engine and session
-engine = create_async_engine(settings.database_url, echo=True)
+engine = create_async_engine(settings.database_url, **engine_options(settings.database_url))
 async_session = sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
 
 Base = declarative_base()
 
+def id_in(column, ids: List[str]):
+    # on postgresql one array parameter, = ANY(:ids), keeps a single statement for every number of ids,
+    # so it stays in the prepared statement cache; other databases expand IN
+    if engine.dialect.name == "postgresql":
+        return column == any_(bindparam(None, ids, type_=ARRAY(String)))
+    return column.in_(ids)
+
+# statuses a task may move from, keyed by the status it moves to
+# only a pending task is claimed, a scheduled one waits for the promoter even if a stale queue entry
+# reaches a consumer
+TASK_TRANSITIONS = {
+    TASK_STATUS_PENDING: [TASK_STATUS_SCHEDULED],
+    TASK_STATUS_PROCESSING: [TASK_STATUS_PENDING],
+    TASK_STATUS_COMPLETED: [TASK_STATUS_PROCESSING],
+    TASK_STATUS_CANCELED: [TASK_STATUS_SCHEDULED, TASK_STATUS_PENDING, TASK_STATUS_PROCESSING],
+    # a failed attempt waits for its retry as scheduled, or is dead-lettered as failed
+    TASK_STATUS_SCHEDULED: [TASK_STATUS_PROCESSING],
+    TASK_STATUS_FAILED: [TASK_STATUS_PROCESSING],
+}
+
+def transition_values(to_status: str) -> dict:
+    # a processing task holds a lease the consumer renews while running it, any other status drops it
+    if to_status == TASK_STATUS_PROCESSING:
+        return {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=settings.task_lease_seconds)}
+    return {"lease_expires_at": None}
+
 class Task(Base):
     __tablename__ = "task"
+    __table_args__ = (
+        # keyset pagination, with and without a status filter
+        Index("ix_task_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_task_created_at_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, index=True)
     content = Column(String, nullable=False)
+    type = Column(String, nullable=False, default=TASK_TYPE_DEFAULT, server_default=TASK_TYPE_DEFAULT)
+    queue = Column(String, nullable=False, default=TASK_QUEUE_DEFAULT, server_default=TASK_QUEUE_DEFAULT)
     status = Column(String, nullable=False, default=TASK_STATUS_PENDING)
+    run_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    
-    def __init__(self, content: str, status: str=TASK_STATUS_PENDING):
+    # sent by the client, a second task with the same key is rejected by the database
+    idempotency_key = Column(String, nullable=True, unique=True)
+    failed_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    # server defaults such as created_at come back with RETURNING on insert, no refresh after a create
+    __mapper_args__ = {"eager_defaults": True}
+
+    def __init__(self, content: str, status: str=TASK_STATUS_PENDING, task_type: str=TASK_TYPE_DEFAULT, queue: str=TASK_QUEUE_DEFAULT, run_at: datetime=None, idempotency_key: str=None):
         self.id = str(uuid.uuid4())
         self.content = content
+        self.type = task_type
+        self.queue = queue
         self.status = status
+        self.run_at = run_at
+        self.idempotency_key = idempotency_key
+        # set here rather than by the database, so a new task is complete without a refresh
+        self.failed_attempts = 0
+        self.updated_at = None
 
     def __repr__(self):
         return f"<Task {self.id}>"
@@ -39,3 +91,234 @@ class Task(Base):
         result = await db.execute(select(Task).filter(Task.id == task_id))
         task = result.scalars().first()
         return task
+
+    @classmethod
+    async def get_many(cls, task_ids: List[str], db: AsyncSession) -> List["Task"]:
+        result = await db.execute(select(Task).where(id_in(Task.id, task_ids)))
+        return list(result.scalars().all())
+
+    @classmethod
+    async def get_by_idempotency_key(cls, key: str, db: AsyncSession) -> Optional["Task"]:
+        result = await db.execute(select(Task).filter(Task.idempotency_key == key))
+        return result.scalars().first()
+
+    @classmethod
+    async def list_page(
+        cls,
+        db: AsyncSession,
+        limit: int,
+        status: str = None,
+        created_after: datetime = None,
+        created_before: datetime = None,
+        after: Tuple[datetime, str] = None,
+        descending: bool = True,
+    ) -> List["Task"]:
+        # keyset pagination on (created_at, id): the page starts right after the last row of the
+        # previous one, so the index is seeked instead of scanning OFFSET rows
+        query = select(Task)
+        if status:
+            query = query.where(Task.status == status)
+        if created_after:
+            query = query.where(Task.created_at >= created_after)
+        if created_before:
+            query = query.where(Task.created_at < created_before)
+        if after:
+            key = tuple_(Task.created_at, Task.id)
+            query = query.where(key < tuple_(*after) if descending else key > tuple_(*after))
+
+        if descending:
+            query = query.order_by(Task.created_at.desc(), Task.id.desc())
+        else:
+            query = query.order_by(Task.created_at, Task.id)
+        result = await db.execute(query.limit(limit))
+        return result.scalars().all()
+
+    @classmethod
+    async def create_many(cls, tasks: List[TaskCreate], db: AsyncSession) -> List["Task"]:
+        # insert all rows with one multi-row statement, server defaults come back via RETURNING;
+        # a task with run_at waits as scheduled
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "content": task.content,
+                "type": task.type,
+                "queue": task.queue,
+                "status": TASK_STATUS_SCHEDULED if task.run_at else TASK_STATUS_PENDING,
+                "run_at": task.run_at,
+            }
+            for task in tasks
+        ]
+        result = await db.execute(insert(Task).values(rows).returning(Task))
+        tasks = {task.id: task for task in result.scalars().all()}
+
+        # keep the order of the request
+        return [tasks[row["id"]] for row in rows]
+
+    @classmethod
+    async def count_by_status(cls, db: AsyncSession) -> Dict[str, int]:
+        result = await db.execute(select(Task.status, func.count()).group_by(Task.status))
+        return {status: count for status, count in result.all()}
+
+    @classmethod
+    async def transition(
+        cls, task_id: str, to_status: str, db: AsyncSession, from_statuses: List[str] = None, values: dict = None
+    ) -> Optional["Task"]:
+        # compare-and-set the status with one conditional update, None if the task is missing or not in from_statuses;
+        # values are other columns set along with it
+        result = await db.execute(
+            update(Task)
+            .where(Task.id == task_id, Task.status.in_(from_statuses or TASK_TRANSITIONS[to_status]))
+            .values(status=to_status, **transition_values(to_status), **(values or {}))
+            .returning(Task)
+        )
+        return result.scalars().first()
+
+    @classmethod
+    async def transition_many(
+        cls, task_ids: List[str], to_status: str, db: AsyncSession, from_statuses: List[str] = None, values: dict = None
+    ) -> List["Task"]:
+        # move every task still in one of from_statuses with one conditional update
+        result = await db.execute(
+            update(Task)
+            .where(Task.id.in_(task_ids), Task.status.in_(from_statuses or TASK_TRANSITIONS[to_status]))
+            .values(status=to_status, **transition_values(to_status), **(values or {}))
+            .returning(Task)
+        )
+        return result.scalars().all()
+
+    @classmethod
+    async def renew_leases(cls, task_ids: List[str], db: AsyncSession) -> int:
+        # extend the lease of tasks still processing with one update
+        result = await db.execute(
+            update(Task)
+            .where(Task.id.in_(task_ids), Task.status == TASK_STATUS_PROCESSING)
+            .values(**transition_values(TASK_STATUS_PROCESSING))
+        )
+        return result.rowcount
+
+    @classmethod
+    async def expired_leases(cls, now: datetime, limit: int, db: AsyncSession) -> List["Task"]:
+        # processing tasks nobody renewed the lease of, e.g. after their consumer died
+        result = await db.execute(
+            select(Task)
+            .where(Task.status == TASK_STATUS_PROCESSING, Task.lease_expires_at < now)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    @classmethod
+    async def replay_failed(cls, limit: int, db: AsyncSession, queue: str = None, task_type: str = None) -> List["Task"]:
+        # move up to limit dead-lettered tasks back to pending with fresh attempts, oldest first;
+        # rows locked by a concurrent replay are skipped
+        task_ids = select(Task.id).where(Task.status == TASK_STATUS_FAILED)
+        if queue:
+            task_ids = task_ids.where(Task.queue == queue)
+        if task_type:
+            task_ids = task_ids.where(Task.type == task_type)
+        task_ids = task_ids.order_by(Task.created_at, Task.id).limit(limit).with_for_update(skip_locked=True)
+
+        result = await db.execute(
+            update(Task)
+            .where(Task.id.in_(task_ids), Task.status == TASK_STATUS_FAILED)
+            .values(status=TASK_STATUS_PENDING, failed_attempts=0, last_error=None, run_at=None, lease_expires_at=None)
+            .returning(Task)
+        )
+        return result.scalars().all()
+
+class TaskOutbox(Base):
+    # queue pushes of created, retried and replayed tasks, written in the same transaction as their
+    # status and relayed to redis by the consumers, so a task is never committed without reaching its queue
+    __tablename__ = "task_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, nullable=False)
+    queue = Column(String, nullable=False)
+    # a task with run_at goes to the scheduled set instead
+    run_at = Column(DateTime(timezone=True), nullable=True)
+    # traceparent of the request, so processing continues its trace
+    trace = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __init__(self, task_id: str, queue: str, run_at: datetime = None, trace: str = None):
+        self.task_id = task_id
+        self.queue = queue
+        self.run_at = run_at
+        self.trace = trace
+
+    def __repr__(self):
+        return f"<TaskOutbox {self.task_id}>"
+
+    @classmethod
+    async def add_many(cls, tasks: List[Task], trace: Optional[str], db: AsyncSession):
+        rows = [{"task_id": task.id, "queue": task.queue, "run_at": task.run_at, "trace": trace} for task in tasks]
+        await db.execute(insert(TaskOutbox).values(rows))
+
+    @classmethod
+    async def lock_batch(cls, limit: int, db: AsyncSession) -> List["TaskOutbox"]:
+        # the oldest limit rows, locked until the transaction ends; rows locked by a concurrent relay are skipped
+        result = await db.execute(
+            select(TaskOutbox).order_by(TaskOutbox.id).limit(limit).with_for_update(skip_locked=True)
+        )
+        return result.scalars().all()
+
+    @classmethod
+    async def delete_many(cls, ids: List[int], db: AsyncSession):
+        await db.execute(delete(TaskOutbox).where(TaskOutbox.id.in_(ids)))
+
+    @classmethod
+    async def count(cls, db: AsyncSession) -> int:
+        result = await db.execute(select(func.count()).select_from(TaskOutbox))
+        return result.scalar()
+
+class TaskArchive(Base):
+    # terminal tasks moved out of the task table, same columns plus the archive time
+    __tablename__ = "task_archive"
+
+    id = Column(String, primary_key=True)
+    content = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    queue = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    run_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    idempotency_key = Column(String, nullable=True)
+    failed_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<TaskArchive {self.id}>"
+
+    @classmethod
+    async def get(cls, task_id: str, db: AsyncSession) -> Optional["TaskArchive"]:
+        result = await db.execute(select(TaskArchive).filter(TaskArchive.id == task_id))
+        return result.scalars().first()
+
+    @classmethod
+    async def get_many(cls, task_ids: List[str], db: AsyncSession) -> List["TaskArchive"]:
+        result = await db.execute(select(TaskArchive).where(id_in(TaskArchive.id, task_ids)))
+        return list(result.scalars().all())
+
+    @classmethod
+    async def archive_batch(cls, created_before: datetime, limit: int, db: AsyncSession, delete_only: bool = False) -> int:
+        # pick up to limit terminal tasks through the (status, created_at, id) index, rows locked by
+        # someone else are skipped instead of waited for
+        task_ids = (
+            select(Task.id)
+            .where(Task.status.in_(TASK_TERMINAL_STATUSES), Task.created_at < created_before)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if delete_only:
+            result = await db.execute(delete(Task).where(Task.id.in_(task_ids)))
+            return result.rowcount
+
+        # move them with one statement: DELETE ... RETURNING feeds INSERT ... SELECT
+        columns = [column.name for column in Task.__table__.columns]
+        moved = delete(Task).where(Task.id.in_(task_ids)).returning(*Task.__table__.columns).cte("moved")
+        result = await db.execute(
+            insert(TaskArchive).from_select(columns, select(*(moved.c[name] for name in columns)))
+        )
+        return result.rowcount
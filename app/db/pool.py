@@ -0,0 +1,48 @@
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.config import settings
+from app.utils.metrics import (
+    metrics_db_pool_capacity,
+    metrics_db_pool_checked_out,
+    metrics_db_pool_overflow,
+    metrics_db_pool_wait_duration
+)
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    # queue pool that records the wait for a connection and its usage after every checkout and return
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # includes opening a new connection when the pool may still grow, and timeouts
+            metrics_db_pool_wait_duration.observe(time.perf_counter() - start)
+            self.sample()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self.sample()
+
+    def sample(self):
+        metrics_db_pool_capacity.set(self.size() + max(self._max_overflow, 0))
+        metrics_db_pool_checked_out.set(self.checkedout())
+        metrics_db_pool_overflow.set(max(self.overflow(), 0))
+
+def engine_options(database_url: str) -> dict:
+    # sqlite keeps the pool of its dialect, a fixed size pool does not fit a single file or memory
+    url = make_url(database_url)
+    options = {"echo": settings.database_echo}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=MeteredPool,
+            pool_size=settings.database_pool_size,
+            max_overflow=settings.database_max_overflow,
+            pool_timeout=settings.database_pool_timeout,
+            pool_recycle=settings.database_pool_recycle,
+            pool_pre_ping=settings.database_pool_pre_ping,
+        )
+    if url.get_driver_name() == "asyncpg":
+        # 0 disables the cache, needed behind a pgbouncer in transaction mode
+        options["connect_args"] = {"prepared_statement_cache_size": settings.database_statement_cache_size}
+    return options
@@ -0,0 +1,131 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Set
+from app.cache.task_cache import TERMINAL_STATUSES
+from app.core.config import settings
+from app.queue.redis_client import redis
+from app.schemas import (
+    TASK_STATUS_SCHEDULED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_PROCESSING,
+    TASK_STATUS_COMPLETED,
+    TASK_STATUS_CANCELED,
+    TASK_STATUS_FAILED,
+    TaskResponse
+)
+from app.utils.logging import setup_logger
+from app.utils.metrics import (
+    metrics_task_event_publish_count,
+    metrics_task_event_publish_fail_count,
+    metrics_task_event_subscribers
+)
+
+logger = setup_logger(__name__)
+
+TASK_EVENTS_CHANNEL = "task_events"
+
+# a task only moves forward within an attempt, and a failed attempt starts the next one;
+# an event for an earlier attempt or status is stale
+STATUS_ORDER = {
+    TASK_STATUS_SCHEDULED: 0,
+    TASK_STATUS_PENDING: 1,
+    TASK_STATUS_PROCESSING: 2,
+    TASK_STATUS_COMPLETED: 3,
+    TASK_STATUS_CANCELED: 3,
+    TASK_STATUS_FAILED: 3,
+}
+
+# a stream ends at these, a failed task only changes again when replayed
+END_STATUSES = TERMINAL_STATUSES + [TASK_STATUS_FAILED]
+
+def event_order(task) -> tuple:
+    return task.failed_attempts, STATUS_ORDER.get(task.status, 0)
+
+async def publish_task_event(task):
+    await publish_task_events([task])
+
+async def publish_task_events(tasks: List):
+    if not settings.task_events_enabled or not tasks:
+        return
+
+    # every api process receives every event, so keep the payload small
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for task in tasks:
+                pipe.publish(TASK_EVENTS_CHANNEL, TaskResponse.model_validate(task).model_dump_json())
+            await pipe.execute()
+    except Exception as e:
+        metrics_task_event_publish_fail_count.inc(len(tasks))
+        logger.warning(f"Task event publish error: {e}")
+        return
+    metrics_task_event_publish_count.inc(len(tasks))
+
+class TaskEventHub:
+    # one pub/sub subscription per process, fanned out to a queue per connection
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen())
+        events = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(task_id, set()).add(events)
+        metrics_task_event_subscribers.inc()
+        return events
+
+    def unsubscribe(self, task_id: str, events: asyncio.Queue):
+        queues = self.subscribers.get(task_id)
+        if queues is None or events not in queues:
+            return
+        queues.discard(events)
+        if not queues:
+            del self.subscribers[task_id]
+        metrics_task_event_subscribers.dec()
+
+    def dispatch(self, data: str):
+        task = TaskResponse.model_validate_json(data)
+        for events in self.subscribers.get(task.id, ()):
+            # a slow client only needs the latest status, drop its oldest event
+            if events.full():
+                events.get_nowait()
+            events.put_nowait(task)
+
+    async def listen(self):
+        while True:
+            try:
+                async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(TASK_EVENTS_CHANNEL)
+                    logger.info(f"Subscribed to {TASK_EVENTS_CHANNEL}")
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Task event subscription error: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+            self.listener = None
+
+task_event_hub = TaskEventHub(settings.task_events_queue_size)
+
+async def task_events(task: TaskResponse, events: asyncio.Queue) -> AsyncIterator[Optional[TaskResponse]]:
+    # yield the current state, then every newer one until the task is done;
+    # None every keepalive interval without an event
+    yield task
+    last = task
+    while last.status not in END_STATUSES:
+        try:
+            event = await asyncio.wait_for(events.get(), settings.task_events_keepalive)
+        except asyncio.TimeoutError:
+            yield None
+            continue
+        if event_order(event) <= event_order(last):
+            continue
+        last = event
+        yield event
@@ -1,16 +1,22 @@
+import asyncio
+import signal
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response
-from prometheus_client import generate_latest, REGISTRY
+from prometheus_client import generate_latest
 from prometheus_client.exposition import CONTENT_TYPE_LATEST
 from app.api import task_api
-from app.consumer.task_consumer import start_consumer
+from app.consumer.task_consumer import start_consumer, stop_consumer
 from app.core.config import settings
 from app.db.database import init_db, close_db
+from app.events.task_events import task_event_hub
 from app.utils.logging import setup_logger
+from app.utils.metrics import mark_process_dead
+from app.utils.metrics_snapshot import metrics_snapshot, metrics_registry
+from app.utils.profiling import task_profiler
 
 logger = setup_logger(__name__)
 
-# set sqlalchemy logger
+# set sqlalchemy logger, its level comes from LOG_LEVELS
 setup_logger("sqlalchemy")
 
 @asynccontextmanager
@@ -18,12 +24,22 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting app in {settings.app_env} environment.")
     # init db
     await init_db()
-    # start task consumer
-    start_consumer()
-    
+    # start task consumer, unless it runs as a standalone process
+    if settings.task_consumer_embedded:
+        start_consumer()
+        # SIGUSR1 turns task profiling on or off in this worker
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, task_profiler.toggle)
+
     yield
+    # stop task consumer
+    if settings.task_consumer_embedded:
+        await stop_consumer(settings.task_consumer_drain_timeout)
+    # stop task event subscription
+    await task_event_hub.close()
     # close db
     await close_db()
+    # drop the live gauges of this worker in multiprocess mode
+    mark_process_dead()
     logger.info("App stopped.")
 
 app = FastAPI(title="Task Processing System", lifespan=lifespan)
@@ -39,7 +55,9 @@ async def health():
 # metrics
 @app.get("/metrics")
 async def metrics():
+    # queue lengths and task counts are sampled from redis and the database, at most once per ttl
+    await metrics_snapshot.refresh()
     return Response(
-        content=generate_latest(REGISTRY),
+        content=generate_latest(metrics_registry()),
         media_type=CONTENT_TYPE_LATEST
     )
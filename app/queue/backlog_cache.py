@@ -0,0 +1,31 @@
+import asyncio
+import time
+from typing import Optional, Tuple
+from app.queue.redis_queue import queue_backlog
+from app.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+class BacklogCache:
+    # ready tasks of all queues and the wait of the oldest one, sampled in the background at most once
+    # per ttl; readers get the last sample right away and never wait for redis
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.depth = 0
+        self.oldest: Optional[float] = None
+        self.sampled_at = 0.0
+        self.refreshing: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        try:
+            self.depth, self.oldest = await queue_backlog()
+        except Exception as e:
+            # keep the last sample, the next read tries again
+            logger.error(f"Queue backlog sample error: {e}")
+        self.sampled_at = time.monotonic()
+
+    def sample(self) -> Tuple[int, float]:
+        if time.monotonic() - self.sampled_at >= self.ttl and (self.refreshing is None or self.refreshing.done()):
+            self.refreshing = asyncio.ensure_future(self.refresh())
+        wait = max(time.time() - self.oldest, 0) if self.oldest else 0.0
+        return self.depth, wait
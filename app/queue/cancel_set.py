@@ -0,0 +1,28 @@
+import time
+from typing import List, Set
+from app.core.config import settings
+from app.queue.redis_client import redis
+from app.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+# recently canceled task ids scored by cancel time, read by consumers at dequeue
+CANCELED_SET_NAME = "task_canceled"
+# canceled task ids, for the consumer running the task
+TASK_CANCEL_CHANNEL = "task_cancel"
+
+async def mark_canceled(task_id: str):
+    # remember the id for consumers that have not dequeued it yet, tell the one running it,
+    # and forget ids older than the ttl in the same round trip
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zadd(CANCELED_SET_NAME, {task_id: now})
+        pipe.zremrangebyscore(CANCELED_SET_NAME, "-inf", now - settings.task_cancel_set_ttl)
+        pipe.publish(TASK_CANCEL_CHANNEL, task_id)
+        await pipe.execute()
+
+async def canceled_task_ids(task_ids: List[str]) -> Set[str]:
+    if not task_ids:
+        return set()
+    scores = await redis.zmscore(CANCELED_SET_NAME, task_ids)
+    return {task_id for task_id, score in zip(task_ids, scores) if score is not None}
@@ -0,0 +1,75 @@
+import time
+from typing import Dict, List, Tuple
+from app.queue import redis_stream
+from app.queue.redis_client import redis
+from app.queue.redis_queue import QUEUE_DEFAULT, queue_key, use_stream
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_queue_scheduled_count
+
+logger = setup_logger(__name__)
+
+SCHEDULED_SET_NAME = "task_scheduled"
+
+# move task ids from the sorted set to the ready queue, each in one atomic step with its ZREM so
+# concurrent promoters never push a task twice; KEYS[1] is the sorted set, KEYS[2] the ready list
+# or stream, ARGV is now, the backend and the task ids; returns the task ids pushed
+PROMOTE_SCRIPT = """
+local promoted = {}
+for i = 3, #ARGV do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        if ARGV[2] == 'stream' then
+            redis.call('XADD', KEYS[2], '*', 'task_id', ARGV[i], 'enqueued_at', ARGV[1])
+        else
+            redis.call('RPUSH', KEYS[2], cjson.encode({id = ARGV[i], ts = tonumber(ARGV[1])}))
+        end
+        promoted[#promoted + 1] = ARGV[i]
+    end
+end
+return promoted
+"""
+
+_promote_script = None
+
+def scheduled_key(queue: str) -> str:
+    # one sorted set per queue, the default queue keeps the original key
+    if queue == QUEUE_DEFAULT:
+        return SCHEDULED_SET_NAME
+    return f"{SCHEDULED_SET_NAME}:{queue}"
+
+async def schedule_tasks(due_times: Dict[str, float], queue: str = QUEUE_DEFAULT):
+    # due_times maps task id to the unix time it becomes ready
+    try:
+        await redis.zadd(scheduled_key(queue), due_times)
+    except Exception as e:
+        e = Exception(f"Failed to schedule {len(due_times)} tasks: {e}")
+        logger.error(e)
+        raise e
+
+    metrics_queue_scheduled_count.inc(len(due_times))
+    logger.info(f"Scheduled {len(due_times)} tasks on {queue} queue")
+
+async def unschedule_task(task_id: str, queue: str = QUEUE_DEFAULT):
+    await redis.zrem(scheduled_key(queue), task_id)
+
+async def due_tasks(queue: str, limit: int) -> List[Tuple[str, float]]:
+    # up to limit due task ids with their due time, oldest first
+    return await redis.zrangebyscore(scheduled_key(queue), "-inf", time.time(), start=0, num=limit, withscores=True)
+
+async def promote_tasks(task_ids: List[str], queue: str = QUEUE_DEFAULT) -> List[str]:
+    # returns the task ids this call moved, ids already moved or unscheduled are left out
+    global _promote_script
+    if _promote_script is None:
+        _promote_script = redis.register_script(PROMOTE_SCRIPT)
+
+    if use_stream():
+        backend, ready_key = "stream", redis_stream.stream_key(queue)
+    else:
+        backend, ready_key = "list", queue_key(queue)
+
+    promoted = await _promote_script(
+        keys=[scheduled_key(queue), ready_key],
+        args=[round(time.time(), 3), backend, *task_ids],
+    )
+    if promoted:
+        logger.info(f"Promoted {len(promoted)} due tasks to {queue} queue")
+    return promoted
@@ -0,0 +1,25 @@
+import json
+import time
+from typing import NamedTuple, Optional
+from app.utils.tracing import current_traceparent
+
+class QueueMessage(NamedTuple):
+    task_id: str
+    queue: str
+    enqueued_at: Optional[float] = None
+    trace: Optional[str] = None  # traceparent of the span that enqueued the task
+
+def encode_message(task_id: str, traceparent: Optional[str] = None) -> str:
+    # traceparent defaults to the current span
+    message = {"id": task_id, "ts": round(time.time(), 3)}
+    traceparent = traceparent or current_traceparent()
+    if traceparent:
+        message["tp"] = traceparent
+    return json.dumps(message)
+
+def decode_message(data: str, queue: str) -> QueueMessage:
+    # plain task ids were pushed before messages carried a timestamp
+    if not data.startswith("{"):
+        return QueueMessage(data, queue)
+    message = json.loads(data)
+    return QueueMessage(message["id"], queue, message.get("ts"), message.get("tp"))
@@ -0,0 +1,5 @@
+from redis.asyncio import Redis
+from app.core.config import settings
+
+# init redis
+redis = Redis(host=settings.redis_host, decode_responses=True)
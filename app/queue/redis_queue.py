@@ -1,42 +1,130 @@
-from redis.asyncio import Redis
+import time
+from typing import List, Optional, Tuple
 from app.core.config import settings
+from app.queue import redis_stream
+from app.queue.message import QueueMessage, encode_message, decode_message
+from app.queue.redis_client import redis
+from app.queue.scheduler import QueueScheduler
 from app.utils.logging import setup_logger
-from app.utils.metrics import metrics_queue_length, metrics_queue_push_count, metrics_queue_push_fail_count, metrics_queue_pop_count, metrics_queue_pop_fail_count
+from app.utils.tracing import traced
+from app.utils.metrics import metrics_queue_push_count, metrics_queue_push_fail_count, metrics_queue_pop_count, metrics_queue_pop_fail_count, metrics_queue_wait_time
 
 logger = setup_logger(__name__)
 
-# init redis
-redis = Redis(host=settings.redis_host, decode_responses=True)
-
 QUEUE_NAME = "task_queue"
+QUEUE_DEFAULT = "default"
+
+# queue backends
+QUEUE_BACKEND_LIST = "list"
+QUEUE_BACKEND_STREAM = "stream"
+
+# order in which this process polls the queues
+scheduler = QueueScheduler(settings.task_queues, settings.task_queue_starvation_seconds)
+
+def use_stream() -> bool:
+    return settings.queue_backend == QUEUE_BACKEND_STREAM
+
+def queue_key(queue: str) -> str:
+    # the default queue keeps the original key
+    if queue == QUEUE_DEFAULT:
+        return QUEUE_NAME
+    return f"{QUEUE_NAME}:{queue}"
 
-async def enqueue_task(task_id: str):
-    metrics_queue_push_count.inc()
+def key_queue(key: str) -> str:
+    if key == QUEUE_NAME:
+        return QUEUE_DEFAULT
+    return key[len(QUEUE_NAME) + 1:]
 
+def received(messages: List[QueueMessage]):
+    # record how long the messages waited and that their queue was served
+    now = time.time()
+    for message in messages:
+        if message.enqueued_at:
+            metrics_queue_wait_time.labels(message.queue).observe(max(now - message.enqueued_at, 0))
+    if messages:
+        scheduler.served(messages[0].queue)
+
+@traced("queue.enqueue")
+async def enqueue_tasks(task_ids: List[str], queue: str = QUEUE_DEFAULT, traces: List[Optional[str]] = None):
+    # traces are the traceparents to continue per task, e.g. of the requests that created them
+    if use_stream():
+        return await redis_stream.enqueue_tasks(task_ids, queue, traces)
+
+    metrics_queue_push_count.inc(len(task_ids))
+
+    # push all ids with one variadic RPUSH
     try:
-        await redis.rpush(QUEUE_NAME, task_id)
+        traces = traces or [None] * len(task_ids)
+        await redis.rpush(queue_key(queue), *(encode_message(task_id, trace) for task_id, trace in zip(task_ids, traces)))
     except Exception as e:
-        metrics_queue_push_fail_count.inc()
-        e = Exception(f"Failed to push task {task_id} to redis queue: {e}")
+        metrics_queue_push_fail_count.inc(len(task_ids))
+        e = Exception(f"Failed to push {len(task_ids)} tasks to redis queue: {e}")
         logger.error(e)
         raise e
-    
-    metrics_queue_length.inc()
-    logger.info(f"Enqueued task {task_id}")
+
+    logger.info(f"Enqueued {len(task_ids)} tasks")
 
 async def dequeue_task():
+    messages = await dequeue_messages(1, settings.queue_pop_timeout)
+    return messages[0].task_id if messages else None
+
+async def dequeue_tasks(count: int, timeout: float) -> List[str]:
+    messages = await dequeue_messages(count, timeout)
+    return [message.task_id for message in messages]
+
+async def dequeue_messages(count: int, timeout: float) -> List[QueueMessage]:
+    # queues are polled in the order given by the weighted scheduler
+    queues = scheduler.order()
+    if use_stream():
+        messages = await redis_stream.dequeue_messages(queues, count, timeout)
+        received(messages)
+        return messages
+
+    # pop up to count messages with one BLMPOP from the first non-empty queue, waiting at most timeout seconds
     try:
-        task = await redis.blpop(QUEUE_NAME)
+        keys = [queue_key(queue) for queue in queues]
+        result = await redis.blmpop(timeout, len(keys), *keys, direction="LEFT", count=count)
     except Exception as e:
         metrics_queue_pop_fail_count.inc()
-        e = Exception(f"Failed to pop task from redis queue: {e}")
+        e = Exception(f"Failed to pop tasks from redis queue: {e}")
         logger.error(e)
         raise e
 
-    if task:
-        metrics_queue_pop_count.inc()
-        task_id = task[1]  # Redis return (queue_name, task_id)
-        metrics_queue_length.dec()
-        logger.info(f"Dequeued task {task_id}")
-        return task_id
-    return None
+    if not result:
+        return []
+
+    queue = key_queue(result[0])  # Redis return (queue_name, [message, ...])
+    messages = [decode_message(data, queue) for data in result[1]]
+    metrics_queue_pop_count.inc(len(messages))
+    received(messages)
+    logger.info(f"Dequeued {len(messages)} tasks from {queue} queue")
+    return messages
+
+async def ack_task(task_id: str):
+    await ack_tasks([task_id])
+
+async def ack_tasks(task_ids: List[str]):
+    # a popped list item is already gone, only stream entries need an ack
+    if use_stream():
+        await redis_stream.ack_tasks(task_ids)
+
+async def queue_backlog() -> Tuple[int, Optional[float]]:
+    # tasks ready in all queues and the enqueue time of the oldest one at a queue head, None if all are empty
+    queues = list(settings.task_queues)
+    if use_stream():
+        return await redis_stream.backlog(queues)
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for queue in queues:
+            pipe.llen(queue_key(queue))
+            pipe.lindex(queue_key(queue), 0)
+        results = await pipe.execute()
+
+    depth = 0
+    oldest = None
+    for queue, length, head in zip(queues, results[::2], results[1::2]):
+        depth += length
+        enqueued_at = decode_message(head, queue).enqueued_at if head else None
+        if enqueued_at:
+            oldest = enqueued_at if oldest is None else min(oldest, enqueued_at)
+    return depth, oldest
@@ -0,0 +1,218 @@
+import os
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+from redis.exceptions import ResponseError
+from app.core.config import settings
+from app.queue.message import QueueMessage
+from app.queue.redis_client import redis
+from app.utils.logging import setup_logger
+from app.utils.tracing import current_traceparent
+from app.utils.metrics import (
+    metrics_queue_push_count,
+    metrics_queue_push_fail_count,
+    metrics_queue_pop_count,
+    metrics_queue_pop_fail_count,
+    metrics_queue_ack_count,
+    metrics_queue_ack_fail_count,
+    metrics_queue_reclaim_count
+)
+
+logger = setup_logger(__name__)
+
+STREAM_NAME = "task_stream"
+STREAM_DEFAULT = "default"
+
+# one consumer per process, entries are acked by id so coroutines can share it
+CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+
+# stream and entry id of every task dequeued but not acked yet
+_pending_entries: Dict[str, Tuple[str, str]] = {}
+
+_ready_groups = set()
+_reclaim_cursors: Dict[str, str] = {}
+_reclaim_at = 0.0
+
+def stream_key(queue: str) -> str:
+    # the default queue keeps the original key
+    if queue == STREAM_DEFAULT:
+        return STREAM_NAME
+    return f"{STREAM_NAME}:{queue}"
+
+def key_queue(key: str) -> str:
+    if key == STREAM_NAME:
+        return STREAM_DEFAULT
+    return key[len(STREAM_NAME) + 1:]
+
+async def ensure_group(stream: str):
+    if stream in _ready_groups:
+        return
+
+    # create the consumer group (and the stream), reading entries added before the group exists
+    try:
+        await redis.xgroup_create(stream, settings.queue_stream_group, id="0", mkstream=True)
+        logger.info(f"Created consumer group {settings.queue_stream_group} on {stream}")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    _ready_groups.add(stream)
+
+async def enqueue_tasks(task_ids: List[str], queue: str = STREAM_DEFAULT, traces: List[Optional[str]] = None):
+    metrics_queue_push_count.inc(len(task_ids))
+
+    # add all entries with one pipelined round trip, each continuing its own trace or the current one
+    try:
+        enqueued_at = round(time.time(), 3)
+        current = current_traceparent()
+        async with redis.pipeline(transaction=False) as pipe:
+            for task_id, trace in zip(task_ids, traces or [None] * len(task_ids)):
+                fields = {"task_id": task_id, "enqueued_at": enqueued_at}
+                if trace or current:
+                    fields["traceparent"] = trace or current
+                pipe.xadd(stream_key(queue), fields)
+            await pipe.execute()
+    except Exception as e:
+        metrics_queue_push_fail_count.inc(len(task_ids))
+        e = Exception(f"Failed to add {len(task_ids)} tasks to redis stream: {e}")
+        logger.error(e)
+        raise e
+
+    logger.info(f"Enqueued {len(task_ids)} tasks to {queue} stream")
+
+async def reclaim_entries(stream: str, count: int) -> list:
+    # take over entries another consumer read but did not ack in time
+    result = await redis.xautoclaim(
+        stream,
+        settings.queue_stream_group,
+        CONSUMER_NAME,
+        min_idle_time=int(settings.queue_stream_claim_idle * 1000),
+        start_id=_reclaim_cursors.get(stream, "0-0"),
+        count=count,
+    )
+    _reclaim_cursors[stream] = result[0]
+    entries = [(entry_id, fields) for entry_id, fields in result[1] if fields]
+    if entries:
+        metrics_queue_reclaim_count.inc(len(entries))
+        logger.warning(f"Reclaimed {len(entries)} stale tasks from {stream}")
+    return entries
+
+async def read_entries(queues: List[str], count: int, timeout: float) -> List[Tuple[str, list]]:
+    global _reclaim_at
+    streams = [stream_key(queue) for queue in queues]
+    for stream in streams:
+        await ensure_group(stream)
+
+    # reclaim stale entries from time to time, before reading new ones
+    if time.monotonic() >= _reclaim_at:
+        _reclaim_at = time.monotonic() + settings.queue_stream_claim_interval
+        for stream in streams:
+            entries = await reclaim_entries(stream, count)
+            if entries:
+                return [(stream, entries)]
+
+    # read the streams in scheduler order without blocking, so a busy stream cannot hide the others
+    if len(streams) > 1:
+        for stream in streams:
+            result = await redis.xreadgroup(settings.queue_stream_group, CONSUMER_NAME, {stream: ">"}, count=count)
+            if result:
+                return result
+
+    # all empty: block on as many streams as may deliver one entry each without exceeding count
+    result = await redis.xreadgroup(
+        settings.queue_stream_group,
+        CONSUMER_NAME,
+        {stream: ">" for stream in streams[:count]},
+        count=count if len(streams) == 1 else 1,
+        block=max(int(timeout * 1000), 1),
+    )
+    return result or []
+
+async def dequeue_messages(queues: List[str], count: int, timeout: float) -> List[QueueMessage]:
+    try:
+        result = await read_entries(queues, count, timeout)
+    except Exception as e:
+        # the group is gone if redis was flushed, create it again on next read
+        if "NOGROUP" in str(e):
+            _ready_groups.clear()
+        metrics_queue_pop_fail_count.inc()
+        e = Exception(f"Failed to read tasks from redis stream: {e}")
+        logger.error(e)
+        raise e
+
+    messages = []
+    for stream, entries in result:
+        queue = key_queue(stream)
+        for entry_id, fields in entries:
+            _pending_entries[fields["task_id"]] = (stream, entry_id)
+            enqueued_at = float(fields["enqueued_at"]) if fields.get("enqueued_at") else None
+            messages.append(QueueMessage(fields["task_id"], queue, enqueued_at, fields.get("traceparent")))
+
+    if messages:
+        metrics_queue_pop_count.inc(len(messages))
+        logger.info(f"Dequeued {len(messages)} tasks from stream")
+    return messages
+
+async def ack_tasks(task_ids: List[str]):
+    entries: Dict[str, List[str]] = {}
+    for task_id in task_ids:
+        if task_id in _pending_entries:
+            stream, entry_id = _pending_entries.pop(task_id)
+            entries.setdefault(stream, []).append(entry_id)
+    if not entries:
+        return
+    count = sum(len(entry_ids) for entry_ids in entries.values())
+
+    # ack and drop the entries in one round trip, so the streams only hold unfinished tasks
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for stream, entry_ids in entries.items():
+                pipe.xack(stream, settings.queue_stream_group, *entry_ids)
+                pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+    except Exception as e:
+        metrics_queue_ack_fail_count.inc(count)
+        e = Exception(f"Failed to ack {count} tasks on redis stream: {e}")
+        logger.error(e)
+        raise e
+
+    metrics_queue_ack_count.inc(count)
+    logger.info(f"Acked {count} tasks on stream")
+
+async def backlog(queues: List[str]) -> Tuple[int, Optional[float]]:
+    # entries not delivered to the consumer group yet, and the enqueue time of the oldest one
+    streams = [stream_key(queue) for queue in queues]
+    async with redis.pipeline(transaction=False) as pipe:
+        for stream in streams:
+            pipe.xlen(stream)
+            pipe.xinfo_groups(stream)
+        results = await pipe.execute(raise_on_error=False)
+
+    depth = 0
+    last_ids = []
+    for stream in streams:
+        length, groups = results.pop(0), results.pop(0)
+        if isinstance(length, Exception):
+            raise length
+        if isinstance(groups, ResponseError):
+            groups = []  # the stream does not exist yet
+        elif isinstance(groups, Exception):
+            raise groups
+        group = next((group for group in groups if group["name"] == settings.queue_stream_group), None)
+        # without the group every entry is still to be read
+        depth += length - (group["pending"] if group else 0)
+        last_ids.append(f"({group['last-delivered-id']}" if group else "-")
+
+    # the first entry after the last delivered one waits the longest
+    async with redis.pipeline(transaction=False) as pipe:
+        for stream, last_id in zip(streams, last_ids):
+            pipe.xrange(stream, min=last_id, count=1)
+        heads = await pipe.execute()
+
+    oldest = None
+    for head in heads:
+        if not head:
+            continue
+        entry_id, fields = head[0]
+        enqueued_at = float(fields["enqueued_at"]) if fields.get("enqueued_at") else int(entry_id.split("-")[0]) / 1000
+        oldest = enqueued_at if oldest is None else min(oldest, enqueued_at)
+    return depth, oldest
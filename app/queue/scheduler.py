@@ -0,0 +1,36 @@
+import time
+from typing import Dict, List
+
+class QueueScheduler:
+    # smooth weighted round robin over the queues, a queue not served for
+    # starvation_seconds goes first regardless of its weight
+    def __init__(self, weights: Dict[str, int], starvation_seconds: float):
+        self.weights = {queue: weight for queue, weight in weights.items() if weight > 0}
+        self.starvation_seconds = starvation_seconds
+        self.current = {queue: 0 for queue in self.weights}
+        self.last_served = {queue: time.monotonic() for queue in self.weights}
+
+    def order(self) -> List[str]:
+        # pick the queue with the highest current weight, then lower it by the total
+        total = sum(self.weights.values())
+        for queue, weight in self.weights.items():
+            self.current[queue] += weight
+        picked = max(self.current, key=self.current.get)
+        self.current[picked] -= total
+
+        # starving queues first, oldest first, then the picked one, then the others by weight
+        now = time.monotonic()
+        starving = sorted(
+            (queue for queue in self.weights if now - self.last_served[queue] > self.starvation_seconds),
+            key=self.last_served.get,
+        )
+        others = sorted(self.weights, key=self.weights.get, reverse=True)
+        order = []
+        for queue in starving + [picked] + others:
+            if queue not in order:
+                order.append(queue)
+        return order
+
+    def served(self, queue: str):
+        if queue in self.last_served:
+            self.last_served[queue] = time.monotonic()
@@ -1,21 +1,53 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
+TASK_STATUS_SCHEDULED   = "scheduled"
 TASK_STATUS_PENDING     = "pending"
 TASK_STATUS_PROCESSING  = "processing"
 TASK_STATUS_COMPLETED   = "completed"
 TASK_STATUS_CANCELED    = "canceled"
+TASK_STATUS_FAILED      = "failed"      # dead-lettered after its last attempt, until replayed
+TASK_TERMINAL_STATUSES = [TASK_STATUS_COMPLETED, TASK_STATUS_CANCELED]
+TASK_STATUSES = [TASK_STATUS_SCHEDULED, TASK_STATUS_PENDING, TASK_STATUS_PROCESSING, TASK_STATUS_COMPLETED, TASK_STATUS_CANCELED, TASK_STATUS_FAILED]
+
+TASK_TYPE_DEFAULT = "default"
+TASK_QUEUE_DEFAULT = "default"
 
 class TaskCreate(BaseModel):
     content: str
+    type: str = TASK_TYPE_DEFAULT
+    queue: str = TASK_QUEUE_DEFAULT
+    run_at: Optional[datetime] = None
+    delay_seconds: Optional[float] = None
 
 class TaskResponse(BaseModel):
     id: str
     content: str
+    type: str = TASK_TYPE_DEFAULT
+    queue: str = TASK_QUEUE_DEFAULT
     status: str
+    run_at: Optional[datetime] = None
+    failed_attempts: int = 0
+    last_error: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class TaskBatchResponse(BaseModel):
+    tasks: List[TaskResponse]
+
+class TaskStatusResponse(BaseModel):
+    # tasks in full, or only their statuses by id in the compact mode
+    tasks: Optional[List[TaskResponse]] = None
+    statuses: Optional[Dict[str, str]] = None
+    missing: List[str] = []
+
+class TaskListResponse(BaseModel):
+    tasks: List[TaskResponse]
+    next_cursor: Optional[str] = None
+
+class TaskReplayResponse(BaseModel):
+    replayed: int
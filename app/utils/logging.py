@@ -1,36 +1,154 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Tuple
 from app.core.config import settings
 
 # create logs directory if not exists
 os.makedirs(os.path.dirname(settings.log_file_path), exist_ok=True)
 
-def setup_logger(name: str, level: int = settings.log_level.upper()) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+# logging modes
+LOG_MODE_SYNC = "sync"    # handlers write on the calling thread
+LOG_MODE_QUEUE = "queue"  # records are queued, a listener thread does the I/O
 
-    # remove existing handlers to avoid duplicate logs
-    if logger.hasHandlers():
-        logger.handlers.clear()
+# log formats
+LOG_FORMAT_TEXT = "text"
+LOG_FORMAT_JSON = "json"
 
-    # set log format
-    formatter = logging.Formatter(
-        "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
-    )
+# attributes every LogRecord has, anything else was passed with extra=
+RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line, fields passed with extra= are kept as fields
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+class SamplingFilter(logging.Filter):
+    # keep only a share of info and debug records, warnings and errors always pass
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+# handlers shared by every logger of the process, created on first use
+_handlers: List[logging.Handler] = []
+_queue_handler: QueueHandler = None
+# every queue handler of the process with the listener doing its I/O
+_listeners: List[Tuple[QueueHandler, QueueListener]] = []
+
+def create_handlers() -> List[logging.Handler]:
+    if settings.log_format == LOG_FORMAT_JSON:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
     # console handler
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # file handler (rotate every 5MB)
     file_handler = RotatingFileHandler(
         settings.log_file_path, maxBytes=5 * 1024 * 1024, backupCount=5
     )
-    file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    return [console_handler, file_handler]
+
+def start_listener(queue_handler: QueueHandler, handlers: List[logging.Handler]):
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append((queue_handler, listener))
+
+def stop_listener():
+    # flush queued records on exit
+    for _, listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+def restart_listener():
+    # a forked child inherits the queues but not the listener threads
+    listeners = list(_listeners)
+    _listeners.clear()
+    for queue_handler, listener in listeners:
+        queue_handler.queue = queue.SimpleQueue()
+        start_listener(queue_handler, list(listener.handlers))
+
+def queue_handler(handlers: List[logging.Handler]) -> QueueHandler:
+    # the caller only puts the record on a queue, a listener thread runs the handlers
+    if not _listeners:
+        atexit.register(stop_listener)
+        os.register_at_fork(after_in_child=restart_listener)
+    handler = QueueHandler(queue.SimpleQueue())
+    start_listener(handler, handlers)
+    return handler
+
+def get_handlers() -> List[logging.Handler]:
+    global _queue_handler
+    if not _handlers:
+        _handlers.extend(create_handlers())
+        if settings.log_mode == LOG_MODE_QUEUE:
+            _queue_handler = queue_handler(_handlers)
+
+    if _queue_handler is not None:
+        return [_queue_handler]
+    return _handlers
+
+def logger_level(name: str, default: str) -> str:
+    # the most specific entry of LOG_LEVELS wins, e.g. "sqlalchemy" applies to "sqlalchemy.engine"
+    parts = name.split(".")
+    for i in range(len(parts), 0, -1):
+        level = settings.log_levels.get(".".join(parts[:i]))
+        if level:
+            return level.upper()
+    return default.upper()
+
+def setup_logger(name: str, level: str = settings.log_level) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(logger_level(name, level))
+
+    # remove existing handlers to avoid duplicate logs
+    if logger.hasHandlers():
+        logger.handlers.clear()
+    logger.filters.clear()
+
+    for handler in get_handlers():
+        logger.addHandler(handler)
+
+    # sample high-volume info lines before they are formatted or queued
+    if settings.log_sample_rate < 1:
+        logger.addFilter(SamplingFilter(settings.log_sample_rate))
+
+    return logger
+
+def setup_file_logger(name: str, path: str) -> logging.Logger:
+    # a logger writing bare messages to its own rotating file, e.g. exported spans
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if logger.hasHandlers():
+        logger.handlers.clear()
 
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=5)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    if settings.log_mode == LOG_MODE_QUEUE:
+        handler = queue_handler([handler])
+    logger.addHandler(handler)
     return logger
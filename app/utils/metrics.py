@@ -1,25 +1,157 @@
-from prometheus_client import Counter, Gauge, Histogram
+import glob
+import os
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+from prometheus_client import multiprocess
 
-# task status
-metrics_task_status = Gauge("task_status", "Task status", ["status"])
+# in multiprocess mode every metric opens its file when it is defined, a missing directory would fail the import
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# task status, the current count per status is sampled by app/utils/metrics_snapshot.py
+metrics_task_status_change_count = Counter("task_status_change_count", "Tasks moved to a status", ["status"])
 
 # task operation
 metrics_task_create_request_count = Counter("task_create_request_count", "Task create request counter")
 metrics_task_create_success_count = Counter("task_create_success_count", "Task create success counter")
 metrics_task_create_fail_count = Counter("task_create_fail_count", "Task create fail counter")
+metrics_task_create_batch_task_count = Counter("task_create_batch_task_count", "Tasks submitted in create batches")
+metrics_task_create_batch_size = Histogram("task_create_batch_size", "Task create batch size", buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000))
+metrics_task_create_batch_duration = Histogram("task_create_batch_duration", "Task create batch duration")
 metrics_task_get_request_count = Counter("task_get_request_count", "Task get request counter")
+metrics_task_status_request_count = Counter("task_status_request_count", "Task bulk status request counter")
+metrics_task_status_lookup_size = Histogram(
+    "task_status_lookup_size", "Task ids per bulk status request", buckets=(1, 10, 50, 100, 500, 1000, 2500, 5000, 10000)
+)
+metrics_task_list_request_count = Counter("task_list_request_count", "Task list request counter")
+metrics_task_export_row_count = Counter("task_export_row_count", "Task export row counter")
+metrics_task_events_request_count = Counter("task_events_request_count", "Task event stream request counter")
+metrics_task_dedup_count = Counter("task_dedup_count", "Task create dedup lookups", ["kind", "result"])
+metrics_task_admission_reject_count = Counter("task_admission_reject_count", "Task submissions rejected by admission control", ["reason"])
 metrics_task_cancel_request_count = Counter("task_cancel_request_count", "Task cancel request counter")
 metrics_task_cancel_success_count = Counter("task_cancel_success_count", "Task cancel success counter")
 metrics_task_cancel_fail_count = Counter("task_cancel_fail_count", "Task cancel fail counter")
+metrics_task_cancel_running_count = Counter("task_cancel_running_count", "Running tasks stopped by a cancel")
+metrics_task_cancel_skipped_count = Counter("task_cancel_skipped_count", "Canceled tasks skipped at dequeue")
+metrics_task_cancel_reclaimed_seconds = Counter(
+    "task_cancel_reclaimed_seconds", "Estimated worker seconds freed by stopping canceled async handlers"
+)
+
+# task cache
+metrics_task_cache_hit_count = Counter("task_cache_hit_count", "Task cache hit counter", ["tier"])
+metrics_task_cache_miss_count = Counter("task_cache_miss_count", "Task cache miss counter")
+metrics_task_cache_eviction_count = Counter("task_cache_eviction_count", "Task local cache eviction counter", ["reason"])
+
+# task archive
+metrics_task_archive_row_count = Counter("task_archive_row_count", "Tasks moved out of the task table", ["action"])
+metrics_task_archive_run_duration = Histogram(
+    "task_archive_run_duration", "Task archive run duration", buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+)
+metrics_task_archive_last_run_rows = Gauge(
+    "task_archive_last_run_rows", "Tasks moved by the last archive run", multiprocess_mode="mostrecent"
+)
+
+# task events
+metrics_task_event_publish_count = Counter("task_event_publish_count", "Task event publish counter")
+metrics_task_event_publish_fail_count = Counter("task_event_publish_fail_count", "Task event publish fail counter")
+metrics_task_event_subscribers = Gauge(
+    "task_event_subscribers", "Open task event streams", multiprocess_mode="livesum"
+)
 
 # task processing
-metrics_task_processing_duration = Histogram("task_processing_duration", "Task processing duration")
+metrics_task_handler_duration = Histogram("task_handler_duration", "Task handler duration", ["type"])
+metrics_task_claim_duration = Histogram("task_claim_duration", "Time to claim a task, from the status update to its commit")
+metrics_task_total_duration = Histogram(
+    "task_total_duration", "Time from task submission to completion", ["queue"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+)
+metrics_task_slow_count = Counter("task_slow_count", "Handler runs slower than the profiling threshold")
+metrics_task_profile_count = Counter("task_profile_count", "Handler runs profiled")
 metrics_task_processing_success_count = Counter("task_processing_success_count", "Task processing success counter")
 metrics_task_processing_fail_count = Counter("task_processing_fail_count", "Task processing fail counter")
 
-# queue
-metrics_queue_length = Gauge("queue_length", "Queue length")
+# task retry
+metrics_task_retry_count = Counter("task_retry_count", "Failed task attempts scheduled for a retry")
+metrics_task_dead_letter_count = Counter("task_dead_letter_count", "Tasks failed after their last attempt")
+metrics_task_replay_count = Counter("task_replay_count", "Dead-lettered tasks replayed")
+metrics_task_lease_expired_count = Counter("task_lease_expired_count", "Processing tasks whose lease expired")
+
+# database
+metrics_db_commit_duration = Histogram(
+    "db_commit_duration", "Database commit duration", ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+metrics_db_pool_wait_duration = Histogram(
+    "db_pool_wait_duration", "Time to get a connection from the database pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+metrics_db_pool_checked_out = Gauge(
+    "db_pool_checked_out", "Database connections checked out of the pool", multiprocess_mode="livesum"
+)
+metrics_db_pool_overflow = Gauge(
+    "db_pool_overflow", "Database connections opened above the pool size", multiprocess_mode="livesum"
+)
+metrics_db_pool_capacity = Gauge(
+    "db_pool_capacity", "Database connections the pool may open, its size and max overflow", multiprocess_mode="livesum"
+)
+
+# consumer
+metrics_consumer_workers = Gauge("consumer_workers", "Running consumer workers", multiprocess_mode="livesum")
+metrics_consumer_workers_target = Gauge(
+    "consumer_workers_target", "Consumer workers targeted by the autoscaler", multiprocess_mode="livesum"
+)
+metrics_consumer_scale_count = Counter("consumer_scale_count", "Autoscaler changes of the consumer workers", ["direction"])
+metrics_consumer_in_flight = Gauge("consumer_in_flight", "Tasks in flight in prefetch consumer workers", multiprocess_mode="livesum")
+metrics_consumer_buffer_depth = Gauge("consumer_buffer_depth", "Tasks prefetched and waiting for a slot", multiprocess_mode="livesum")
+metrics_consumer_slot_utilization = Gauge(
+    "consumer_slot_utilization", "Ratio of busy prefetch consumer slots of the process", multiprocess_mode="liveall"
+)
+
+# queue, the queue lengths are sampled by app/utils/metrics_snapshot.py
+metrics_queue_wait_time = Histogram("queue_wait_time", "Time tasks wait in the queue", ["queue"])
 metrics_queue_push_count = Counter("queue_push_count", "Queue push counter")
 metrics_queue_push_fail_count = Counter("queue_push_fail_count", "Queue push fail counter")
 metrics_queue_pop_count = Counter("queue_pop_count", "Queue pop counter")
 metrics_queue_pop_fail_count = Counter("queue_pop_fail_count", "Queue pop fail counter")
+metrics_queue_ack_count = Counter("queue_ack_count", "Queue ack counter")
+metrics_queue_ack_fail_count = Counter("queue_ack_fail_count", "Queue ack fail counter")
+metrics_queue_reclaim_count = Counter("queue_reclaim_count", "Queue stale entry reclaim counter")
+metrics_queue_scheduled_count = Counter("queue_scheduled_count", "Scheduled task counter")
+
+# task outbox, the outbox length is sampled by app/utils/metrics_snapshot.py
+metrics_task_outbox_relay_count = Counter("task_outbox_relay_count", "Outbox rows relayed to the queues")
+metrics_task_outbox_relay_fail_count = Counter("task_outbox_relay_fail_count", "Outbox relay batches failed and retried")
+metrics_task_outbox_relay_lag = Histogram(
+    "task_outbox_relay_lag", "Delay between the commit of a created task and its push to the queue",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+# scheduled task
+metrics_task_schedule_lag = Histogram(
+    "task_schedule_lag", "Delay between the due time of a scheduled task and its promotion to the ready queue",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+# multiprocess mode, enabled by PROMETHEUS_MULTIPROC_DIR: every process writes its metrics to files
+# in that directory and a scrape aggregates them
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+def multiprocess_registry() -> CollectorRegistry:
+    # a fresh registry per scrape, the default one only holds this process's values
+    if not multiprocess_enabled():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def clear_multiprocess_dir():
+    # files left by a previous run would be added to the new totals
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for file in glob.glob(os.path.join(path, "*.db")):
+        os.remove(file)
+
+def mark_process_dead(pid: int = None):
+    # drop the live gauges of an exited process
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Dict
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector, CollectorRegistry
+from redis.exceptions import ResponseError
+from app.core.config import settings
+from app.db.models import Task, TaskOutbox
+from app.db.models import async_session
+from app.queue.delay_queue import scheduled_key
+from app.queue.redis_client import redis
+from app.queue.redis_queue import queue_key, use_stream
+from app.queue.redis_stream import stream_key
+from app.schemas import TASK_STATUSES
+from app.utils.logging import setup_logger
+from app.utils.metrics import REGISTRY, multiprocess_enabled, multiprocess_registry
+
+logger = setup_logger(__name__)
+
+async def sample_queues() -> Dict[str, Dict[str, int]]:
+    # one pipeline for every queue: ready tasks, tasks delivered but not acked, scheduled tasks
+    queues = list(settings.task_queues)
+    async with redis.pipeline(transaction=False) as pipe:
+        for queue in queues:
+            if use_stream():
+                pipe.xlen(stream_key(queue))
+                pipe.xinfo_groups(stream_key(queue))
+            else:
+                pipe.llen(queue_key(queue))
+            pipe.zcard(scheduled_key(queue))
+        results = await pipe.execute(raise_on_error=False)
+
+    samples = {}
+    for queue in queues:
+        if use_stream():
+            # acked entries are deleted, so the stream holds the ready and the pending entries
+            length, groups = results.pop(0), results.pop(0)
+            if isinstance(length, Exception):
+                raise length
+            if isinstance(groups, ResponseError):
+                groups = []  # the stream does not exist yet
+            elif isinstance(groups, Exception):
+                raise groups
+            pending = sum(group["pending"] for group in groups if group["name"] == settings.queue_stream_group)
+            ready = length - pending
+        else:
+            ready, pending = results.pop(0), 0
+            if isinstance(ready, Exception):
+                raise ready
+        scheduled = results.pop(0)
+        if isinstance(scheduled, Exception):
+            raise scheduled
+        samples[queue] = {"ready": ready, "pending": pending, "scheduled": scheduled}
+    return samples
+
+async def sample_task_statuses() -> Dict[str, int]:
+    async with async_session() as db:
+        counts = await Task.count_by_status(db)
+    # report every status, a status without tasks is 0 rather than missing
+    return {status: counts.get(status, 0) for status in TASK_STATUSES}
+
+async def sample_outbox() -> int:
+    async with async_session() as db:
+        return await TaskOutbox.count(db)
+
+class MetricsSnapshot(Collector):
+    # queue lengths and task counts read from Redis and the database, the same for every process;
+    # sampled at most once per ttl so frequent scrapes stay cheap
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.queues: Dict[str, Dict[str, int]] = {}
+        self.statuses: Dict[str, int] = {}
+        self.outbox = 0
+        self.sampled_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def fresh(self) -> bool:
+        return time.time() - self.sampled_at < self.ttl
+
+    async def refresh(self):
+        if self.fresh():
+            return
+        async with self.lock:
+            # a concurrent scrape may have sampled while this one waited
+            if self.fresh():
+                return
+            try:
+                self.queues, self.statuses, self.outbox = await asyncio.gather(
+                    sample_queues(), sample_task_statuses(), sample_outbox()
+                )
+            except Exception as e:
+                # keep the last snapshot, its age shows it is stale
+                logger.error(f"Metrics snapshot error: {e}")
+                return
+            self.sampled_at = time.time()
+
+    def collect(self):
+        if not self.sampled_at:
+            return
+
+        queue_length = GaugeMetricFamily("queue_length", "Tasks ready in the queue", labels=["queue"])
+        queue_pending = GaugeMetricFamily("queue_pending", "Tasks delivered to a consumer and not acked yet", labels=["queue"])
+        queue_scheduled = GaugeMetricFamily("queue_scheduled_length", "Scheduled tasks not promoted yet", labels=["queue"])
+        for queue, sample in self.queues.items():
+            queue_length.add_metric([queue], sample["ready"])
+            queue_pending.add_metric([queue], sample["pending"])
+            queue_scheduled.add_metric([queue], sample["scheduled"])
+
+        task_status = GaugeMetricFamily("task_status", "Tasks per status", labels=["status"])
+        for status, count in self.statuses.items():
+            task_status.add_metric([status], count)
+
+        yield queue_length
+        yield queue_pending
+        yield queue_scheduled
+        yield task_status
+        yield GaugeMetricFamily("task_outbox_length", "Created tasks not relayed to their queue yet", value=self.outbox)
+        yield GaugeMetricFamily("metrics_snapshot_age", "Seconds since queues and tasks were sampled", value=time.time() - self.sampled_at)
+
+metrics_snapshot = MetricsSnapshot(settings.metrics_snapshot_ttl)
+
+# in multiprocess mode the registry is built per scrape, otherwise the snapshot joins the default one
+if not multiprocess_enabled():
+    REGISTRY.register(metrics_snapshot)
+
+def metrics_registry() -> CollectorRegistry:
+    registry = multiprocess_registry()
+    if registry is not REGISTRY:
+        registry.register(metrics_snapshot)
+    return registry
@@ -0,0 +1,76 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+from contextlib import asynccontextmanager
+from app.core.config import settings
+from app.utils.logging import setup_logger
+from app.utils.metrics import metrics_task_profile_count, metrics_task_slow_count
+
+logger = setup_logger(__name__)
+
+class TaskProfiler:
+    # while enabled, time every handler run and cProfile a sample of them, keeping the profiles of slow ones;
+    # one profile at a time, it sees the whole event loop thread but not thread or process pool handlers
+    def __init__(self, enabled: bool, sample_rate: float, slow_threshold: float, path: str):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.path = path
+        self.active = False
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        logger.warning(f"Task profiling {'enabled' if self.enabled else 'disabled'}.")
+
+    def dump(self, profile: cProfile.Profile, task_id: str) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"{task_id}.prof")
+        profile.dump_stats(path)
+
+        # the top functions by cumulative time, for a first look without pstats
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(10)
+        logger.info(f"Task {task_id} profile:\n{output.getvalue()}")
+        return path
+
+    @asynccontextmanager
+    async def profile(self, task):
+        if not self.enabled:
+            yield
+            return
+
+        profile = None
+        if not self.active and random.random() < self.sample_rate:
+            self.active = True
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            if profile:
+                profile.disable()
+                self.active = False
+
+            if duration >= self.slow_threshold:
+                metrics_task_slow_count.inc()
+                message = f"Slow task {task.id} took {duration:.3f}s"
+                if profile:
+                    # writing the profile is file I/O, keep it off the event loop
+                    path = await asyncio.to_thread(self.dump, profile, task.id)
+                    metrics_task_profile_count.inc()
+                    message += f", profile saved to {path}"
+                logger.warning(message, extra={"task_id": task.id, "duration": round(duration, 6)})
+
+task_profiler = TaskProfiler(
+    settings.task_profile_enabled,
+    settings.task_profile_sample_rate,
+    settings.task_profile_slow_threshold,
+    settings.task_profile_dir,
+)
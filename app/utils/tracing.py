@@ -0,0 +1,122 @@
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional, Tuple
+from app.core.config import settings
+from app.utils.logging import setup_logger, setup_file_logger
+
+logger = setup_logger(__name__)
+
+# span exporters
+TRACING_EXPORTER_FILE = "file"        # one JSON object per span in TRACING_FILE_PATH
+TRACING_EXPORTER_CONSOLE = "console"  # spans logged through the regular log handlers
+
+class Span:
+    # a timed operation of a trace, in the shape of an OpenTelemetry span
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self.end = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        # w3c trace context, carried by queue messages
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration": round(self.end - self.start, 6) if self.end else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_span_logger = None
+
+def parse_traceparent(traceparent: Optional[str]) -> Optional[Tuple[str, str]]:
+    # (trace_id, parent span_id), None for a missing or malformed header
+    if not traceparent:
+        return None
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def current_traceparent() -> Optional[str]:
+    span = _current_span.get()
+    return span.traceparent() if span else None
+
+def set_span_attribute(key: str, value):
+    span = _current_span.get()
+    if span:
+        span.set_attribute(key, value)
+
+def export_span(span: Span):
+    global _span_logger
+    if _span_logger is None:
+        if settings.tracing_exporter == TRACING_EXPORTER_CONSOLE:
+            _span_logger = setup_logger("app.tracing.spans", "info")
+        else:
+            _span_logger = setup_file_logger("app.tracing.spans", settings.tracing_file_path)
+    _span_logger.info(json.dumps(span.to_dict(), default=str))
+
+@contextmanager
+def start_span(name: str, traceparent: str = None, **attributes) -> Iterator[Optional[Span]]:
+    # child of the current span, else of the given traceparent, else the root of a new trace
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    parent = _current_span.get()
+    context = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif context:
+        trace_id, parent_id = context
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+
+    span = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.set_attribute("error", str(e) or type(e).__name__)
+        raise
+    finally:
+        span.end = time.time()
+        _current_span.reset(token)
+        try:
+            export_span(span)
+        except Exception as e:
+            logger.error(f"Span export error: {e}")
+
+def traced(name: str) -> Callable:
+    # run a coroutine function in a span of its own
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with start_span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,59 @@
+# measures the time a logger.info call blocks its caller, i.e. the event loop;
+# sync mode is the previous behavior, queue mode hands the record to a listener thread
+#
+#   python -m benchmarks.logging_overhead --calls 20000
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from app.core.config import settings
+from app.utils import logging as app_logging
+
+def reset_handlers():
+    app_logging.stop_listener()
+    for handler in app_logging._handlers:
+        handler.close()
+    app_logging._handlers.clear()
+    app_logging._queue_handler = None
+
+def measure(mode: str, log_format: str, calls: int, log_dir: str) -> float:
+    settings.log_mode = mode
+    settings.log_format = log_format
+    settings.log_file_path = os.path.join(log_dir, f"{mode}-{log_format}.log")
+    settings.log_sample_rate = 1.0
+    reset_handlers()
+
+    # the console handler binds sys.stderr when created, keep the benchmark output readable
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stderr(devnull):
+            logger = app_logging.setup_logger(f"benchmark.{mode}.{log_format}", "info")
+
+        start = time.perf_counter()
+        for i in range(calls):
+            logger.info(f"Task {i} completed.", extra={"task_id": str(i), "status": "completed", "duration": 0.001})
+        elapsed = time.perf_counter() - start
+
+        # drain the queue outside of the measured section
+        reset_handlers()
+    return elapsed / calls * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.logging_overhead", description="Per-call logging overhead.")
+    parser.add_argument("--calls", type=int, default=20000, help="log calls per configuration")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        results = {}
+        for mode in (app_logging.LOG_MODE_SYNC, app_logging.LOG_MODE_QUEUE):
+            for log_format in (app_logging.LOG_FORMAT_TEXT, app_logging.LOG_FORMAT_JSON):
+                results[(mode, log_format)] = measure(mode, log_format, args.calls, log_dir)
+
+    print(f"{'mode':<8}{'format':<8}{'us/call':>10}")
+    for (mode, log_format), per_call in results.items():
+        print(f"{mode:<8}{log_format:<8}{per_call:>10.2f}")
+    sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
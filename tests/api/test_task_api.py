@@ -2,14 +2,35 @@ import pytest
 from unittest import mock
 from fastapi import HTTPException
 import pytest_asyncio
-from app.api.task_api import create_task, get_task, cancel_task
-from app.schemas import TaskCreate
+from datetime import datetime
+from app.api.task_api import (
+    create_task,
+    create_tasks,
+    get_task,
+    get_task_statuses,
+    cancel_task,
+    current_task,
+    replay_failed,
+    admit,
+    stream_task_events,
+    list_tasks,
+    encode_cursor,
+    decode_cursor
+)
+from sqlalchemy.exc import IntegrityError
+from app.schemas import TaskCreate, TaskResponse
 
 @pytest_asyncio.fixture
 def mock_task():
     with mock.patch('app.api.task_api.Task') as MockTask:
         yield MockTask
 
+@pytest_asyncio.fixture(autouse=True)
+def mock_archive():
+    with mock.patch('app.api.task_api.TaskArchive') as MockTaskArchive:
+        MockTaskArchive.get = mock.AsyncMock(return_value=None)
+        yield MockTaskArchive
+
 @pytest_asyncio.fixture
 def mock_db():
     with mock.patch('app.api.task_api.async_session') as MockSession:
@@ -20,21 +41,138 @@ def mock_logger():
     with mock.patch('app.api.task_api.logger') as MockLogger:
         yield MockLogger
 
+@pytest_asyncio.fixture(autouse=True)
+def mock_cache():
+    with mock.patch('app.api.task_api.get_cached_task', mock.AsyncMock(return_value=None)) as MockGetCached, \
+         mock.patch('app.api.task_api.cache_task', mock.AsyncMock()), \
+         mock.patch('app.api.task_api.cache_tasks', mock.AsyncMock()), \
+         mock.patch('app.api.task_api.publish_task_event', mock.AsyncMock()):
+        yield MockGetCached
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_unschedule():
+    with mock.patch('app.api.task_api.unschedule_task', mock.AsyncMock()) as MockUnschedule:
+        yield MockUnschedule
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_outbox():
+    with mock.patch('app.api.task_api.TaskOutbox') as MockTaskOutbox, \
+         mock.patch('app.api.task_api.notify_relay'), \
+         mock.patch('app.api.task_api.current_traceparent', return_value="00-trace-span-01"):
+        MockTaskOutbox.add_many = mock.AsyncMock()
+        yield MockTaskOutbox
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_claim_key():
+    async def claim_key(kind, key, task_id, ttl):
+        return task_id
+
+    with mock.patch('app.api.task_api.claim_key', mock.AsyncMock(side_effect=claim_key)) as MockClaimKey, \
+         mock.patch('app.api.task_api.release_key', mock.AsyncMock()):
+        yield MockClaimKey
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_backlog():
+    with mock.patch('app.api.task_api.backlog_cache') as MockBacklogCache:
+        MockBacklogCache.sample = mock.Mock(return_value=(0, 0.0))
+        yield MockBacklogCache
+
+@pytest_asyncio.fixture
+def mock_take_tokens():
+    with mock.patch('app.api.task_api.take_tokens', mock.AsyncMock(return_value=(True, 0.0))) as MockTakeTokens, \
+         mock.patch('app.api.task_api.settings.task_rate_limit', 10.0), \
+         mock.patch('app.api.task_api.settings.task_rate_limit_burst', 20):
+        yield MockTakeTokens
+
+def client_request(api_key=None, host="10.0.0.1"):
+    return mock.Mock(headers={"X-API-Key": api_key} if api_key else {}, client=mock.Mock(host=host))
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_mark_canceled():
+    with mock.patch('app.api.task_api.mark_canceled', mock.AsyncMock()) as MockMarkCanceled:
+        yield MockMarkCanceled
+
 @pytest.mark.asyncio
-async def test_create_task_success(mock_task, mock_db, mock_logger):
+async def test_create_task_success(mock_task, mock_db, mock_logger, mock_outbox):
     task_create = TaskCreate(content="test content")
-    new_task = mock.Mock()
+    new_task = mock.Mock(id="1", queue="default")
     mock_task.return_value = new_task
     db = mock_db.return_value.__aenter__.return_value
 
-    with mock.patch('app.api.task_api.enqueue_task'):
-        result = await create_task(task_create, db)
+    with mock.patch('app.api.task_api.notify_relay') as mock_notify:
+        result = await create_task(task_create, db, mock.Mock(), None)
+
+    # the task and its queue push are committed together
+    mock_outbox.assert_called_once_with("1", "default", run_at=None, trace="00-trace-span-01")
+    db.add.assert_has_calls([mock.call(new_task), mock.call(mock_outbox.return_value)])
+    db.commit.assert_awaited_once()
+    db.refresh.assert_not_called()
+    mock_notify.assert_called_once()
+    mock_logger.info.assert_called_with(
+        f"Task created with ID: {new_task.id}", extra={"task_id": new_task.id, "status": new_task.status}
+    )
+    assert result == new_task
+
+@pytest.mark.asyncio
+async def test_create_task_unknown_type(mock_task, mock_db, mock_logger):
+    task_create = TaskCreate(content="test content", type="unknown")
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_task(task_create, db, mock.Mock(), None)
+
+    assert exc_info.value.status_code == 400
+    mock_task.assert_not_called()
+    db.add.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_create_task_unknown_queue(mock_task, mock_db, mock_logger):
+    task_create = TaskCreate(content="test content", queue="unknown")
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_task(task_create, db, mock.Mock(), None)
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Unknown task queue"
+    mock_task.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_create_task_scheduled(mock_task, mock_db, mock_logger, mock_outbox):
+    task_create = TaskCreate(content="test content", delay_seconds=60)
+    new_task = mock.Mock(id="1", queue="default")
+    mock_task.return_value = new_task
+    db = mock_db.return_value.__aenter__.return_value
+
+    await create_task(task_create, db, mock.Mock(), None)
+
+    assert mock_task.call_args.kwargs["status"] == "scheduled"
+    run_at = mock_task.call_args.kwargs["run_at"]
+    assert run_at is not None
+    mock_outbox.assert_called_once_with("1", "default", run_at=run_at, trace="00-trace-span-01")
+
+@pytest.mark.asyncio
+async def test_create_task_past_run_at_is_ready(mock_task, mock_db, mock_logger, mock_outbox):
+    task_create = TaskCreate(content="test content", run_at="2020-01-01T00:00:00Z")
+    mock_task.return_value = mock.Mock(id="1", queue="default")
+    db = mock_db.return_value.__aenter__.return_value
+
+    await create_task(task_create, db, mock.Mock(), None)
 
-        db.add.assert_called_once_with(new_task)
-        db.commit.assert_awaited()
-        db.refresh.assert_awaited_with(new_task)
-        mock_logger.info.assert_called_with(f"Task created with ID: {new_task.id}")
-        assert result == new_task
+    assert mock_task.call_args.kwargs["status"] == "pending"
+    mock_outbox.assert_called_once_with("1", "default", run_at=None, trace="00-trace-span-01")
+
+@pytest.mark.asyncio
+async def test_create_task_invalid_schedule(mock_task, mock_db, mock_logger):
+    task_create = TaskCreate(content="test content", run_at="2030-01-01T00:00:00Z", delay_seconds=60)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_task(task_create, db, mock.Mock(), None)
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Only one of run_at and delay_seconds may be set"
+    mock_task.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_create_task_db_error(mock_task, mock_db, mock_logger):
@@ -45,32 +183,398 @@ async def test_create_task_db_error(mock_task, mock_db, mock_logger):
     db.commit = mock.AsyncMock(side_effect=Exception("commit error"))
 
     with pytest.raises(HTTPException) as exc_info:
-        await create_task(task_create, db)
+        await create_task(task_create, db, mock.Mock(), None)
 
     assert exc_info.value.status_code == 500
-    db.add.assert_called_once_with(new_task)
+    db.add.assert_any_call(new_task)
     db.commit.assert_awaited()
     db.rollback.assert_awaited()
     mock_logger.error.assert_called_with("Task creation error: commit error")
 
 @pytest.mark.asyncio
-async def test_create_task_enqueue_error(mock_task, mock_db, mock_logger):
+async def test_create_task_queue_down(mock_task, mock_db, mock_logger):
+    # the queue is only written by the relay, a create does not depend on it
     task_create = TaskCreate(content="test content")
-    new_task = mock.Mock()
+    new_task = mock.Mock(id="1", queue="default")
     mock_task.return_value = new_task
     db = mock_db.return_value.__aenter__.return_value
-    db.commit = mock.AsyncMock()
-    db.refresh = mock.AsyncMock()
-    with mock.patch('app.api.task_api.enqueue_task', mock.AsyncMock(side_effect=Exception("enqueue error"))):
+
+    with mock.patch('app.queue.redis_queue.redis') as mock_redis:
+        mock_redis.rpush = mock.AsyncMock(side_effect=Exception("connection error"))
+        result = await create_task(task_create, db, mock.Mock(), None)
+
+    assert result == new_task
+    mock_redis.rpush.assert_not_called()
+    db.commit.assert_awaited_once()
+    db.delete.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key_new(mock_task, mock_db, mock_logger, mock_claim_key):
+    task_create = TaskCreate(content="test content")
+    new_task = mock.Mock(id="1", queue="default")
+    mock_task.return_value = new_task
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_idempotency_ttl', 60):
+        result = await create_task(task_create, db, mock.Mock(), "abc")
+
+    assert result == new_task
+    assert mock_task.call_args.kwargs["idempotency_key"] == "abc"
+    mock_claim_key.assert_awaited_once_with("key", "abc", "1", 60)
+    db.add.assert_any_call(new_task)
+
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key_replayed(mock_task, mock_db, mock_logger, mock_claim_key, mock_cache):
+    task_create = TaskCreate(content="test content")
+    mock_task.return_value = mock.Mock(id="1")
+    existing = mock.Mock(id="0", content="test content", type="default", queue="default")
+    mock_claim_key.side_effect = None
+    mock_claim_key.return_value = "0"
+    mock_cache.return_value = existing
+    response = mock.Mock(headers={})
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await create_task(task_create, db, response, "abc")
+
+    assert result == existing
+    assert response.headers["Idempotent-Replayed"] == "true"
+    mock_cache.assert_awaited_once_with("0")
+    db.add.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key_in_progress(mock_task, mock_db, mock_logger, mock_claim_key):
+    mock_task.return_value = mock.Mock(id="1")
+    mock_task.get = mock.AsyncMock(return_value=None)
+    mock_claim_key.side_effect = None
+    mock_claim_key.return_value = "0"
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_task(TaskCreate(content="test content"), db, mock.Mock(), "abc")
+
+    assert exc_info.value.status_code == 409
+
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key_other_task(mock_task, mock_db, mock_logger, mock_claim_key, mock_cache):
+    mock_task.return_value = mock.Mock(id="1")
+    mock_claim_key.side_effect = None
+    mock_claim_key.return_value = "0"
+    mock_cache.return_value = mock.Mock(id="0", content="other content", type="default", queue="default")
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_task(TaskCreate(content="test content"), db, mock.Mock(), "abc")
+
+    assert exc_info.value.status_code == 422
+
+@pytest.mark.asyncio
+async def test_create_task_idempotency_key_unique_violation(mock_task, mock_db, mock_logger, mock_claim_key):
+    # redis is down, the database rejects the second task with the key
+    mock_task.return_value = mock.Mock(id="1")
+    existing = mock.Mock(id="0", content="test content", type="default", queue="default")
+    mock_task.get_by_idempotency_key = mock.AsyncMock(return_value=existing)
+    mock_task.get = mock.AsyncMock(return_value=existing)
+    mock_claim_key.side_effect = Exception("connection error")
+    db = mock_db.return_value.__aenter__.return_value
+    db.commit = mock.AsyncMock(side_effect=IntegrityError("insert", {}, Exception("duplicate key")))
+
+    result = await create_task(TaskCreate(content="test content"), db, mock.Mock(headers={}), "abc")
+
+    assert result == existing
+    db.rollback.assert_awaited()
+    mock_task.get_by_idempotency_key.assert_awaited_once_with("abc", db)
+
+@pytest.mark.asyncio
+async def test_create_task_error_releases_dedup_key(mock_task, mock_db, mock_logger):
+    mock_task.return_value = mock.Mock(id="1")
+    db = mock_db.return_value.__aenter__.return_value
+    db.commit = mock.AsyncMock(side_effect=Exception("commit error"))
+
+    with mock.patch('app.api.task_api.release_key', mock.AsyncMock()) as mock_release:
+        with pytest.raises(HTTPException):
+            await create_task(TaskCreate(content="test content"), db, mock.Mock(), "abc")
+
+    mock_release.assert_awaited_once_with("key", "abc")
+
+@pytest.mark.asyncio
+async def test_create_task_content_dedup(mock_task, mock_db, mock_logger, mock_claim_key):
+    task_create = TaskCreate(content="test content")
+    mock_task.return_value = mock.Mock(id="1", queue="default")
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_dedup_window', 30):
+        await create_task(task_create, db, mock.Mock(), None)
+
+    mock_claim_key.assert_awaited_once_with("content", mock.ANY, "1", 30)
+    # only a client key is kept in the database
+    assert mock_task.call_args.kwargs["idempotency_key"] is None
+
+@pytest.mark.asyncio
+async def test_create_task_without_dedup(mock_task, mock_db, mock_logger, mock_claim_key):
+    mock_task.return_value = mock.Mock(id="1", queue="default")
+    db = mock_db.return_value.__aenter__.return_value
+
+    await create_task(TaskCreate(content="test content"), db, mock.Mock(), None)
+
+    mock_claim_key.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_create_tasks_success(mock_task, mock_db, mock_logger, mock_outbox):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2"), TaskCreate(content="content 3", queue="high")]
+    new_tasks = [mock.Mock(id=str(i), queue=queue, run_at=None) for i, queue in [(1, "default"), (2, "default"), (3, "high")]]
+    mock_task.create_many = mock.AsyncMock(return_value=new_tasks)
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await create_tasks(tasks_create, db)
+
+    mock_task.create_many.assert_awaited_once_with(tasks_create, db)
+    mock_outbox.add_many.assert_awaited_once_with(new_tasks, "00-trace-span-01", db)
+    db.commit.assert_awaited_once()
+    db.refresh.assert_not_called()
+    mock_logger.info.assert_called_with("Task batch created with 3 tasks.")
+    assert result == {"tasks": new_tasks}
+
+@pytest.mark.asyncio
+async def test_create_tasks_scheduled(mock_task, mock_db, mock_logger):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2", delay_seconds=60)]
+    new_tasks = [mock.Mock(id="1", queue="default", run_at=None), mock.Mock(id="2", queue="default", run_at=mock.Mock())]
+    mock_task.create_many = mock.AsyncMock(return_value=new_tasks)
+    db = mock_db.return_value.__aenter__.return_value
+
+    await create_tasks(tasks_create, db)
+
+    created = mock_task.create_many.await_args.args[0]
+    assert created[0].run_at is None
+    assert created[1].run_at is not None and created[1].delay_seconds is None
+
+@pytest.mark.asyncio
+async def test_create_tasks_too_large(mock_task, mock_db, mock_logger):
+    tasks_create = [TaskCreate(content="test content")] * 3
+    mock_task.create_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_batch_max_size', 2):
         with pytest.raises(HTTPException) as exc_info:
-            await create_task(task_create, db)
+            await create_tasks(tasks_create, db)
 
-        assert exc_info.value.status_code == 500
-        db.add.assert_called_once_with(new_task)
-        db.commit.assert_awaited()
-        db.refresh.assert_awaited_with(new_task)
-        db.delete.assert_called_once_with(new_task)
-        mock_logger.error.assert_called_with("Task creation error: enqueue error")
+    assert exc_info.value.status_code == 413
+    mock_task.create_many.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_create_tasks_unknown_type(mock_task, mock_db, mock_logger):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2", type="unknown")]
+    mock_task.create_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_tasks(tasks_create, db)
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == [{"index": 1, "error": "Unknown task type"}]
+    mock_task.create_many.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_create_tasks_counts_batch_once(mock_task, mock_db, mock_logger):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2", type="unknown"), TaskCreate(content="content 3")]
+    mock_task.create_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.metrics_task_create_request_count') as mock_request_count, \
+         mock.patch('app.api.task_api.metrics_task_create_batch_task_count') as mock_task_count, \
+         mock.patch('app.api.task_api.metrics_task_create_fail_count') as mock_fail_count:
+        with pytest.raises(HTTPException):
+            await create_tasks(tasks_create, db)
+
+    # requests and failures are counted per call like on /task, the tasks separately
+    mock_request_count.inc.assert_called_once_with()
+    mock_task_count.inc.assert_called_once_with(3)
+    mock_fail_count.inc.assert_called_once_with()
+
+@pytest.mark.asyncio
+async def test_create_tasks_invalid_tasks(mock_task, mock_db, mock_logger):
+    tasks_create = [
+        TaskCreate(content="content 1", queue="unknown"),
+        TaskCreate(content="content 2"),
+        TaskCreate(content="content 3", delay_seconds=-1),
+        TaskCreate(content="content 4", type="unknown", queue="unknown"),
+    ]
+    mock_task.create_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_tasks(tasks_create, db)
+
+    # every invalid task is reported by its index, none of the batch is created
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == [
+        {"index": 0, "error": "Unknown task queue"},
+        {"index": 2, "error": "delay_seconds must not be negative"},
+        {"index": 3, "error": "Unknown task type"},
+    ]
+    mock_task.create_many.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_create_tasks_outbox_error(mock_task, mock_db, mock_logger, mock_outbox):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2")]
+    mock_task.create_many = mock.AsyncMock(return_value=[mock.Mock(id="1", run_at=None), mock.Mock(id="2", run_at=None)])
+    mock_outbox.add_many = mock.AsyncMock(side_effect=Exception("outbox error"))
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_tasks(tasks_create, db)
+
+    # nothing is committed, the tasks go with the failed outbox insert
+    assert exc_info.value.status_code == 500
+    db.commit.assert_not_awaited()
+    db.rollback.assert_awaited_once()
+    mock_logger.error.assert_called_with("Task batch creation error: outbox error")
+
+@pytest.mark.asyncio
+async def test_admit_backlog_full(mock_backlog, mock_logger):
+    mock_backlog.sample.return_value = (500, 0.0)
+
+    with mock.patch('app.api.task_api.settings.task_admission_max_backlog', 500), \
+         mock.patch('app.api.task_api.settings.task_admission_refresh_interval', 2.0):
+        with pytest.raises(HTTPException) as exc_info:
+            await admit(client_request(), 1)
+
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers == {"Retry-After": "2"}
+    mock_logger.warning.assert_called_with("Task submission rejected: Task backlog is full.")
+
+@pytest.mark.asyncio
+async def test_admit_wait_too_long(mock_backlog, mock_logger):
+    mock_backlog.sample.return_value = (10, 32.5)
+
+    with mock.patch('app.api.task_api.settings.task_admission_max_wait', 30.0):
+        with pytest.raises(HTTPException) as exc_info:
+            await admit(client_request(), 1)
+
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers == {"Retry-After": "3"}
+
+@pytest.mark.asyncio
+async def test_admit_guard_disabled(mock_backlog):
+    with mock.patch('app.api.task_api.settings.task_admission_max_backlog', 0), \
+         mock.patch('app.api.task_api.settings.task_admission_max_wait', 0):
+        await admit(client_request(), 1)
+
+    mock_backlog.sample.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_admit_rate_limit_per_client(mock_take_tokens):
+    await admit(client_request(api_key="abc"), 3)
+    await admit(client_request(host="10.0.0.2"), 1)
+
+    mock_take_tokens.assert_has_awaits([mock.call("key:abc", 10.0, 20, 3), mock.call("ip:10.0.0.2", 10.0, 20, 1)])
+
+@pytest.mark.asyncio
+async def test_admit_rate_limited(mock_take_tokens, mock_logger):
+    mock_take_tokens.return_value = (False, 0.2)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await admit(client_request(), 1)
+
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.detail == "Task rate limit exceeded"
+    assert exc_info.value.headers == {"Retry-After": "1"}
+
+@pytest.mark.asyncio
+async def test_admit_rate_limit_error_lets_in(mock_take_tokens, mock_logger):
+    mock_take_tokens.side_effect = Exception("connection error")
+
+    await admit(client_request(), 1)
+
+    mock_logger.warning.assert_called_with("Task rate limit error: connection error")
+
+@pytest.mark.asyncio
+async def test_create_tasks_rate_limited(mock_task, mock_db, mock_logger, mock_take_tokens):
+    tasks_create = [TaskCreate(content="content 1"), TaskCreate(content="content 2")]
+    mock_task.create_many = mock.AsyncMock()
+    mock_take_tokens.return_value = (False, 1.5)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await create_tasks(tasks_create, db, client_request())
+
+    # a batch costs one token per task
+    assert exc_info.value.status_code == 429
+    assert mock_take_tokens.await_args.args[3] == 2
+    mock_task.create_many.assert_not_awaited()
+
+def list_params(**kwargs):
+    params = {
+        "status_filter": None,
+        "created_after": None,
+        "created_before": None,
+        "cursor": None,
+        "limit": 50,
+        "order": "desc",
+        "output_format": "json",
+    }
+    params.update(kwargs)
+    return params
+
+def test_cursor_round_trip():
+    task = mock.Mock(id="123", created_at=datetime(2024, 1, 1, 12, 0, 0, 123456))
+
+    assert decode_cursor(encode_cursor(task)) == (task.created_at, "123")
+    with pytest.raises(ValueError):
+        decode_cursor("bad")
+
+@pytest.mark.asyncio
+async def test_list_tasks_next_page(mock_task, mock_db):
+    tasks = [mock.Mock(id=str(i), created_at=datetime(2024, 1, 1, 0, 0, i)) for i in range(3)]
+    mock_task.list_page = mock.AsyncMock(return_value=tasks)
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await list_tasks(**list_params(status_filter="pending", limit=2), db=db)
+
+    mock_task.list_page.assert_awaited_once_with(
+        db, 3, after=None, status="pending", created_after=None, created_before=None, descending=True
+    )
+    assert result["tasks"] == tasks[:2]
+    assert decode_cursor(result["next_cursor"]) == (tasks[1].created_at, "1")
+
+@pytest.mark.asyncio
+async def test_list_tasks_last_page(mock_task, mock_db):
+    cursor = encode_cursor(mock.Mock(id="9", created_at=datetime(2024, 1, 1)))
+    mock_task.list_page = mock.AsyncMock(return_value=[mock.Mock(id="1")])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_list_max_limit', 10):
+        result = await list_tasks(**list_params(cursor=cursor, limit=100, order="asc"), db=db)
+
+    mock_task.list_page.assert_awaited_once_with(
+        db, 11, after=(datetime(2024, 1, 1), "9"), status=None, created_after=None, created_before=None, descending=False
+    )
+    assert result["next_cursor"] is None
+
+@pytest.mark.asyncio
+async def test_list_tasks_invalid_filters(mock_task, mock_db):
+    db = mock_db.return_value.__aenter__.return_value
+
+    for params in [list_params(status_filter="unknown"), list_params(cursor="bad")]:
+        with pytest.raises(HTTPException) as exc_info:
+            await list_tasks(**params, db=db)
+        assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_list_tasks_export(mock_task, mock_db):
+    pages = [
+        [TaskResponse(id=str(i), content="content", status="pending", created_at=datetime(2024, 1, 1, 0, 0, i)) for i in range(2)],
+        [TaskResponse(id="2", content="content", status="pending", created_at=datetime(2024, 1, 1, 0, 0, 2))],
+    ]
+    mock_task.list_page = mock.AsyncMock(side_effect=pages)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_export_batch_size', 2):
+        response = await list_tasks(**list_params(output_format="ndjson"), db=db)
+        lines = [line async for line in response.body_iterator]
+
+    assert response.media_type == "application/x-ndjson"
+    assert [TaskResponse.model_validate_json(line).id for line in lines] == ["0", "1", "2"]
+    assert mock_task.list_page.await_args.kwargs["after"] == (pages[0][1].created_at, "1")
 
 @pytest.mark.asyncio
 async def test_get_task_not_found(mock_task, mock_db, mock_logger):
@@ -84,8 +588,119 @@ async def test_get_task_not_found(mock_task, mock_db, mock_logger):
     mock_task.get.assert_awaited_once_with("123", db)
     mock_logger.error.assert_called_with("Task 123 not found.")
 
+@pytest.mark.asyncio
+async def test_get_task_archived(mock_task, mock_db, mock_logger, mock_archive):
+    archived = mock.Mock(status="completed")
+    mock_task.get = mock.AsyncMock(return_value=None)
+    mock_archive.get = mock.AsyncMock(return_value=archived)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.cache_task', mock.AsyncMock()) as mock_cache_task:
+        result = await get_task("123", db)
+
+    assert result == archived
+    mock_archive.get.assert_awaited_once_with("123", db)
+    mock_cache_task.assert_awaited_once_with(archived)
+
+@pytest.mark.asyncio
+async def test_get_task_cache_hit(mock_task, mock_db, mock_logger, mock_cache):
+    cached_task = mock.Mock()
+    mock_cache.return_value = cached_task
+    mock_task.get = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await get_task("123", db)
+
+    mock_cache.assert_awaited_once_with("123")
+    mock_task.get.assert_not_awaited()
+    assert result == cached_task
+
+@pytest.mark.asyncio
+async def test_get_task_cache_miss(mock_task, mock_db, mock_logger):
+    task = mock.Mock()
+    mock_task.get = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.cache_task', mock.AsyncMock()) as mock_cache_task:
+        result = await get_task("123", db)
+
+    mock_task.get.assert_awaited_once_with("123", db)
+    mock_cache_task.assert_awaited_once_with(task)
+    assert result == task
+
+@pytest_asyncio.fixture
+def mock_cached_tasks():
+    with mock.patch('app.api.task_api.get_cached_tasks', mock.AsyncMock(return_value={})) as MockGetCachedTasks:
+        yield MockGetCachedTasks
+
+@pytest.mark.asyncio
+async def test_get_task_statuses(mock_task, mock_db, mock_archive, mock_cached_tasks):
+    cached = mock.Mock(id="1", status="completed")
+    found = mock.Mock(id="2", status="pending")
+    archived = mock.Mock(id="3", status="canceled")
+    mock_cached_tasks.return_value = {"1": cached}
+    mock_task.get_many = mock.AsyncMock(return_value=[found])
+    mock_archive.get_many = mock.AsyncMock(return_value=[archived])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.cache_tasks', mock.AsyncMock()) as mock_cache_tasks:
+        result = await get_task_statuses(["3", "1", "2", "4", "1"], False, db)
+
+    # only cache misses reach the database, ids still missing there are looked up in the archive
+    mock_cached_tasks.assert_awaited_once_with(["3", "1", "2", "4"])
+    mock_task.get_many.assert_awaited_once_with(["3", "2", "4"], db)
+    mock_archive.get_many.assert_awaited_once_with(["3", "4"], db)
+    mock_cache_tasks.assert_awaited_once_with([found, archived])
+    assert result == {"tasks": [archived, cached, found], "missing": ["4"]}
+
+@pytest.mark.asyncio
+async def test_get_task_statuses_compact(mock_task, mock_db, mock_cached_tasks):
+    mock_cached_tasks.return_value = {"1": mock.Mock(id="1", status="completed"), "2": mock.Mock(id="2", status="pending")}
+    mock_task.get_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await get_task_statuses(["2", "1"], True, db)
+
+    mock_task.get_many.assert_not_awaited()
+    assert result == {"statuses": {"2": "pending", "1": "completed"}, "missing": []}
+
+@pytest.mark.asyncio
+async def test_get_task_statuses_chunked(mock_task, mock_db, mock_archive, mock_cached_tasks):
+    mock_task.get_many = mock.AsyncMock(side_effect=lambda chunk, db: [mock.Mock(id=task_id, status="pending") for task_id in chunk])
+    mock_archive.get_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_status_chunk_size', 2):
+        result = await get_task_statuses(["1", "2", "3"], True, db)
+
+    assert mock_task.get_many.await_args_list == [mock.call(["1", "2"], db), mock.call(["3"], db)]
+    mock_archive.get_many.assert_not_awaited()
+    assert result["statuses"] == {"1": "pending", "2": "pending", "3": "pending"}
+
+@pytest.mark.asyncio
+async def test_get_task_statuses_too_many(mock_task, mock_db, mock_cached_tasks):
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.settings.task_status_max_ids', 2), pytest.raises(HTTPException) as exc_info:
+        await get_task_statuses(["1", "2", "3"], False, db)
+
+    assert exc_info.value.status_code == 413
+    mock_cached_tasks.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_get_task_statuses_db_error(mock_task, mock_db, mock_logger, mock_cached_tasks):
+    mock_task.get_many = mock.AsyncMock(side_effect=Exception("Database error"))
+    db = mock_db.return_value.__aenter__.return_value
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_task_statuses(["1"], False, db)
+
+    assert exc_info.value.status_code == 500
+    mock_logger.error.assert_called_with("Task status error: Database error")
+
 @pytest.mark.asyncio
 async def test_cancel_task_not_found(mock_task, mock_db, mock_logger):
+    mock_task.transition = mock.AsyncMock(return_value=None)
     mock_task.get = mock.AsyncMock(return_value=None)
     db = mock_db.return_value.__aenter__.return_value
 
@@ -93,6 +708,7 @@ async def test_cancel_task_not_found(mock_task, mock_db, mock_logger):
         await cancel_task("123", db)
 
     assert exc_info.value.status_code == 404
+    mock_task.transition.assert_awaited_once_with("123", "canceled", db)
     mock_task.get.assert_awaited_once_with("123", db)
     mock_logger.error.assert_called_with("Task 123 not found.")
 
@@ -100,6 +716,7 @@ async def test_cancel_task_not_found(mock_task, mock_db, mock_logger):
 async def test_cancel_task_already_completed(mock_task, mock_db, mock_logger):
     task = mock.Mock()
     task.status = "completed"
+    mock_task.transition = mock.AsyncMock(return_value=None)
     mock_task.get = mock.AsyncMock(return_value=task)
     db = mock_db.return_value.__aenter__.return_value
 
@@ -113,30 +730,127 @@ async def test_cancel_task_already_completed(mock_task, mock_db, mock_logger):
 @pytest.mark.asyncio
 async def test_cancel_task_success(mock_task, mock_db, mock_logger):
     task = mock.Mock()
-    task.status = "pending"
-    mock_task.get = mock.AsyncMock(return_value=task)
+    task.status = "canceled"
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    mock_task.get = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await cancel_task("123", db)
+
+    mock_task.transition.assert_awaited_once_with("123", "canceled", db)
+    mock_task.get.assert_not_awaited()
+    db.commit.assert_awaited_once()
+    db.refresh.assert_not_called()
+    mock_logger.info.assert_called_with("Task 123 canceled.", extra={"task_id": "123", "status": "canceled"})
+    assert result == task
+
+@pytest.mark.asyncio
+async def test_cancel_task_scheduled(mock_task, mock_db, mock_logger):
+    task = mock.Mock(id="123", queue="low", status="canceled")
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.unschedule_task', mock.AsyncMock()) as mock_unschedule:
+        await cancel_task("123", db)
+
+    mock_unschedule.assert_awaited_once_with("123", "low")
+
+@pytest.mark.asyncio
+async def test_cancel_task_propagates(mock_task, mock_db, mock_logger, mock_mark_canceled):
+    task = mock.Mock(id="123", status="canceled", run_at=None)
+    mock_task.transition = mock.AsyncMock(return_value=task)
     db = mock_db.return_value.__aenter__.return_value
 
     await cancel_task("123", db)
 
-    mock_task.get.assert_awaited_once_with("123", db)
-    assert task.status == "canceled"
-    db.commit.assert_awaited()
-    db.refresh.assert_awaited_with(task)
-    mock_logger.info.assert_called_with("Task 123 canceled.")
+    mock_mark_canceled.assert_awaited_once_with("123")
+
+@pytest.mark.asyncio
+async def test_cancel_task_propagation_error(mock_task, mock_db, mock_logger, mock_mark_canceled):
+    task = mock.Mock(id="123", status="canceled", run_at=None)
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    mock_mark_canceled.side_effect = Exception("connection error")
+    db = mock_db.return_value.__aenter__.return_value
+
+    result = await cancel_task("123", db)
+
+    # the task is canceled in the database either way
+    assert result == task
+    mock_logger.warning.assert_called_with("Task 123 cancel propagation error: connection error")
 
 @pytest.mark.asyncio
 async def test_cancel_task_exception(mock_task, mock_db, mock_logger):
-    task = mock.Mock()
-    task.status = "pending"
-    mock_task.get = mock.AsyncMock(return_value=task)
+    mock_task.transition = mock.AsyncMock(side_effect=Exception("update error"))
     db = mock_db.return_value.__aenter__.return_value
-    db.commit = mock.AsyncMock(side_effect=Exception("commit error"))
 
     with pytest.raises(HTTPException) as exc_info:
         await cancel_task("123", db)
 
     assert exc_info.value.status_code == 500
+    mock_task.transition.assert_awaited_once_with("123", "canceled", db)
+    db.rollback.assert_awaited()
+    mock_logger.error.assert_called_with("Task 123 cancel error: update error")
+
+@pytest.mark.asyncio
+async def test_current_task_terminal_from_cache(mock_task, mock_db, mock_cache):
+    cached = TaskResponse(id="123", content="content", status="completed", created_at=datetime(2024, 1, 1))
+    mock_cache.return_value = cached
+    mock_task.get = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    assert await current_task("123", db) == cached
+    mock_task.get.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_current_task_in_flight_from_db(mock_task, mock_db, mock_cache):
+    mock_cache.return_value = TaskResponse(id="123", content="content", status="pending", created_at=datetime(2024, 1, 1))
+    task = TaskResponse(id="123", content="content", status="processing", created_at=datetime(2024, 1, 1))
+    mock_task.get = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    assert (await current_task("123", db)).status == "processing"
     mock_task.get.assert_awaited_once_with("123", db)
-    db.commit.assert_awaited()
-    mock_logger.error.assert_called_with("Task 123 cancel error: commit error")
+
+@pytest.mark.asyncio
+async def test_stream_task_events(mock_task, mock_db, mock_logger):
+    task = TaskResponse(id="123", content="content", status="completed", created_at=datetime(2024, 1, 1))
+    mock_task.get = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.task_event_hub') as mock_hub:
+        response = await stream_task_events("123", db)
+        body = [chunk async for chunk in response.body_iterator]
+
+    mock_hub.subscribe.assert_called_once_with("123")
+    assert response.media_type == "text/event-stream"
+    assert body == [f"event: status\ndata: {task.model_dump_json()}\n\n"]
+
+@pytest.mark.asyncio
+async def test_stream_task_events_not_found(mock_task, mock_db, mock_logger):
+    mock_task.get = mock.AsyncMock(return_value=None)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.api.task_api.task_event_hub') as mock_hub:
+        with pytest.raises(HTTPException) as exc_info:
+            await stream_task_events("123", db)
+
+    assert exc_info.value.status_code == 404
+    mock_hub.unsubscribe.assert_called_once_with("123", mock_hub.subscribe.return_value)
+
+@pytest.mark.asyncio
+async def test_replay_failed(mock_logger):
+    with mock.patch('app.api.task_api.replay_failed_tasks', mock.AsyncMock(return_value=3)) as mock_replay, \
+         mock.patch('app.api.task_api.settings.task_replay_batch_size', 100):
+        result = await replay_failed(limit=10, queue="high", task_type=None)
+
+    assert result == {"replayed": 3}
+    mock_replay.assert_awaited_once_with(100, limit=10, queue="high", task_type=None)
+
+@pytest.mark.asyncio
+async def test_replay_failed_error(mock_logger):
+    with mock.patch('app.api.task_api.replay_failed_tasks', mock.AsyncMock(side_effect=Exception("connection error"))):
+        with pytest.raises(HTTPException) as exc_info:
+            await replay_failed(limit=None, queue=None, task_type=None)
+
+    assert exc_info.value.status_code == 500
+    mock_logger.error.assert_called_with("Task replay error: connection error")
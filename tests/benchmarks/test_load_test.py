@@ -0,0 +1,75 @@
+import asyncio
+import random
+import pytest
+from benchmarks.load_test import percentile, summarize, compare, run_load
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+def test_summarize():
+    result = summarize([0.3, 0.1, 0.2], errors=1, duration=2.0)
+
+    assert result["requests"] == 4
+    assert result["errors"] == 1
+    assert result["throughput"] == 1.5
+    assert result["p50"] == 0.2
+    assert result["max"] == 0.3
+
+def test_compare_regressions():
+    baseline = {"results": {
+        "create": {"throughput": 100.0, "p95": 0.1, "p99": 0.2, "errors": 0},
+        "drain": {"rate": 50.0, "errors": 0},
+    }}
+    current = {"results": {
+        "create": {"throughput": 70.0, "p95": 0.11, "p99": 0.3, "errors": 2},
+        "drain": {"rate": 45.0, "errors": 0},
+    }}
+
+    regressions = compare(current, baseline, 0.2)
+
+    assert regressions == [
+        "create.p99: 0.3 > 0.2 (+20%)",
+        "create.throughput: 70.0 < 100.0 (-20%)",
+        "create.errors: 2 > 0",
+    ]
+
+def test_compare_no_regression():
+    baseline = {"results": {"get": {"throughput": 100.0, "p95": 0.1}}}
+    current = {"results": {"get": {"throughput": 90.0, "p95": 0.05}, "cancel": {"throughput": 1.0}}}
+
+    assert compare(current, baseline, 0.2) == []
+
+@pytest.mark.asyncio
+async def test_run_load_closed_loop():
+    running = 0
+    max_running = 0
+
+    async def call(index):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return index % 10 != 0
+
+    result = await run_load(call, 50, 5, None, random.Random(0))
+
+    assert result["requests"] == 50
+    assert result["errors"] == 5
+    assert max_running == 5
+
+@pytest.mark.asyncio
+async def test_run_load_open_loop():
+    async def call(index):
+        raise Exception("request error")
+
+    result = await run_load(call, 10, 1, 1000.0, random.Random(0))
+
+    assert result["requests"] == 10
+    assert result["errors"] == 10
+    assert result["throughput"] == 0.0
@@ -0,0 +1,45 @@
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.cache.idempotency import content_key, claim_key, release_key
+from app.schemas import TaskCreate
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.cache.idempotency.redis') as MockRedis:
+        MockRedis.set = mock.AsyncMock(return_value=True)
+        MockRedis.get = mock.AsyncMock(return_value=None)
+        MockRedis.delete = mock.AsyncMock()
+        yield MockRedis
+
+def test_content_key_ignores_schedule():
+    task = TaskCreate(content="test content", queue="high")
+
+    assert content_key(task) == content_key(task.model_copy(update={"delay_seconds": 60}))
+    assert content_key(task) != content_key(task.model_copy(update={"queue": "low"}))
+
+@pytest.mark.asyncio
+async def test_claim_key_free(mock_redis):
+    assert await claim_key("key", "abc", "1", 60) == "1"
+    mock_redis.set.assert_awaited_once_with("task_idempotency:key:abc", "1", nx=True, ex=60)
+    mock_redis.get.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_claim_key_taken(mock_redis):
+    mock_redis.set.return_value = None
+    mock_redis.get.return_value = "0"
+
+    assert await claim_key("key", "abc", "1", 60) == "0"
+    mock_redis.get.assert_awaited_once_with("task_idempotency:key:abc")
+
+@pytest.mark.asyncio
+async def test_claim_key_expired_in_between(mock_redis):
+    mock_redis.set.return_value = None
+
+    assert await claim_key("content", "abc", "1", 60) == "1"
+
+@pytest.mark.asyncio
+async def test_release_key(mock_redis):
+    await release_key("key", "abc")
+
+    mock_redis.delete.assert_awaited_once_with("task_idempotency:key:abc")
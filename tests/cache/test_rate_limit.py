@@ -0,0 +1,32 @@
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.cache import rate_limit
+from app.cache.rate_limit import rate_limit_key, take_tokens
+
+@pytest_asyncio.fixture
+def mock_script():
+    script = mock.AsyncMock(return_value=[1, "0"])
+    with mock.patch('app.cache.rate_limit.redis') as MockRedis, \
+         mock.patch.object(rate_limit, '_token_bucket_script', None):
+        MockRedis.register_script = mock.Mock(return_value=script)
+        yield script
+
+def test_rate_limit_key_hides_client():
+    key = rate_limit_key("key:secret")
+
+    assert key.startswith("task_rate:")
+    assert "secret" not in key
+    assert key == rate_limit_key("key:secret")
+    assert key != rate_limit_key("key:other")
+
+@pytest.mark.asyncio
+async def test_take_tokens_allowed(mock_script):
+    assert await take_tokens("ip:127.0.0.1", 10.0, 100, 5) == (True, 0.0)
+    mock_script.assert_awaited_once_with(keys=[rate_limit_key("ip:127.0.0.1")], args=[10.0, 100, 5])
+
+@pytest.mark.asyncio
+async def test_take_tokens_limited(mock_script):
+    mock_script.return_value = [0, "0.25"]
+
+    assert await take_tokens("ip:127.0.0.1", 10.0, 100) == (False, 0.25)
@@ -0,0 +1,132 @@
+import pytest
+from datetime import datetime
+from unittest import mock
+import pytest_asyncio
+from app.cache import task_cache
+from app.cache.task_cache import LocalCache, get_cached_task, get_cached_tasks, cache_tasks
+from app.db.models import Task
+from app.schemas import TaskResponse
+
+def make_task(task_id: str, status: str) -> TaskResponse:
+    return TaskResponse(id=task_id, content="test content", status=status, created_at=datetime(2024, 10, 28))
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.cache.task_cache.redis') as MockRedis, \
+         mock.patch.object(task_cache, 'local_cache', LocalCache(10)):
+        MockRedis.pipeline = mock.MagicMock()
+        MockRedis.pipe = MockRedis.pipeline.return_value.__aenter__.return_value
+        MockRedis.pipe.execute = mock.AsyncMock()
+        yield MockRedis
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(2)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    cache.get("a")
+    cache.set("c", 3, 60)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(2)
+    cache.set("a", 1, 0)
+
+    assert cache.get("a") is None
+
+def test_cache_ttl_terminal_status_longer():
+    assert task_cache.cache_ttl("completed") > task_cache.cache_ttl("processing")
+    assert task_cache.local_cache_ttl("canceled") > task_cache.local_cache_ttl("pending")
+
+@pytest.mark.asyncio
+async def test_get_cached_task_redis_hit(mock_redis):
+    task = make_task("123", "completed")
+    mock_redis.get = mock.AsyncMock(return_value=task.model_dump_json())
+
+    result = await get_cached_task("123")
+
+    mock_redis.get.assert_awaited_once_with("task:123")
+    assert result == task
+
+    # served from the local tier next time
+    assert await get_cached_task("123") == task
+    mock_redis.get.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_get_cached_task_miss(mock_redis):
+    mock_redis.get = mock.AsyncMock(return_value=None)
+
+    assert await get_cached_task("123") is None
+
+@pytest.mark.asyncio
+async def test_get_cached_task_redis_error(mock_redis):
+    mock_redis.get = mock.AsyncMock(side_effect=Exception("connection error"))
+
+    assert await get_cached_task("123") is None
+
+@pytest.mark.asyncio
+async def test_get_cached_tasks(mock_redis):
+    local, remote = make_task("1", "completed"), make_task("2", "pending")
+    task_cache.local_cache.set("task:1", local, 60)
+    mock_redis.pipe.execute.return_value = [[remote.model_dump_json(), None]]
+
+    result = await get_cached_tasks(["1", "2", "3"])
+
+    # only the local misses are read from redis, in one MGET
+    mock_redis.pipe.mget.assert_called_once_with(["task:2", "task:3"])
+    assert result == {"1": local, "2": remote}
+    assert await get_cached_task("2") == remote
+
+@pytest.mark.asyncio
+async def test_get_cached_tasks_chunked(mock_redis):
+    mock_redis.pipe.execute.return_value = [[None, None], [None]]
+
+    with mock.patch('app.cache.task_cache.settings.task_status_chunk_size', 2):
+        assert await get_cached_tasks(["1", "2", "3"]) == {}
+
+    mock_redis.pipe.mget.assert_has_calls([mock.call(["task:1", "task:2"]), mock.call(["task:3"])])
+    mock_redis.pipe.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_get_cached_tasks_redis_error(mock_redis):
+    task = make_task("1", "completed")
+    task_cache.local_cache.set("task:1", task, 60)
+    mock_redis.pipe.execute.side_effect = Exception("connection error")
+
+    assert await get_cached_tasks(["1", "2"]) == {"1": task}
+
+@pytest.mark.asyncio
+async def test_cache_tasks(mock_redis):
+    tasks = [make_task("1", "pending"), make_task("2", "completed")]
+
+    await cache_tasks(tasks)
+
+    mock_redis.pipe.set.assert_has_calls([
+        mock.call("task:1", tasks[0].model_dump_json(), ex=task_cache.settings.task_cache_ttl),
+        mock.call("task:2", tasks[1].model_dump_json(), ex=task_cache.settings.task_cache_terminal_ttl),
+    ])
+    mock_redis.pipe.execute.assert_awaited_once()
+    assert await get_cached_task("2") == tasks[1]
+
+@pytest.mark.asyncio
+async def test_cache_tasks_orm_task(mock_redis):
+    # the api and the consumer cache the rows they just wrote
+    task = Task("test content", "completed")
+    task.created_at = datetime(2024, 10, 28)
+
+    await cache_tasks([task])
+
+    cached = TaskResponse(id=task.id, content="test content", status="completed", created_at=datetime(2024, 10, 28))
+    mock_redis.pipe.set.assert_called_once_with(
+        f"task:{task.id}", cached.model_dump_json(), ex=task_cache.settings.task_cache_terminal_ttl
+    )
+    assert await get_cached_task(task.id) == cached
+
+@pytest.mark.asyncio
+async def test_cache_tasks_disabled(mock_redis):
+    with mock.patch('app.cache.task_cache.settings.task_cache_enabled', False):
+        await cache_tasks([make_task("1", "pending")])
+
+    mock_redis.pipeline.assert_not_called()
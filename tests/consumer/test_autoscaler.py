@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from unittest import mock
+from app.consumer.autoscaler import Autoscaler, run_autoscaler
+
+def autoscaler(**kwargs):
+    config = dict(
+        min_workers=1, max_workers=10, target_backlog=10, target_wait=5.0,
+        max_pool_saturation=0.9, up_cooldown=10.0, down_cooldown=60.0,
+    )
+    config.update(kwargs)
+    return Autoscaler(**config)
+
+def test_decide_scales_up_to_backlog():
+    scaler = autoscaler()
+
+    # 75 ready tasks need 8 workers at 10 tasks each
+    assert scaler.decide(2, 75, 0.0, 0.0, 100.0) == 8
+
+def test_decide_scales_up_on_wait():
+    scaler = autoscaler()
+
+    assert scaler.decide(2, 5, 30.0, 0.0, 100.0) == 3
+
+def test_decide_bounded_by_max():
+    scaler = autoscaler(max_workers=4)
+
+    assert scaler.decide(2, 1000, 0.0, 0.0, 100.0) == 4
+    assert scaler.decide(4, 1000, 0.0, 0.0, 200.0) == 4
+
+def test_decide_clamps_into_bounds():
+    scaler = autoscaler(min_workers=2, max_workers=4)
+
+    assert scaler.decide(1, 0, 0.0, 0.0, 100.0) == 2
+    assert autoscaler(min_workers=2, max_workers=4).decide(8, 0, 0.0, 0.0, 100.0) == 4
+
+def test_decide_pool_saturated_holds():
+    scaler = autoscaler()
+
+    # more workers would only wait for a database connection
+    assert scaler.decide(2, 75, 0.0, 0.95, 100.0) == 2
+
+def test_decide_hysteresis_band_holds():
+    scaler = autoscaler()
+
+    # between half and all of the target backlog the workers stay as they are
+    assert scaler.decide(4, 30, 0.0, 0.0, 100.0) == 4
+    assert scaler.decide(4, 30, 4.0, 0.0, 200.0) == 4
+
+def test_decide_scales_down_in_steps():
+    scaler = autoscaler()
+
+    assert scaler.decide(8, 0, 0.0, 0.0, 100.0) == 6
+    # within the cooldown of the last change
+    assert scaler.decide(6, 0, 0.0, 0.0, 130.0) == 6
+    assert scaler.decide(6, 0, 0.0, 0.0, 161.0) == 5
+    assert autoscaler().decide(1, 0, 0.0, 0.0, 100.0) == 1
+
+def test_decide_up_cooldown():
+    scaler = autoscaler()
+
+    assert scaler.decide(8, 0, 0.0, 0.0, 100.0) == 6
+    assert scaler.decide(6, 200, 0.0, 0.0, 105.0) == 6
+    assert scaler.decide(6, 200, 0.0, 0.0, 111.0) == 10
+
+@pytest.mark.asyncio
+async def test_run_autoscaler_scales():
+    stopped = asyncio.Event()
+    scale = mock.Mock(side_effect=lambda target: stopped.set())
+
+    with mock.patch('app.consumer.autoscaler.queue_backlog', mock.AsyncMock(return_value=(100, None))), \
+         mock.patch('app.consumer.autoscaler.pool_saturation', return_value=0.0), \
+         mock.patch('app.consumer.autoscaler.settings.task_consumer_processes', 2), \
+         mock.patch('app.consumer.autoscaler.settings.task_autoscale_max_workers', 16):
+        await asyncio.wait_for(run_autoscaler(stopped, lambda: 1, scale), 1)
+
+    # the other process takes the other half of the backlog
+    scale.assert_called_once_with(5)
+
+@pytest.mark.asyncio
+async def test_run_autoscaler_backlog_error():
+    stopped = asyncio.Event()
+    scale = mock.Mock()
+
+    with mock.patch('app.consumer.autoscaler.queue_backlog', mock.AsyncMock(side_effect=Exception("connection error"))), \
+         mock.patch('app.consumer.autoscaler.logger') as mock_logger, \
+         mock.patch('app.consumer.autoscaler.settings.task_autoscale_interval', 0.01):
+        run = asyncio.create_task(run_autoscaler(stopped, lambda: 1, scale))
+        await asyncio.sleep(0.02)
+        stopped.set()
+        await asyncio.wait_for(run, 1)
+
+    scale.assert_not_called()
+    mock_logger.error.assert_called_with("Autoscaler backlog error: connection error")
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from unittest import mock
+from app.consumer.cancellation import RunningTasks, TaskCanceled, run_cancel_listener
+
+@pytest.mark.asyncio
+async def test_run_returns_result():
+    running = RunningTasks(10)
+    task = mock.Mock(id="1", type="default")
+
+    async def handler():
+        return "done"
+
+    assert await running.run(task, handler()) == "done"
+    assert running.runs == {}
+    assert running.durations["default"] >= 0
+
+@pytest.mark.asyncio
+async def test_cancel_stops_running_task():
+    running = RunningTasks(10)
+    running.durations["default"] = 5.0
+    task = mock.Mock(id="1", type="default")
+
+    run = asyncio.create_task(running.run(task, asyncio.sleep(10)))
+    await asyncio.sleep(0.01)
+    with mock.patch('app.consumer.cancellation.metrics_task_cancel_reclaimed_seconds') as mock_reclaimed:
+        running.cancel("1")
+        with pytest.raises(TaskCanceled):
+            await run
+
+    # about the average duration minus the time already spent is freed
+    reclaimed = mock_reclaimed.inc.call_args.args[0]
+    assert 4.5 < reclaimed < 5.0
+    assert running.runs == {} and running.canceled == set()
+
+@pytest.mark.asyncio
+async def test_cancel_pool_handler_reclaims_nothing():
+    running = RunningTasks(10)
+    running.durations["hash"] = 5.0
+    task = mock.Mock(id="1", type="hash")
+
+    run = asyncio.create_task(running.run(task, asyncio.sleep(10)))
+    await asyncio.sleep(0.01)
+    with mock.patch('app.consumer.cancellation.metrics_task_cancel_reclaimed_seconds') as mock_reclaimed:
+        running.cancel("1")
+        with pytest.raises(TaskCanceled):
+            await run
+
+    # the process handler is only no longer awaited, it keeps its pool process until it returns
+    mock_reclaimed.inc.assert_called_once_with(0.0)
+
+@pytest.mark.asyncio
+async def test_cancel_before_start():
+    running = RunningTasks(10)
+    task = mock.Mock(id="1", type="default")
+    handler = mock.AsyncMock()
+
+    running.cancel("1")
+    with pytest.raises(TaskCanceled):
+        await running.run(task, handler())
+
+    handler.assert_not_awaited()
+    assert "1" not in running.recent
+
+@pytest.mark.asyncio
+async def test_cancel_before_start_is_bounded():
+    running = RunningTasks(2)
+
+    for task_id in ("1", "2", "3"):
+        running.cancel(task_id)
+
+    assert list(running.recent) == ["2", "3"]
+
+@pytest.mark.asyncio
+async def test_shutdown_cancel_is_not_task_canceled():
+    running = RunningTasks(10)
+    task = mock.Mock(id="1", type="default")
+
+    run = asyncio.create_task(running.run(task, asyncio.sleep(10)))
+    await asyncio.sleep(0.01)
+    run.cancel()
+
+    # the worker itself was canceled, the cancellation goes on to stop it
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    assert running.runs == {}
+
+@pytest.mark.asyncio
+async def test_run_cancel_listener():
+    stopped = asyncio.Event()
+    pubsub = mock.AsyncMock()
+    pubsub.__aenter__.return_value = pubsub
+    messages = [{"type": "message", "data": "1"}]
+
+    async def get_message(timeout):
+        if messages:
+            return messages.pop()
+        stopped.set()
+
+    pubsub.get_message = get_message
+    with mock.patch('app.consumer.cancellation.redis') as mock_redis, \
+         mock.patch('app.consumer.cancellation.running_tasks') as mock_running:
+        mock_redis.pubsub = mock.Mock(return_value=pubsub)
+        await asyncio.wait_for(run_cancel_listener(stopped), 1)
+
+    pubsub.subscribe.assert_awaited_once_with("task_cancel")
+    mock_running.cancel.assert_called_once_with("1")
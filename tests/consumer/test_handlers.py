@@ -0,0 +1,68 @@
+import threading
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.consumer import handlers
+from app.consumer.handlers import register_handler, run_handler, shutdown_pools, HANDLER_MODE_THREAD, HANDLER_MODE_PROCESS
+
+@pytest_asyncio.fixture
+def registry():
+    with mock.patch.dict(handlers.handlers):
+        yield handlers.handlers
+    shutdown_pools()
+
+@pytest.mark.asyncio
+async def test_run_handler_async(registry):
+    handler = mock.AsyncMock(return_value="done")
+    register_handler("test")(handler)
+
+    result = await run_handler(mock.Mock(type="test", content="test content"))
+
+    handler.assert_awaited_once_with("test content")
+    assert result == "done"
+
+@pytest.mark.asyncio
+async def test_run_handler_thread(registry):
+    @register_handler("test", mode=HANDLER_MODE_THREAD)
+    def handler(content):
+        return threading.current_thread().name
+
+    result = await run_handler(mock.Mock(type="test", content="test content"))
+
+    assert result.startswith("task-handler")
+
+@pytest.mark.asyncio
+async def test_run_handler_process(registry):
+    register_handler("test", mode=HANDLER_MODE_PROCESS)(len)
+
+    result = await run_handler(mock.Mock(type="test", content="test content"))
+
+    assert result == len("test content")
+
+@pytest.mark.asyncio
+async def test_run_handler_unknown_type(registry):
+    with pytest.raises(ValueError) as exc_info:
+        await run_handler(mock.Mock(type="unknown"))
+
+    assert str(exc_info.value) == "No handler for task type unknown"
+
+def test_register_handler_unknown_mode(registry):
+    with pytest.raises(ValueError):
+        register_handler("test", mode="unknown")(len)
+
+def test_process_pool_recycles_workers(registry):
+    with mock.patch('app.consumer.handlers.ProcessPoolExecutor') as MockExecutor, \
+         mock.patch('app.consumer.handlers.sys.version_info', (3, 11)), \
+         mock.patch('app.consumer.handlers.settings.task_process_max_tasks_per_child', 50):
+        handlers.get_process_pool()
+
+    assert MockExecutor.call_args.kwargs["max_tasks_per_child"] == 50
+
+def test_process_pool_without_recycling_warns(registry):
+    with mock.patch('app.consumer.handlers.ProcessPoolExecutor') as MockExecutor, \
+         mock.patch('app.consumer.handlers.sys.version_info', (3, 10)), \
+         mock.patch('app.consumer.handlers.logger') as mock_logger:
+        handlers.get_process_pool()
+
+    assert "max_tasks_per_child" not in MockExecutor.call_args.kwargs
+    mock_logger.warning.assert_called_once()
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.consumer.lease import renew_leases, reap_expired_leases, run_lease_keeper
+
+@pytest_asyncio.fixture
+def mock_task():
+    with mock.patch('app.consumer.lease.Task') as MockTask:
+        yield MockTask
+
+@pytest_asyncio.fixture
+def mock_db():
+    with mock.patch('app.consumer.lease.async_session') as MockSession:
+        yield MockSession
+
+@pytest.mark.asyncio
+async def test_renew_leases(mock_task, mock_db):
+    mock_task.renew_leases = mock.AsyncMock(return_value=2)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.lease.running_tasks') as mock_running:
+        mock_running.runs = {"1": None, "2": None}
+        assert await renew_leases() == 2
+
+    mock_task.renew_leases.assert_awaited_once_with(["1", "2"], db)
+    db.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_renew_leases_nothing_running(mock_task, mock_db):
+    with mock.patch('app.consumer.lease.running_tasks') as mock_running:
+        mock_running.runs = {}
+        assert await renew_leases() == 0
+
+    mock_db.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_reap_expired_leases(mock_task, mock_db):
+    mock_task.expired_leases = mock.AsyncMock(return_value=[
+        mock.Mock(id="1", queue="high", failed_attempts=0),
+        mock.Mock(id="2", queue="low", failed_attempts=2),
+    ])
+    db = mock_db.return_value.__aenter__.return_value
+
+    # the second one was completed in the meantime
+    with mock.patch('app.consumer.lease.fail_task', mock.AsyncMock(side_effect=[mock.Mock(), None])) as mock_fail:
+        assert await reap_expired_leases() == 1
+
+    mock_fail.assert_has_awaits([
+        mock.call("1", "high", 0, "Lease expired", db),
+        mock.call("2", "low", 2, "Lease expired", db),
+    ])
+
+@pytest.mark.asyncio
+async def test_run_lease_keeper_stops():
+    stopped = asyncio.Event()
+
+    async def renew():
+        stopped.set()
+        return 0
+
+    with mock.patch('app.consumer.lease.renew_leases', renew), \
+         mock.patch('app.consumer.lease.reap_expired_leases', mock.AsyncMock()) as mock_reap:
+        await asyncio.wait_for(run_lease_keeper(stopped), 1)
+
+    mock_reap.assert_awaited_once()
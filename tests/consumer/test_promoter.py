@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.consumer.promoter import promote_queue, run_promoter
+
+@pytest_asyncio.fixture
+def mock_task():
+    with mock.patch('app.consumer.promoter.Task') as MockTask:
+        yield MockTask
+
+@pytest_asyncio.fixture
+def mock_db():
+    with mock.patch('app.consumer.promoter.async_session') as MockSession:
+        yield MockSession
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_cache():
+    with mock.patch('app.consumer.promoter.cache_tasks', mock.AsyncMock()) as MockCacheTasks, \
+         mock.patch('app.consumer.promoter.publish_task_events', mock.AsyncMock()):
+        yield MockCacheTasks
+
+@pytest.mark.asyncio
+async def test_promote_queue_batches(mock_task, mock_db):
+    mock_task.transition_many = mock.AsyncMock(return_value=[])
+    db = mock_db.return_value.__aenter__.return_value
+    due = mock.AsyncMock(side_effect=[[("1", 1.0), ("2", 1.0)], [("3", 1.0)]])
+    promote = mock.AsyncMock(side_effect=lambda task_ids, queue: task_ids)
+
+    with mock.patch('app.consumer.promoter.settings.task_schedule_batch_size', 2), \
+         mock.patch('app.consumer.promoter.due_tasks', due), \
+         mock.patch('app.consumer.promoter.promote_tasks', promote):
+        count = await promote_queue("default")
+
+    assert count == 3
+    assert due.await_count == 2
+    mock_task.transition_many.assert_has_awaits([
+        mock.call(["1", "2"], "pending", db),
+        mock.call(["3"], "pending", db),
+    ])
+    promote.assert_has_awaits([mock.call(["1", "2"], "default"), mock.call(["3"], "default")])
+
+@pytest.mark.asyncio
+async def test_promote_queue_marks_pending_before_push(mock_task, mock_db):
+    calls = []
+    mock_task.transition_many = mock.AsyncMock(side_effect=lambda *args: calls.append("pending") or [])
+    db = mock_db.return_value.__aenter__.return_value
+    db.commit = mock.AsyncMock(side_effect=lambda: calls.append("commit"))
+    promote = mock.AsyncMock(side_effect=lambda task_ids, queue: calls.append("push") or task_ids)
+
+    with mock.patch('app.consumer.promoter.due_tasks', mock.AsyncMock(return_value=[("1", 1.0)])), \
+         mock.patch('app.consumer.promoter.promote_tasks', promote):
+        await promote_queue("default")
+
+    # the task is claimable once it reaches the ready queue
+    assert calls == ["pending", "commit", "push"]
+
+@pytest.mark.asyncio
+async def test_promote_queue_status_error(mock_task, mock_db):
+    mock_task.transition_many = mock.AsyncMock(side_effect=Exception("update error"))
+    db = mock_db.return_value.__aenter__.return_value
+    promote = mock.AsyncMock()
+
+    with mock.patch('app.consumer.promoter.due_tasks', mock.AsyncMock(return_value=[("1", 1.0)])), \
+         mock.patch('app.consumer.promoter.promote_tasks', promote):
+        count = await promote_queue("default")
+
+    # the task stays in the scheduled set for the next poll
+    assert count == 0
+    db.rollback.assert_awaited()
+    promote.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_run_promoter_stops(mock_task, mock_db):
+    stopped = asyncio.Event()
+    promote = mock.AsyncMock(return_value=0)
+
+    with mock.patch('app.consumer.promoter.promote_queue', promote), \
+         mock.patch('app.consumer.promoter.settings.task_queues', {"high": 2, "low": 1}):
+        run = asyncio.create_task(run_promoter(stopped))
+        await asyncio.sleep(0.01)
+        stopped.set()
+        await asyncio.wait_for(run, 1)
+
+    promote.assert_has_awaits([mock.call("high"), mock.call("low")])
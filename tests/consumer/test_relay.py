@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from datetime import datetime, timezone
+from unittest import mock
+import pytest_asyncio
+from app.consumer import relay
+from app.consumer.relay import relay_batch, run_outbox_relay, notify_relay
+
+@pytest_asyncio.fixture
+def mock_outbox():
+    with mock.patch('app.consumer.relay.TaskOutbox') as MockTaskOutbox:
+        MockTaskOutbox.delete_many = mock.AsyncMock()
+        yield MockTaskOutbox
+
+@pytest_asyncio.fixture
+def mock_db():
+    with mock.patch('app.consumer.relay.async_session') as MockSession:
+        yield MockSession
+
+@pytest_asyncio.fixture
+def mock_push():
+    with mock.patch('app.consumer.relay.enqueue_tasks', mock.AsyncMock()) as MockEnqueue, \
+         mock.patch('app.consumer.relay.schedule_tasks', mock.AsyncMock()) as MockSchedule:
+        yield MockEnqueue, MockSchedule
+
+def outbox_entry(entry_id, task_id, queue="default", run_at=None, trace=None):
+    return mock.Mock(id=entry_id, task_id=task_id, queue=queue, run_at=run_at, trace=trace, created_at=None)
+
+@pytest.mark.asyncio
+async def test_relay_batch(mock_outbox, mock_db, mock_push):
+    mock_enqueue, mock_schedule = mock_push
+    run_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    mock_outbox.lock_batch = mock.AsyncMock(return_value=[
+        outbox_entry(1, "a", trace="00-trace-a-01"),
+        outbox_entry(2, "b", queue="high"),
+        outbox_entry(3, "c"),
+        outbox_entry(4, "d", run_at=run_at),
+    ])
+    db = mock_db.return_value.__aenter__.return_value
+
+    count = await relay_batch()
+
+    assert count == 4
+    mock_enqueue.assert_has_awaits([
+        mock.call(["a", "c"], "default", ["00-trace-a-01", None]),
+        mock.call(["b"], "high", [None]),
+    ])
+    mock_schedule.assert_awaited_once_with({"d": run_at.timestamp()}, "default")
+    mock_outbox.delete_many.assert_awaited_once_with([1, 2, 3, 4], db)
+    db.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_relay_batch_empty(mock_outbox, mock_db, mock_push):
+    mock_enqueue, _ = mock_push
+    mock_outbox.lock_batch = mock.AsyncMock(return_value=[])
+
+    assert await relay_batch() == 0
+    mock_enqueue.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_relay_batch_push_error_keeps_rows(mock_outbox, mock_db, mock_push):
+    mock_enqueue, _ = mock_push
+    mock_enqueue.side_effect = Exception("connection error")
+    mock_outbox.lock_batch = mock.AsyncMock(return_value=[outbox_entry(1, "a")])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.relay.logger') as mock_logger:
+        count = await relay_batch()
+
+    # the rows are left for the next run
+    assert count == 0
+    mock_outbox.delete_many.assert_not_awaited()
+    db.commit.assert_not_awaited()
+    db.rollback.assert_awaited_once()
+    mock_logger.error.assert_called_with("Task outbox relay error: connection error")
+
+@pytest.mark.asyncio
+async def test_run_outbox_relay_drains_full_batches():
+    stopped = asyncio.Event()
+    counts = [2, 2, 1]
+
+    async def relay_batch():
+        if not counts:
+            stopped.set()
+            return 0
+        return counts.pop(0)
+
+    with mock.patch('app.consumer.relay.relay_batch', mock.AsyncMock(side_effect=relay_batch)) as mock_relay, \
+         mock.patch('app.consumer.relay.settings.task_outbox_batch_size', 2), \
+         mock.patch('app.consumer.relay.settings.task_outbox_poll_interval', 0.01):
+        await asyncio.wait_for(run_outbox_relay(stopped), 1)
+
+    assert mock_relay.await_count == 4
+
+@pytest.mark.asyncio
+async def test_run_outbox_relay_notified():
+    stopped = asyncio.Event()
+
+    with mock.patch('app.consumer.relay.relay_batch', mock.AsyncMock(return_value=0)) as mock_relay, \
+         mock.patch('app.consumer.relay.settings.task_outbox_poll_interval', 60):
+        run = asyncio.create_task(run_outbox_relay(stopped))
+        await asyncio.sleep(0.01)
+        # a local create wakes the relay before its poll interval
+        notify_relay()
+        await asyncio.sleep(0.01)
+        stopped.set()
+        await asyncio.wait_for(run, 1)
+
+    assert mock_relay.await_count == 2
+    relay.outbox_written = None
@@ -0,0 +1,165 @@
+import pytest
+from datetime import datetime, timezone
+from unittest import mock
+import pytest_asyncio
+from app.consumer.retry import backoff_delay, fail_task, replay_failed_tasks
+
+@pytest_asyncio.fixture
+def mock_task():
+    with mock.patch('app.consumer.retry.Task') as MockTask:
+        yield MockTask
+
+@pytest_asyncio.fixture
+def mock_db():
+    with mock.patch('app.consumer.retry.async_session') as MockSession:
+        yield MockSession
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_cache():
+    with mock.patch('app.consumer.retry.cache_task', mock.AsyncMock()), \
+         mock.patch('app.consumer.retry.cache_tasks', mock.AsyncMock()) as MockCacheTasks, \
+         mock.patch('app.consumer.retry.publish_task_event', mock.AsyncMock()), \
+         mock.patch('app.consumer.retry.publish_task_events', mock.AsyncMock()):
+        yield MockCacheTasks
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_outbox():
+    with mock.patch('app.consumer.retry.TaskOutbox') as MockTaskOutbox, \
+         mock.patch('app.consumer.retry.current_traceparent', return_value="00-trace-span-01"):
+        yield MockTaskOutbox
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_notify(monkeypatch):
+    notify = mock.Mock()
+    monkeypatch.setattr('app.consumer.retry.notify_relay', notify)
+    return notify
+
+def session():
+    db = mock.AsyncMock()
+    db.add = mock.Mock()
+    return db
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_settings():
+    with mock.patch('app.consumer.retry.settings.task_max_attempts', 3), \
+         mock.patch('app.consumer.retry.settings.task_retry_backoff_base', 2.0), \
+         mock.patch('app.consumer.retry.settings.task_retry_backoff_max', 5.0):
+        yield
+
+def test_backoff_delay():
+    with mock.patch('app.consumer.retry.random.uniform', side_effect=lambda low, high: high):
+        assert [backoff_delay(attempts) for attempts in (1, 2, 3, 4)] == [2.0, 4.0, 5.0, 5.0]
+
+@pytest.mark.asyncio
+async def test_fail_task_schedules_retry(mock_task, mock_outbox, mock_notify):
+    run_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    task = mock.Mock(id="1", status="scheduled", run_at=run_at)
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    db = session()
+
+    with mock.patch('app.consumer.retry.backoff_delay', mock.Mock(return_value=60)) as mock_backoff:
+        assert await fail_task("1", "high", 0, "ValueError: bad", db) == task
+
+    args, kwargs = mock_task.transition.await_args
+    assert args == ("1", "scheduled", db)
+    assert kwargs["values"]["failed_attempts"] == 1
+    assert kwargs["values"]["last_error"] == "ValueError: bad"
+    assert 55 < (kwargs["values"]["run_at"] - datetime.now(timezone.utc)).total_seconds() <= 60
+    mock_backoff.assert_called_once_with(1)
+    # the retry is scheduled by the relay, from an outbox row committed with the status
+    mock_outbox.assert_called_once_with("1", "high", run_at=run_at, trace="00-trace-span-01")
+    db.add.assert_called_once_with(mock_outbox.return_value)
+    db.commit.assert_awaited_once()
+    mock_notify.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_fail_task_dead_letters_after_last_attempt(mock_task, mock_outbox, mock_notify):
+    task = mock.Mock(id="1", status="failed")
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    db = session()
+
+    await fail_task("1", "high", 2, "x" * 2000, db)
+
+    args, kwargs = mock_task.transition.await_args
+    assert args == ("1", "failed", db)
+    assert kwargs["values"] == {"failed_attempts": 3, "last_error": "x" * 1000}
+    db.add.assert_not_called()
+    mock_notify.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_fail_task_no_longer_processing(mock_task, mock_outbox):
+    mock_task.transition = mock.AsyncMock(return_value=None)
+    db = session()
+
+    assert await fail_task("1", "high", 0, "error", db) is None
+
+    db.add.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_fail_task_error(mock_task):
+    mock_task.transition = mock.AsyncMock(side_effect=Exception("connection error"))
+    db = session()
+
+    with mock.patch('app.consumer.retry.logger') as mock_logger:
+        assert await fail_task("1", "high", 0, "error", db) is None
+
+    db.rollback.assert_awaited()
+    mock_logger.error.assert_called_with("Task 1 retry error: connection error")
+
+@pytest.mark.asyncio
+async def test_replay_failed_tasks_batches(mock_task, mock_db, mock_outbox, mock_notify):
+    batches = [
+        [mock.Mock(id="1", queue="high"), mock.Mock(id="2", queue="low")],
+        [mock.Mock(id="3", queue="high")],
+    ]
+    mock_task.replay_failed = mock.AsyncMock(side_effect=batches)
+    mock_outbox.add_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+
+    assert await replay_failed_tasks(2, queue="high") == 3
+
+    assert mock_task.replay_failed.await_args_list == [
+        mock.call(2, db, queue="high", task_type=None),
+        mock.call(2, db, queue="high", task_type=None),
+    ]
+    # each batch is committed with its outbox rows, the relay pushes them
+    assert mock_outbox.add_many.await_args_list == [
+        mock.call(batches[0], "00-trace-span-01", db),
+        mock.call(batches[1], "00-trace-span-01", db),
+    ]
+    assert db.commit.await_count == 2
+    assert mock_notify.call_count == 2
+
+@pytest.mark.asyncio
+async def test_replay_failed_tasks_limit(mock_task, mock_db, mock_outbox):
+    mock_task.replay_failed = mock.AsyncMock(side_effect=[[mock.Mock(id="1", queue="high")] * 2, [mock.Mock(id="3", queue="high")]])
+    mock_outbox.add_many = mock.AsyncMock()
+
+    assert await replay_failed_tasks(2, limit=3) == 3
+
+    assert mock_task.replay_failed.await_args_list[1].args[0] == 1
+
+@pytest.mark.asyncio
+async def test_replay_nothing_failed(mock_task, mock_db, mock_outbox, mock_notify):
+    mock_task.replay_failed = mock.AsyncMock(return_value=[])
+    mock_outbox.add_many = mock.AsyncMock()
+
+    assert await replay_failed_tasks(2) == 0
+
+    mock_outbox.add_many.assert_not_awaited()
+    mock_notify.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_replay_commit_error_stays_dead_lettered(mock_task, mock_db, mock_outbox, mock_cache, mock_notify):
+    mock_task.replay_failed = mock.AsyncMock(return_value=[mock.Mock(id="1", queue="high")])
+    mock_outbox.add_many = mock.AsyncMock()
+    db = mock_db.return_value.__aenter__.return_value
+    db.commit.side_effect = Exception("connection error")
+
+    with pytest.raises(Exception):
+        await replay_failed_tasks(2)
+
+    # the replay and its outbox rows are rolled back together, the tasks stay failed
+    db.rollback.assert_awaited_once()
+    mock_notify.assert_not_called()
+    mock_cache.assert_not_awaited()
@@ -1,7 +1,12 @@
+import asyncio
 import pytest
+from datetime import datetime, timezone
 from unittest import mock
 import pytest_asyncio
-from app.consumer.task_consumer import process_task
+from app.consumer import task_consumer
+from app.consumer.cancellation import running_tasks
+from app.consumer.task_consumer import process_task, process_tasks, start_consumer, stop_consumer, scale_workers
+from app.queue.message import QueueMessage
 
 @pytest_asyncio.fixture
 def mock_task():
@@ -18,53 +23,382 @@ def mock_logger():
     with mock.patch('app.consumer.task_consumer.logger') as MockLogger:
         yield MockLogger
 
+@pytest_asyncio.fixture(autouse=True)
+def mock_cache():
+    with mock.patch('app.consumer.task_consumer.cache_task', mock.AsyncMock()) as MockCacheTask, \
+         mock.patch('app.consumer.task_consumer.cache_tasks', mock.AsyncMock()), \
+         mock.patch('app.consumer.task_consumer.publish_task_event', mock.AsyncMock()), \
+         mock.patch('app.consumer.task_consumer.publish_task_events', mock.AsyncMock()):
+        yield MockCacheTask
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_promoter():
+    async def run_promoter(stopped):
+        await stopped.wait()
+
+    with mock.patch('app.consumer.task_consumer.run_promoter', mock.Mock(side_effect=run_promoter)) as MockPromoter, \
+         mock.patch('app.consumer.task_consumer.run_cancel_listener', mock.Mock(side_effect=run_promoter)), \
+         mock.patch('app.consumer.task_consumer.run_lease_keeper', mock.Mock(side_effect=run_promoter)), \
+         mock.patch('app.consumer.task_consumer.run_outbox_relay', mock.Mock(side_effect=run_promoter)):
+        yield MockPromoter
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_fail_task():
+    with mock.patch('app.consumer.task_consumer.fail_task', mock.AsyncMock()) as MockFailTask:
+        yield MockFailTask
+
+@pytest_asyncio.fixture(autouse=True)
+def mock_canceled_ids():
+    with mock.patch('app.consumer.task_consumer.canceled_task_ids', mock.AsyncMock(return_value=set())) as MockCanceledIds:
+        yield MockCanceledIds
+
 @pytest.mark.asyncio
-async def test_process_task_not_found(mock_task, mock_db, mock_logger):
-    mock_task.get = mock.AsyncMock(return_value=None)
+async def test_process_task_not_claimed(mock_task, mock_db, mock_logger):
+    mock_task.transition = mock.AsyncMock(return_value=None)
     db = mock_db.return_value.__aenter__.return_value
 
-    await process_task("123", db)
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock()) as mock_execute:
+        await process_task("123", db)
 
-    mock_task.get.assert_awaited_once_with("123", db)
-    mock_logger.warning.assert_called_with("Task 123 not found.")
+    mock_task.transition.assert_awaited_once_with("123", "processing", db)
+    mock_task.get.assert_not_called()
+    mock_execute.assert_not_awaited()
+    mock_logger.warning.assert_called_with("Task 123 not found or already processed or canceled.")
 
 @pytest.mark.asyncio
-async def test_process_task_already_processed(mock_task, mock_db, mock_logger):
+async def test_process_task_success(mock_task, mock_db, mock_logger):
     task = mock.Mock()
-    task.status = "completed"
-    mock_task.get = mock.AsyncMock(return_value=task)
+    task.status = "processing"
+    completed_task = mock.Mock()
+    completed_task.status = "completed"
+    completed_task.queue = "default"
+    completed_task.created_at = datetime.now(timezone.utc)
+    mock_task.transition = mock.AsyncMock(side_effect=[task, completed_task])
     db = mock_db.return_value.__aenter__.return_value
 
-    await process_task("123", db)
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock()) as mock_handler:
+        await process_task("123", db)
 
-    mock_task.get.assert_awaited_once_with("123", db)
-    mock_logger.warning.assert_called_with("Task 123 already processed or canceled.")
+    mock_handler.assert_awaited_once_with(task)
+    mock_task.transition.assert_has_awaits([
+        mock.call("123", "processing", db),
+        mock.call("123", "completed", db),
+    ])
+    mock_task.get.assert_not_called()
+    assert db.commit.await_count == 2
+    args, kwargs = mock_logger.info.call_args
+    assert args == ("Task 123 completed.",)
+    assert kwargs["extra"]["task_id"] == "123"
+    assert kwargs["extra"]["status"] == "completed"
+    assert kwargs["extra"]["duration"] >= 0
 
 @pytest.mark.asyncio
-async def test_process_task_success(mock_task, mock_db, mock_logger):
+async def test_process_task_canceled_during_processing(mock_task, mock_db, mock_logger):
     task = mock.Mock()
-    task.status = "pending"
-    mock_task.get = mock.AsyncMock(return_value=task)
+    task.status = "processing"
+    mock_task.transition = mock.AsyncMock(side_effect=[task, None])
     db = mock_db.return_value.__aenter__.return_value
 
-    await process_task("123", db)
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock()):
+        await process_task("123", db)
 
-    mock_task.get.assert_awaited_once_with("123", db)
-    assert task.status == "completed"
-    db.commit.assert_awaited()
-    mock_logger.info.assert_called_with("Task 123 completed.")
+    mock_task.transition.assert_awaited_with("123", "completed", db)
+    mock_logger.warning.assert_called_with("Task 123 canceled during processing.")
+
+@pytest.mark.asyncio
+async def test_process_task_canceled_while_running(mock_task, mock_db, mock_logger):
+    task = mock.Mock(id="123", type="default", status="processing")
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    async def run_handler(task):
+        await asyncio.sleep(10)
+
+    with mock.patch('app.consumer.task_consumer.run_handler', run_handler):
+        run = asyncio.create_task(process_task("123", db))
+        await asyncio.sleep(0.01)
+        running_tasks.cancel("123")
+        await asyncio.wait_for(run, 1)
+
+    # the api already moved the task to canceled, nothing is written back
+    mock_task.transition.assert_awaited_once_with("123", "processing", db)
+    mock_logger.warning.assert_called_with("Task 123 canceled during processing.")
+
+@pytest.mark.asyncio
+async def test_process_task_handler_error_retries(mock_task, mock_db, mock_logger, mock_fail_task):
+    task = mock.Mock(id="123", queue="high", failed_attempts=1, status="processing")
+    mock_task.transition = mock.AsyncMock(return_value=task)
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock(side_effect=ValueError("bad content"))):
+        await process_task("123", db)
+
+    db.rollback.assert_awaited()
+    mock_logger.error.assert_called_with("Task 123 processing error: bad content")
+    mock_fail_task.assert_awaited_once_with("123", "high", 1, "ValueError: bad content", db)
 
 @pytest.mark.asyncio
 async def test_process_task_exception(mock_task, mock_db, mock_logger):
-    task = mock.Mock()
-    task.status = "pending"
-    mock_task.get = mock.AsyncMock(return_value=task)
+    mock_task.transition = mock.AsyncMock(return_value=mock.Mock())
     db = mock_db.return_value.__aenter__.return_value
     db.commit = mock.AsyncMock(side_effect=Exception("commit error"))
 
     await process_task("123", db)
 
-    mock_task.get.assert_awaited_once_with("123", db)
+    mock_task.transition.assert_awaited_once_with("123", "processing", db)
     db.commit.assert_awaited()
     db.rollback.assert_awaited()
     mock_logger.error.assert_called_with("Task 123 processing error: commit error")
+
+@pytest.mark.asyncio
+async def test_process_tasks_success(mock_task, mock_db, mock_logger):
+    tasks = [mock.Mock(id="1", queue="default", created_at=None), mock.Mock(id="2", queue="default", created_at=None)]
+    mock_task.transition_many = mock.AsyncMock(side_effect=[tasks, tasks])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock()) as mock_execute:
+        await process_tasks(["1", "2", "3"], db)
+
+    mock_task.transition_many.assert_has_awaits([
+        mock.call(["1", "2", "3"], "processing", db),
+        mock.call(["1", "2"], "completed", db),
+    ])
+    assert mock_execute.await_count == 2
+    assert db.commit.await_count == 2
+    mock_logger.warning.assert_called_with("Tasks ['3'] not found or already processed or canceled.")
+    mock_logger.info.assert_called_with("Tasks ['1', '2'] completed.")
+
+@pytest.mark.asyncio
+async def test_process_tasks_nothing_claimed(mock_task, mock_db, mock_logger):
+    mock_task.transition_many = mock.AsyncMock(return_value=[])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock()) as mock_execute:
+        await process_tasks(["1"], db)
+
+    mock_task.transition_many.assert_awaited_once()
+    mock_execute.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_process_tasks_partial_failure(mock_task, mock_db, mock_logger, mock_fail_task):
+    tasks = [mock.Mock(id="1", queue="default", created_at=None), mock.Mock(id="2", queue="default", created_at=None)]
+    mock_task.transition_many = mock.AsyncMock(side_effect=[tasks, tasks[1:]])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.consumer.task_consumer.run_handler', mock.AsyncMock(side_effect=[Exception("handler error"), None])):
+        await process_tasks(["1", "2"], db)
+
+    mock_task.transition_many.assert_awaited_with(["2"], "completed", db)
+    mock_logger.error.assert_called_with("Task 1 processing error: handler error")
+    mock_fail_task.assert_awaited_once_with("1", "default", tasks[0].failed_attempts, "Exception: handler error", db)
+
+@pytest.mark.asyncio
+async def test_process_tasks_canceled_while_running(mock_task, mock_db, mock_logger):
+    tasks = [mock.Mock(id="1", type="default", queue="default", created_at=None), mock.Mock(id="2", type="default", queue="default", created_at=None)]
+    mock_task.transition_many = mock.AsyncMock(side_effect=[tasks, tasks[1:]])
+    db = mock_db.return_value.__aenter__.return_value
+
+    async def run_handler(task):
+        await asyncio.sleep(10 if task.id == "1" else 0.05)
+
+    with mock.patch('app.consumer.task_consumer.run_handler', run_handler):
+        run = asyncio.create_task(process_tasks(["1", "2"], db))
+        await asyncio.sleep(0.01)
+        running_tasks.cancel("1")
+        await asyncio.wait_for(run, 1)
+
+    mock_task.transition_many.assert_awaited_with(["2"], "completed", db)
+    mock_logger.warning.assert_any_call("Task 1 canceled during processing.")
+    mock_logger.error.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_run_consumer_skips_canceled(mock_task, mock_db, mock_logger, mock_canceled_ids):
+    messages = [[QueueMessage("1", "default"), QueueMessage("2", "default")]]
+    mock_canceled_ids.return_value = {"1"}
+
+    async def dequeue_messages(count, timeout):
+        if messages:
+            return messages.pop()
+        task_consumer.stopping = True
+        return []
+
+    with mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages), \
+         mock.patch('app.consumer.task_consumer.process_message', mock.AsyncMock()) as mock_process, \
+         mock.patch('app.consumer.task_consumer.ack_tasks', mock.AsyncMock()) as mock_ack:
+        task_consumer.stopping = False
+        await task_consumer.run_consumer()
+
+    mock_canceled_ids.assert_awaited_once_with(["1", "2"])
+    mock_ack.assert_awaited_once_with(["1"])
+    mock_process.assert_awaited_once_with(QueueMessage("2", "default"))
+
+@pytest.mark.asyncio
+async def test_skip_canceled_error_processes_all(mock_logger, mock_canceled_ids):
+    mock_canceled_ids.side_effect = Exception("connection error")
+
+    assert await task_consumer.skip_canceled(["1"]) == set()
+    mock_logger.error.assert_called_with("get canceled tasks error: connection error")
+
+@pytest.mark.asyncio
+async def test_process_tasks_claim_error(mock_task, mock_db, mock_logger):
+    mock_task.transition_many = mock.AsyncMock(side_effect=Exception("update error"))
+    db = mock_db.return_value.__aenter__.return_value
+
+    await process_tasks(["1"], db)
+
+    db.rollback.assert_awaited()
+    mock_logger.error.assert_called_with("Tasks ['1'] claim error: update error")
+
+@pytest.mark.asyncio
+async def test_stop_consumer_drains_workers(mock_task, mock_db, mock_logger, mock_promoter):
+    async def dequeue_messages(count, timeout):
+        await asyncio.sleep(0.01)
+        return []
+
+    with mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages):
+        tasks = start_consumer(2)
+        assert len(tasks) == 2
+
+        await stop_consumer(1)
+
+    assert all(task.done() and not task.cancelled() for task in tasks)
+    assert task_consumer.consumer_tasks == []
+    mock_promoter.assert_called_once()
+    assert task_consumer.background_tasks == []
+
+@pytest.mark.asyncio
+async def test_scale_workers(mock_task, mock_db, mock_logger):
+    async def dequeue_messages(count, timeout):
+        await asyncio.sleep(0.01)
+        return []
+
+    with mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages):
+        start_consumer(1)
+        scale_workers(4)
+        assert len(task_consumer.consumer_tasks) == 4
+
+        # surplus workers leave at their next poll
+        scale_workers(2)
+        assert task_consumer.active_workers() == 2
+        await asyncio.sleep(0.05)
+        assert len(task_consumer.consumer_tasks) == 2
+        assert task_consumer.retiring == 0
+
+        await stop_consumer(1)
+
+@pytest.mark.asyncio
+async def test_scale_workers_keeps_retiring(mock_task, mock_db, mock_logger):
+    async def dequeue_messages(count, timeout):
+        await asyncio.sleep(0.01)
+        return []
+
+    with mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages):
+        start_consumer(3)
+        scale_workers(1)
+        # workers asked to leave but still running are kept instead of starting new ones
+        scale_workers(3)
+        assert task_consumer.retiring == 0
+        assert len(task_consumer.consumer_tasks) == 3
+
+        await stop_consumer(1)
+
+@pytest.mark.asyncio
+async def test_stop_consumer_cancels_after_timeout(mock_task, mock_db, mock_logger):
+    async def dequeue_messages(count, timeout):
+        await asyncio.sleep(10)
+
+    with mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages):
+        tasks = start_consumer(1)
+        await asyncio.sleep(0)
+
+        await stop_consumer(0.01)
+
+    assert tasks[0].cancelled()
+    mock_logger.warning.assert_called_with("Canceled 1 consumer workers after 0.01s drain timeout.")
+
+@pytest.mark.asyncio
+async def test_prefetch_consumer_bounds_in_flight(mock_task, mock_db, mock_logger):
+    queue = [str(i) for i in range(10)]
+    fetch_counts = []
+    running = []
+    max_running = 0
+    processed = []
+
+    async def dequeue_messages(count, timeout):
+        fetch_counts.append(count)
+        await asyncio.sleep(0.001)
+        messages = [QueueMessage(task_id, "default") for task_id in queue[:count]]
+        del queue[:count]
+        return messages
+
+    async def process_task(task_id, db):
+        nonlocal max_running
+        running.append(task_id)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(task_id)
+        processed.append(task_id)
+
+    with mock.patch('app.consumer.task_consumer.settings.task_consumer_mode', "prefetch"), \
+         mock.patch('app.consumer.task_consumer.settings.task_consumer_prefetch_size', 3), \
+         mock.patch('app.consumer.task_consumer.settings.task_consumer_max_in_flight', 2), \
+         mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages), \
+         mock.patch('app.consumer.task_consumer.process_task', process_task), \
+         mock.patch('app.consumer.task_consumer.ack_tasks', mock.AsyncMock()):
+        start_consumer(1)
+        while len(processed) < 10:
+            await asyncio.sleep(0.01)
+        await stop_consumer(1)
+
+    assert sorted(processed, key=int) == [str(i) for i in range(10)]
+    assert max_running == 2
+    assert max(fetch_counts) <= 3
+    assert task_consumer.in_flight_count == 0
+    assert task_consumer.slot_count == 0
+
+@pytest.mark.asyncio
+async def test_prefetch_consumer_requeues_buffer_on_cancel(mock_task, mock_db, mock_logger):
+    queue = [QueueMessage("1", "high"), QueueMessage("2", "low"), QueueMessage("3", "low")]
+
+    async def dequeue_messages(count, timeout):
+        await asyncio.sleep(0.001)
+        messages = queue[:count]
+        del queue[:count]
+        return messages
+
+    async def process_task(task_id, db):
+        await asyncio.sleep(10)
+
+    with mock.patch('app.consumer.task_consumer.settings.task_consumer_mode', "prefetch"), \
+         mock.patch('app.consumer.task_consumer.settings.task_consumer_prefetch_size', 2), \
+         mock.patch('app.consumer.task_consumer.settings.task_consumer_max_in_flight', 1), \
+         mock.patch('app.consumer.task_consumer.dequeue_messages', dequeue_messages), \
+         mock.patch('app.consumer.task_consumer.process_task', process_task), \
+         mock.patch('app.consumer.task_consumer.enqueue_tasks', mock.AsyncMock()) as mock_enqueue, \
+         mock.patch('app.consumer.task_consumer.ack_tasks', mock.AsyncMock()):
+        start_consumer(1)
+        await asyncio.sleep(0.05)
+        await stop_consumer(0.01)
+
+    # one task was running, the buffered ones go back to the queue they came from
+    mock_enqueue.assert_awaited_once_with(["2", "3"], "low")
+
+@pytest.mark.asyncio
+async def test_process_message_continues_trace(mock_db):
+    traceparent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    message = QueueMessage("1", "high", 1.0, traceparent)
+
+    with mock.patch('app.utils.tracing.settings.tracing_enabled', True), \
+         mock.patch('app.utils.tracing.export_span') as mock_export, \
+         mock.patch('app.consumer.task_consumer.process_task', mock.AsyncMock()) as mock_process, \
+         mock.patch('app.consumer.task_consumer.ack_tasks', mock.AsyncMock()) as mock_ack:
+        await task_consumer.process_message(message)
+
+    mock_process.assert_awaited_once_with("1", mock_db.return_value.__aenter__.return_value)
+    mock_ack.assert_awaited_once_with(["1"])
+    span = mock_export.call_args.args[0]
+    assert span.name == "task.process"
+    assert span.trace_id == "a" * 32
+    assert span.parent_id == "b" * 16
+    assert span.attributes["queue"] == "high"
+    assert span.attributes["queue_wait"] > 0
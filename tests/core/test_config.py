@@ -12,6 +12,9 @@ def test_default_values():
         assert settings.app_env == "dev"
         assert settings.log_level == "debug"
         assert settings.log_file_path == "logs/app.log"
+        assert settings.log_mode == "queue"
+        assert settings.log_levels == {"sqlalchemy": "warning"}
+        assert settings.database_echo is False
 
 def test_overridden_values():
     env_vars = {
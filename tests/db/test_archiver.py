@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.db.archiver import archive_tasks
+
+@pytest_asyncio.fixture
+def mock_archive():
+    with mock.patch('app.db.archiver.TaskArchive') as MockTaskArchive:
+        yield MockTaskArchive
+
+@pytest_asyncio.fixture
+def mock_db():
+    with mock.patch('app.db.archiver.async_session') as MockSession:
+        yield MockSession
+
+@pytest.mark.asyncio
+async def test_archive_tasks_batches(mock_archive, mock_db):
+    mock_archive.archive_batch = mock.AsyncMock(side_effect=[2, 2, 1])
+    db = mock_db.return_value.__aenter__.return_value
+
+    with mock.patch('app.db.archiver.settings.task_archive_batch_pause', 0):
+        total = await archive_tasks(3600, 2)
+
+    assert total == 5
+    assert mock_archive.archive_batch.await_count == 3
+    assert db.commit.await_count == 3
+    created_before = mock_archive.archive_batch.await_args.args[0]
+    assert mock_archive.archive_batch.await_args == mock.call(created_before, 2, db, delete_only=False)
+
+@pytest.mark.asyncio
+async def test_archive_tasks_delete_only(mock_archive, mock_db):
+    mock_archive.archive_batch = mock.AsyncMock(return_value=0)
+
+    assert await archive_tasks(3600, 2, delete_only=True) == 0
+    assert mock_archive.archive_batch.await_args.kwargs == {"delete_only": True}
+
+@pytest.mark.asyncio
+async def test_archive_tasks_error(mock_archive, mock_db):
+    mock_archive.archive_batch = mock.AsyncMock(side_effect=Exception("lock timeout"))
+    db = mock_db.return_value.__aenter__.return_value
+
+    assert await archive_tasks(3600, 2) == 0
+    db.rollback.assert_awaited()
+
+@pytest.mark.asyncio
+async def test_archive_tasks_stops(mock_archive, mock_db):
+    stopped = asyncio.Event()
+
+    async def archive_batch(*args, **kwargs):
+        stopped.set()
+        return 2
+
+    mock_archive.archive_batch = archive_batch
+
+    with mock.patch('app.db.archiver.settings.task_archive_batch_pause', 0):
+        assert await archive_tasks(3600, 2, stopped=stopped) == 2
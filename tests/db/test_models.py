@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app.db.models import Base, Task
+from app.schemas import TaskResponse
+
+@pytest.mark.asyncio
+async def test_task_insert_returns_server_defaults(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'models.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            task = Task("test content")
+            db.add(task)
+            await db.commit()
+
+            # created_at came back with the insert, the response needs no further query
+            response = TaskResponse.model_validate(task)
+
+        assert len(statements) == 1
+        assert "RETURNING" in statements[0]
+        assert response.created_at is not None
+        assert response.failed_attempts == 0
+    finally:
+        await engine.dispose()
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest import mock
+import pytest_asyncio
+from app.events.task_events import TaskEventHub, publish_task_events, task_events
+from app.schemas import TaskResponse
+
+def make_task(status: str, task_id: str = "1") -> TaskResponse:
+    return TaskResponse(id=task_id, content="content", status=status, created_at=datetime(2024, 1, 1))
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.events.task_events.redis') as MockRedis:
+        MockRedis.pipeline = mock.MagicMock()
+        MockRedis.pipe = MockRedis.pipeline.return_value.__aenter__.return_value
+        MockRedis.pipe.execute = mock.AsyncMock()
+        yield MockRedis
+
+@pytest.mark.asyncio
+async def test_publish_task_events(mock_redis):
+    tasks = [make_task("processing", "1"), make_task("completed", "2")]
+
+    await publish_task_events(tasks)
+
+    mock_redis.pipe.publish.assert_has_calls([
+        mock.call("task_events", tasks[0].model_dump_json()),
+        mock.call("task_events", tasks[1].model_dump_json()),
+    ])
+    mock_redis.pipe.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_publish_task_events_error(mock_redis):
+    mock_redis.pipe.execute = mock.AsyncMock(side_effect=Exception("connection error"))
+
+    # publishing is best effort, clients still see the state on reconnect
+    await publish_task_events([make_task("processing")])
+
+@pytest.mark.asyncio
+async def test_hub_dispatch():
+    hub = TaskEventHub(queue_size=2)
+    with mock.patch.object(hub, 'listen', mock.AsyncMock()):
+        events = hub.subscribe("1")
+        other = hub.subscribe("2")
+
+    for status in ["pending", "processing", "completed"]:
+        hub.dispatch(make_task(status).model_dump_json())
+
+    # the oldest event is dropped for a slow subscriber
+    assert [events.get_nowait().status, events.get_nowait().status] == ["processing", "completed"]
+    assert other.empty()
+
+    hub.unsubscribe("1", events)
+    hub.unsubscribe("1", events)
+    assert "1" not in hub.subscribers
+    await hub.close()
+
+@pytest.mark.asyncio
+async def test_task_events_until_terminal():
+    events = asyncio.Queue()
+    for status in ["pending", "processing", "processing", "completed"]:
+        events.put_nowait(make_task(status))
+
+    statuses = [event.status async for event in task_events(make_task("pending"), events)]
+
+    # stale and repeated statuses are skipped
+    assert statuses == ["pending", "processing", "completed"]
+
+@pytest.mark.asyncio
+async def test_task_events_across_retries():
+    events = asyncio.Queue()
+    for status, failed_attempts in [("processing", 0), ("scheduled", 1), ("processing", 0), ("pending", 1), ("processing", 1), ("failed", 2)]:
+        events.put_nowait(make_task(status).model_copy(update={"failed_attempts": failed_attempts}))
+
+    events_seen = [(event.status, event.failed_attempts) async for event in task_events(make_task("pending"), events)]
+
+    # a retry starts over at scheduled, a late event of the first attempt is stale; the stream ends at failed
+    assert events_seen == [("pending", 0), ("processing", 0), ("scheduled", 1), ("pending", 1), ("processing", 1), ("failed", 2)]
+
+@pytest.mark.asyncio
+async def test_task_events_terminal_on_connect():
+    statuses = [event.status async for event in task_events(make_task("canceled"), asyncio.Queue())]
+
+    assert statuses == ["canceled"]
+
+@pytest.mark.asyncio
+async def test_task_events_keepalive():
+    events = asyncio.Queue()
+
+    with mock.patch('app.events.task_events.settings.task_events_keepalive', 0.01):
+        stream = task_events(make_task("pending"), events)
+        assert (await stream.__anext__()).status == "pending"
+        assert await stream.__anext__() is None
+        events.put_nowait(make_task("completed"))
+        assert (await stream.__anext__()).status == "completed"
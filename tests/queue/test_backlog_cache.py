@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+from unittest import mock
+from app.queue.backlog_cache import BacklogCache
+
+@pytest.mark.asyncio
+async def test_sample_refreshes_in_background():
+    cache = BacklogCache(ttl=60)
+    backlog = mock.AsyncMock(return_value=(5, 100.0))
+
+    with mock.patch('app.queue.backlog_cache.queue_backlog', backlog), \
+         mock.patch('app.queue.backlog_cache.time.time', return_value=130.0):
+        # the first read does not wait for redis
+        assert cache.sample() == (0, 0.0)
+        await asyncio.sleep(0)
+        assert cache.sample() == (5, 30.0)
+        cache.sample()
+        await asyncio.sleep(0)
+
+    backlog.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_sample_error_keeps_last():
+    cache = BacklogCache(ttl=0)
+    cache.depth = 3
+
+    with mock.patch('app.queue.backlog_cache.queue_backlog', mock.AsyncMock(side_effect=Exception("connection error"))), \
+         mock.patch('app.queue.backlog_cache.logger') as mock_logger:
+        cache.sample()
+        await asyncio.sleep(0)
+
+    assert cache.sample()[0] == 3
+    mock_logger.error.assert_called_with("Queue backlog sample error: connection error")
@@ -0,0 +1,37 @@
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.queue.cancel_set import mark_canceled, canceled_task_ids
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.queue.cancel_set.redis') as MockRedis:
+        MockRedis.pipeline = mock.MagicMock()
+        MockRedis.pipe = MockRedis.pipeline.return_value.__aenter__.return_value
+        MockRedis.pipe.execute = mock.AsyncMock()
+        yield MockRedis
+
+@pytest.mark.asyncio
+async def test_mark_canceled(mock_redis):
+    with mock.patch('app.queue.cancel_set.time.time', return_value=5000.0), \
+         mock.patch('app.queue.cancel_set.settings.task_cancel_set_ttl', 3600):
+        await mark_canceled("1")
+
+    mock_redis.pipe.zadd.assert_called_once_with("task_canceled", {"1": 5000.0})
+    mock_redis.pipe.zremrangebyscore.assert_called_once_with("task_canceled", "-inf", 1400.0)
+    mock_redis.pipe.publish.assert_called_once_with("task_cancel", "1")
+    mock_redis.pipe.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_canceled_task_ids(mock_redis):
+    mock_redis.zmscore = mock.AsyncMock(return_value=[1.0, None, 2.0])
+
+    assert await canceled_task_ids(["1", "2", "3"]) == {"1", "3"}
+    mock_redis.zmscore.assert_awaited_once_with("task_canceled", ["1", "2", "3"])
+
+@pytest.mark.asyncio
+async def test_canceled_task_ids_empty(mock_redis):
+    mock_redis.zmscore = mock.AsyncMock()
+
+    assert await canceled_task_ids([]) == set()
+    mock_redis.zmscore.assert_not_awaited()
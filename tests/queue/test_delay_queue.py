@@ -0,0 +1,71 @@
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.queue import delay_queue
+from app.queue.delay_queue import schedule_tasks, unschedule_task, due_tasks, promote_tasks
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.queue.delay_queue.redis') as MockRedis, \
+         mock.patch.object(delay_queue, '_promote_script', None):
+        MockRedis.script = mock.AsyncMock()
+        MockRedis.register_script = mock.Mock(return_value=MockRedis.script)
+        yield MockRedis
+
+@pytest.mark.asyncio
+async def test_schedule_tasks(mock_redis):
+    mock_redis.zadd = mock.AsyncMock()
+
+    await schedule_tasks({"1": 100.0, "2": 200.0}, "high")
+
+    mock_redis.zadd.assert_awaited_once_with("task_scheduled:high", {"1": 100.0, "2": 200.0})
+
+@pytest.mark.asyncio
+async def test_schedule_tasks_error(mock_redis):
+    mock_redis.zadd = mock.AsyncMock(side_effect=Exception("connection error"))
+
+    with pytest.raises(Exception) as exc_info:
+        await schedule_tasks({"1": 100.0})
+
+    assert str(exc_info.value) == "Failed to schedule 1 tasks: connection error"
+
+@pytest.mark.asyncio
+async def test_unschedule_task(mock_redis):
+    mock_redis.zrem = mock.AsyncMock()
+
+    await unschedule_task("1")
+
+    mock_redis.zrem.assert_awaited_once_with("task_scheduled", "1")
+
+@pytest.mark.asyncio
+async def test_due_tasks(mock_redis):
+    mock_redis.zrangebyscore = mock.AsyncMock(return_value=[("1", 100.5), ("2", 101.0)])
+
+    with mock.patch('app.queue.delay_queue.time.time', return_value=102.0):
+        due = await due_tasks("high", 10)
+
+    mock_redis.zrangebyscore.assert_awaited_once_with("task_scheduled:high", "-inf", 102.0, start=0, num=10, withscores=True)
+    assert due == [("1", 100.5), ("2", 101.0)]
+
+@pytest.mark.asyncio
+async def test_promote_tasks(mock_redis):
+    mock_redis.script.return_value = ["1"]
+
+    with mock.patch('app.queue.delay_queue.time.time', return_value=102.0):
+        promoted = await promote_tasks(["1", "2"], "high")
+
+    mock_redis.script.assert_awaited_once_with(
+        keys=["task_scheduled:high", "task_queue:high"], args=[102.0, "list", "1", "2"]
+    )
+    assert promoted == ["1"]
+
+@pytest.mark.asyncio
+async def test_promote_tasks_stream(mock_redis):
+    mock_redis.script.return_value = []
+
+    with mock.patch('app.queue.redis_queue.settings.queue_backend', "stream"):
+        promoted = await promote_tasks(["1"])
+
+    assert mock_redis.script.await_args.kwargs["keys"] == ["task_scheduled", "task_stream"]
+    assert mock_redis.script.await_args.kwargs["args"][1] == "stream"
+    assert promoted == []
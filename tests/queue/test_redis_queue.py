@@ -0,0 +1,128 @@
+import json
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.queue import redis_queue
+from app.queue.message import QueueMessage
+from app.queue.redis_queue import enqueue_tasks, dequeue_task, dequeue_tasks, dequeue_messages, ack_tasks, queue_backlog
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.queue.redis_queue.redis') as MockRedis, \
+         mock.patch.object(redis_queue.scheduler, 'order', return_value=["high", "default", "low"]):
+        yield MockRedis
+
+@pytest_asyncio.fixture
+def mock_stream():
+    with mock.patch('app.queue.redis_queue.settings.queue_backend', "stream"), \
+         mock.patch('app.queue.redis_queue.redis_stream') as MockStream:
+        yield MockStream
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks(mock_redis):
+    mock_redis.rpush = mock.AsyncMock()
+
+    await enqueue_tasks(["1", "2"])
+
+    args = mock_redis.rpush.await_args.args
+    assert args[0] == "task_queue"
+    assert [json.loads(data)["id"] for data in args[1:]] == ["1", "2"]
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks_traces(mock_redis):
+    mock_redis.rpush = mock.AsyncMock()
+
+    await enqueue_tasks(["1", "2"], traces=["00-trace-span-01", None])
+
+    messages = [json.loads(data) for data in mock_redis.rpush.await_args.args[1:]]
+    assert messages[0]["tp"] == "00-trace-span-01"
+    assert "tp" not in messages[1]
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks_named_queue(mock_redis):
+    mock_redis.rpush = mock.AsyncMock()
+
+    await enqueue_tasks(["1"], "high")
+
+    assert mock_redis.rpush.await_args.args[0] == "task_queue:high"
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks_error(mock_redis):
+    mock_redis.rpush = mock.AsyncMock(side_effect=Exception("connection error"))
+
+    with pytest.raises(Exception) as exc_info:
+        await enqueue_tasks(["1", "2"])
+
+    assert str(exc_info.value) == "Failed to push 2 tasks to redis queue: connection error"
+
+@pytest.mark.asyncio
+async def test_dequeue_tasks(mock_redis):
+    mock_redis.blmpop = mock.AsyncMock(return_value=["task_queue", ['{"id": "1", "ts": 1.0}', "2"]])
+
+    task_ids = await dequeue_tasks(10, 0.5)
+
+    mock_redis.blmpop.assert_awaited_once_with(
+        0.5, 3, "task_queue:high", "task_queue", "task_queue:low", direction="LEFT", count=10
+    )
+    assert task_ids == ["1", "2"]
+
+@pytest.mark.asyncio
+async def test_dequeue_messages(mock_redis):
+    mock_redis.blmpop = mock.AsyncMock(return_value=["task_queue:low", ['{"id": "1", "ts": 1.0}']])
+
+    with mock.patch.object(redis_queue.scheduler, 'served') as mock_served:
+        messages = await dequeue_messages(10, 0.5)
+
+    assert messages == [QueueMessage("1", "low", 1.0)]
+    mock_served.assert_called_once_with("low")
+
+@pytest.mark.asyncio
+async def test_dequeue_tasks_timeout(mock_redis):
+    mock_redis.blmpop = mock.AsyncMock(return_value=None)
+
+    assert await dequeue_tasks(10, 0.5) == []
+
+@pytest.mark.asyncio
+async def test_ack_tasks_list_noop(mock_redis):
+    with mock.patch('app.queue.redis_queue.redis_stream') as mock_stream:
+        await ack_tasks(["1"])
+
+    mock_stream.ack_tasks.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_stream_backend_dispatch(mock_redis, mock_stream):
+    mock_stream.enqueue_tasks = mock.AsyncMock()
+    mock_stream.dequeue_messages = mock.AsyncMock(return_value=[QueueMessage("1", "high")])
+    mock_stream.ack_tasks = mock.AsyncMock()
+
+    await enqueue_tasks(["1"], "high")
+    task_id = await dequeue_task()
+    await ack_tasks([task_id])
+
+    mock_stream.enqueue_tasks.assert_awaited_once_with(["1"], "high", None)
+    mock_stream.dequeue_messages.assert_awaited_once_with(["high", "default", "low"], 1, 1.0)
+    mock_stream.ack_tasks.assert_awaited_once_with(["1"])
+    mock_redis.rpush.assert_not_called()
+    assert task_id == "1"
+
+@pytest.mark.asyncio
+async def test_queue_backlog(mock_redis):
+    mock_redis.pipeline = mock.MagicMock()
+    pipe = mock_redis.pipeline.return_value.__aenter__.return_value
+    pipe.execute = mock.AsyncMock(return_value=[2, '{"id": "1", "ts": 20.0}', 0, None, 3, '{"id": "2", "ts": 10.0}'])
+
+    with mock.patch('app.queue.redis_queue.settings.task_queues', {"high": 6, "default": 3, "low": 1}):
+        depth, oldest = await queue_backlog()
+
+    pipe.lindex.assert_has_calls([mock.call("task_queue:high", 0), mock.call("task_queue", 0), mock.call("task_queue:low", 0)])
+    assert depth == 5
+    assert oldest == 10.0
+
+@pytest.mark.asyncio
+async def test_queue_backlog_stream(mock_stream):
+    mock_stream.backlog = mock.AsyncMock(return_value=(3, 1.0))
+
+    with mock.patch('app.queue.redis_queue.settings.task_queues', {"default": 1}):
+        assert await queue_backlog() == (3, 1.0)
+
+    mock_stream.backlog.assert_awaited_once_with(["default"])
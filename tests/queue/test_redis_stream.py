@@ -0,0 +1,139 @@
+import pytest
+from unittest import mock
+import pytest_asyncio
+from app.queue import redis_stream
+from app.queue.message import QueueMessage
+from redis.exceptions import ResponseError
+from app.queue.redis_stream import enqueue_tasks, dequeue_messages, ack_tasks, backlog
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.queue.redis_stream.redis') as MockRedis, \
+         mock.patch.object(redis_stream, '_ready_groups', {"task_stream", "task_stream:high"}), \
+         mock.patch.object(redis_stream, '_reclaim_at', float("inf")), \
+         mock.patch.dict(redis_stream._pending_entries, clear=True):
+        MockRedis.pipeline = mock.MagicMock()
+        MockRedis.pipe = MockRedis.pipeline.return_value.__aenter__.return_value
+        MockRedis.pipe.execute = mock.AsyncMock()
+        yield MockRedis
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks(mock_redis):
+    with mock.patch('app.queue.redis_stream.time.time', return_value=1.0):
+        await enqueue_tasks(["1", "2"], "high")
+
+    mock_redis.pipe.xadd.assert_has_calls([
+        mock.call("task_stream:high", {"task_id": "1", "enqueued_at": 1.0}),
+        mock.call("task_stream:high", {"task_id": "2", "enqueued_at": 1.0}),
+    ])
+    mock_redis.pipe.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_enqueue_tasks_traces(mock_redis):
+    with mock.patch('app.queue.redis_stream.time.time', return_value=1.0):
+        await enqueue_tasks(["1", "2"], "high", ["00-trace-span-01", None])
+
+    mock_redis.pipe.xadd.assert_has_calls([
+        mock.call("task_stream:high", {"task_id": "1", "enqueued_at": 1.0, "traceparent": "00-trace-span-01"}),
+        mock.call("task_stream:high", {"task_id": "2", "enqueued_at": 1.0}),
+    ])
+
+@pytest.mark.asyncio
+async def test_dequeue_messages(mock_redis):
+    mock_redis.xreadgroup = mock.AsyncMock(return_value=[
+        ["task_stream", [("1-0", {"task_id": "1", "enqueued_at": "1.0"}), ("1-1", {"task_id": "2"})]]
+    ])
+
+    messages = await dequeue_messages(["default"], 10, 0.5)
+
+    mock_redis.xreadgroup.assert_awaited_once_with(
+        "task_consumers", redis_stream.CONSUMER_NAME, {"task_stream": ">"}, count=10, block=500
+    )
+    assert messages == [QueueMessage("1", "default", 1.0), QueueMessage("2", "default")]
+    assert redis_stream._pending_entries == {"1": ("task_stream", "1-0"), "2": ("task_stream", "1-1")}
+
+@pytest.mark.asyncio
+async def test_dequeue_messages_in_queue_order(mock_redis):
+    mock_redis.xreadgroup = mock.AsyncMock(side_effect=[
+        [],
+        [["task_stream", [("1-0", {"task_id": "1"})]]],
+    ])
+
+    messages = await dequeue_messages(["high", "default"], 10, 0.5)
+
+    mock_redis.xreadgroup.assert_has_awaits([
+        mock.call("task_consumers", redis_stream.CONSUMER_NAME, {"task_stream:high": ">"}, count=10),
+        mock.call("task_consumers", redis_stream.CONSUMER_NAME, {"task_stream": ">"}, count=10),
+    ])
+    assert messages == [QueueMessage("1", "default")]
+
+@pytest.mark.asyncio
+async def test_dequeue_messages_blocks_on_all_queues(mock_redis):
+    mock_redis.xreadgroup = mock.AsyncMock(side_effect=[[], [], []])
+
+    messages = await dequeue_messages(["high", "default"], 10, 0.5)
+
+    mock_redis.xreadgroup.assert_awaited_with(
+        "task_consumers", redis_stream.CONSUMER_NAME, {"task_stream:high": ">", "task_stream": ">"}, count=1, block=500
+    )
+    assert messages == []
+
+@pytest.mark.asyncio
+async def test_dequeue_messages_reclaims_stale_entries(mock_redis):
+    mock_redis.xautoclaim = mock.AsyncMock(return_value=["0-0", [("1-0", {"task_id": "1"}), (None, None)], []])
+    mock_redis.xreadgroup = mock.AsyncMock()
+
+    with mock.patch.object(redis_stream, '_reclaim_at', 0.0):
+        messages = await dequeue_messages(["default"], 10, 0.5)
+
+    mock_redis.xautoclaim.assert_awaited_once()
+    mock_redis.xreadgroup.assert_not_called()
+    assert messages == [QueueMessage("1", "default")]
+
+@pytest.mark.asyncio
+async def test_dequeue_messages_nogroup_error(mock_redis):
+    mock_redis.xreadgroup = mock.AsyncMock(side_effect=Exception("NOGROUP No such consumer group"))
+
+    with pytest.raises(Exception):
+        await dequeue_messages(["default"], 10, 0.5)
+
+    assert redis_stream._ready_groups == set()
+
+@pytest.mark.asyncio
+async def test_ack_tasks(mock_redis):
+    redis_stream._pending_entries.update({
+        "1": ("task_stream", "1-0"), "2": ("task_stream", "1-1"), "3": ("task_stream:high", "2-0")
+    })
+
+    await ack_tasks(["1", "3", "4"])
+
+    mock_redis.pipe.xack.assert_has_calls([
+        mock.call("task_stream", "task_consumers", "1-0"),
+        mock.call("task_stream:high", "task_consumers", "2-0"),
+    ])
+    mock_redis.pipe.xdel.assert_has_calls([
+        mock.call("task_stream", "1-0"),
+        mock.call("task_stream:high", "2-0"),
+    ])
+    assert redis_stream._pending_entries == {"2": ("task_stream", "1-1")}
+
+@pytest.mark.asyncio
+async def test_backlog(mock_redis):
+    mock_redis.pipe.execute = mock.AsyncMock(side_effect=[
+        [
+            5, [{"name": "task_consumers", "pending": 2, "last-delivered-id": "1000-0"}],
+            0, ResponseError("no such key"),
+        ],
+        [[("2000-0", {"task_id": "3", "enqueued_at": "2.0"})], []],
+    ])
+
+    with mock.patch('app.queue.redis_stream.settings.queue_stream_group', "task_consumers"):
+        depth, oldest = await backlog(["default", "high"])
+
+    # the oldest entry not delivered yet is the first after the last delivered one
+    mock_redis.pipe.xrange.assert_has_calls([
+        mock.call("task_stream", min="(1000-0", count=1),
+        mock.call("task_stream:high", min="-", count=1),
+    ])
+    assert depth == 3
+    assert oldest == 2.0
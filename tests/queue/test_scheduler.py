@@ -0,0 +1,37 @@
+from collections import Counter
+from unittest import mock
+from app.queue.scheduler import QueueScheduler
+
+def test_order_follows_weights():
+    scheduler = QueueScheduler({"high": 6, "default": 3, "low": 1}, 30)
+
+    picks = Counter(scheduler.order()[0] for _ in range(100))
+
+    assert picks == {"high": 60, "default": 30, "low": 10}
+
+def test_order_lists_all_queues():
+    scheduler = QueueScheduler({"high": 6, "default": 3, "low": 1, "off": 0}, 30)
+
+    assert sorted(scheduler.order()) == ["default", "high", "low"]
+
+def test_order_starving_queue_first():
+    with mock.patch('app.queue.scheduler.time.monotonic', return_value=0.0):
+        scheduler = QueueScheduler({"high": 6, "low": 1}, 30)
+
+    with mock.patch('app.queue.scheduler.time.monotonic', return_value=20.0):
+        scheduler.served("high")
+    with mock.patch('app.queue.scheduler.time.monotonic', return_value=40.0):
+        order = scheduler.order()
+
+    assert order[0] == "low"
+
+def test_served_resets_starvation():
+    with mock.patch('app.queue.scheduler.time.monotonic', return_value=0.0):
+        scheduler = QueueScheduler({"high": 6, "low": 1}, 30)
+
+    with mock.patch('app.queue.scheduler.time.monotonic', return_value=40.0):
+        scheduler.served("low")
+        scheduler.served("high")
+        order = scheduler.order()
+
+    assert order[0] == "high"
@@ -0,0 +1,100 @@
+import json
+import logging
+import queue
+import pytest
+from logging.handlers import QueueHandler
+from unittest import mock
+from app.utils import logging as app_logging
+from app.utils.logging import JsonFormatter, SamplingFilter, logger_level, setup_logger, setup_file_logger
+
+@pytest.fixture
+def mock_handlers():
+    # keep the shared handlers of the test process untouched
+    with mock.patch.object(app_logging, '_handlers', []), \
+         mock.patch.object(app_logging, '_queue_handler', None), \
+         mock.patch.object(app_logging, '_listeners', []), \
+         mock.patch('app.utils.logging.create_handlers', return_value=[logging.NullHandler()]), \
+         mock.patch('app.utils.logging.atexit'), \
+         mock.patch('app.utils.logging.os.register_at_fork'):
+        yield
+        app_logging.stop_listener()
+
+def make_record(level=logging.INFO, **extra):
+    record = logging.makeLogRecord({"name": "app.test", "levelno": level, "levelname": logging.getLevelName(level), "msg": "Task 1 completed."})
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_fields():
+    data = json.loads(JsonFormatter().format(make_record(task_id="1", status="completed", duration=0.5)))
+
+    assert data["level"] == "INFO"
+    assert data["logger"] == "app.test"
+    assert data["message"] == "Task 1 completed."
+    assert data["task_id"] == "1"
+    assert data["status"] == "completed"
+    assert data["duration"] == 0.5
+    assert "time" in data
+    assert "levelno" not in data
+
+def test_sampling_filter():
+    with mock.patch('app.utils.logging.random.random', return_value=0.5):
+        assert SamplingFilter(0.6).filter(make_record(logging.INFO))
+        assert not SamplingFilter(0.4).filter(make_record(logging.INFO))
+        assert SamplingFilter(0.0).filter(make_record(logging.WARNING))
+
+def test_logger_level_most_specific_wins():
+    levels = {"sqlalchemy": "warning", "sqlalchemy.pool": "debug"}
+    with mock.patch.object(app_logging.settings, 'log_levels', levels):
+        assert logger_level("sqlalchemy.engine.Engine", "info") == "WARNING"
+        assert logger_level("sqlalchemy.pool.impl", "info") == "DEBUG"
+        assert logger_level("app.api", "info") == "INFO"
+
+def test_setup_logger_sync_mode(mock_handlers):
+    with mock.patch.object(app_logging.settings, 'log_mode', "sync"), \
+         mock.patch.object(app_logging.settings, 'log_sample_rate', 1.0):
+        logger = setup_logger("app.test.sync", "info")
+
+    assert logger.level == logging.INFO
+    assert len(logger.handlers) == 1
+    assert isinstance(logger.handlers[0], logging.NullHandler)
+    assert not logger.filters
+
+def test_setup_logger_queue_mode(mock_handlers):
+    with mock.patch.object(app_logging.settings, 'log_mode', "queue"), \
+         mock.patch.object(app_logging.settings, 'log_sample_rate', 0.1):
+        logger = setup_logger("app.test.queue", "info")
+        other = setup_logger("app.test.other", "info")
+
+    # one queue handler shared by every logger, the listener owns the real handlers
+    assert len(logger.handlers) == 1
+    assert isinstance(logger.handlers[0], QueueHandler)
+    assert other.handlers[0] is logger.handlers[0]
+    assert len(app_logging._listeners) == 1
+    assert app_logging._listeners[0][1].handlers == tuple(app_logging._handlers)
+    assert isinstance(logger.filters[0], SamplingFilter)
+
+def test_restart_listener_uses_new_queue(mock_handlers):
+    with mock.patch.object(app_logging.settings, 'log_mode', "queue"):
+        setup_logger("app.test.fork", "info")
+    old_queue = app_logging._queue_handler.queue
+    _, old_listener = app_logging._listeners[0]
+
+    # what a forked child does: the parent's listener thread is gone
+    app_logging.restart_listener()
+
+    assert app_logging._queue_handler.queue is not old_queue
+    assert isinstance(app_logging._queue_handler.queue, queue.SimpleQueue)
+    assert app_logging._listeners[0][0] is app_logging._queue_handler
+    assert app_logging._listeners[0][1] is not old_listener
+    old_listener.stop()
+
+def test_setup_file_logger_queue_mode(mock_handlers, tmp_path):
+    path = tmp_path / "spans" / "spans.jsonl"
+    with mock.patch.object(app_logging.settings, 'log_mode', "queue"):
+        logger = setup_file_logger("app.test.file", str(path))
+    logger.info('{"name": "task.process"}')
+    app_logging.stop_listener()
+
+    assert not logger.propagate
+    assert isinstance(logger.handlers[0], QueueHandler)
+    assert path.read_text() == '{"name": "task.process"}\n'
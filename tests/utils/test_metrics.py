@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+def test_import_with_missing_multiprocess_dir(tmp_path):
+    # the directory of multiprocess mode is created on import, e.g. when pytest or a program starts
+    # before anything else made it
+    path = tmp_path / "prometheus" / "consumer"
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(path), LOG_FILE_PATH=str(tmp_path / "app.log"))
+
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.main, app.consumer.worker"],
+        env=env, capture_output=True, text=True, timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert path.is_dir()
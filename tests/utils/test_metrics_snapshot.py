@@ -0,0 +1,109 @@
+import pytest
+import pytest_asyncio
+from unittest import mock
+from redis.exceptions import ResponseError
+from prometheus_client import generate_latest
+from prometheus_client.registry import CollectorRegistry
+from app.utils.metrics_snapshot import MetricsSnapshot, sample_queues, sample_task_statuses, sample_outbox
+
+@pytest_asyncio.fixture
+def mock_redis():
+    with mock.patch('app.utils.metrics_snapshot.redis') as MockRedis:
+        MockRedis.pipeline = mock.MagicMock()
+        MockRedis.pipe = MockRedis.pipeline.return_value.__aenter__.return_value
+        MockRedis.pipe.execute = mock.AsyncMock()
+        yield MockRedis
+
+@pytest_asyncio.fixture
+def mock_queues():
+    with mock.patch('app.utils.metrics_snapshot.settings.task_queues', {"high": 2, "default": 1}):
+        yield
+
+@pytest.mark.asyncio
+async def test_sample_queues_list(mock_redis, mock_queues):
+    mock_redis.pipe.execute.return_value = [3, 1, 0, 2]
+    with mock.patch('app.utils.metrics_snapshot.use_stream', return_value=False):
+        samples = await sample_queues()
+
+    mock_redis.pipe.llen.assert_has_calls([mock.call("task_queue:high"), mock.call("task_queue")])
+    mock_redis.pipe.zcard.assert_has_calls([mock.call("task_scheduled:high"), mock.call("task_scheduled")])
+    assert samples == {
+        "high": {"ready": 3, "pending": 0, "scheduled": 1},
+        "default": {"ready": 0, "pending": 0, "scheduled": 2},
+    }
+
+@pytest.mark.asyncio
+async def test_sample_queues_stream(mock_redis, mock_queues):
+    groups = [{"name": "task_consumers", "pending": 2}, {"name": "other", "pending": 5}]
+    mock_redis.pipe.execute.return_value = [5, groups, 0, 0, ResponseError("no such key"), 4]
+    with mock.patch('app.utils.metrics_snapshot.use_stream', return_value=True):
+        samples = await sample_queues()
+
+    mock_redis.pipe.xlen.assert_has_calls([mock.call("task_stream:high"), mock.call("task_stream")])
+    assert samples == {
+        "high": {"ready": 3, "pending": 2, "scheduled": 0},
+        "default": {"ready": 0, "pending": 0, "scheduled": 4},
+    }
+
+@pytest.mark.asyncio
+async def test_sample_queues_error(mock_redis, mock_queues):
+    mock_redis.pipe.execute.return_value = [ConnectionError("down"), 0, 0, 0]
+    with mock.patch('app.utils.metrics_snapshot.use_stream', return_value=False):
+        with pytest.raises(ConnectionError):
+            await sample_queues()
+
+@pytest.mark.asyncio
+async def test_sample_task_statuses():
+    with mock.patch('app.utils.metrics_snapshot.async_session'), \
+         mock.patch('app.utils.metrics_snapshot.Task') as MockTask:
+        MockTask.count_by_status = mock.AsyncMock(return_value={"pending": 4, "completed": 10})
+        statuses = await sample_task_statuses()
+
+    assert statuses["pending"] == 4
+    assert statuses["completed"] == 10
+    assert statuses["processing"] == 0
+
+@pytest.mark.asyncio
+async def test_sample_outbox():
+    with mock.patch('app.utils.metrics_snapshot.async_session'), \
+         mock.patch('app.utils.metrics_snapshot.TaskOutbox') as MockTaskOutbox:
+        MockTaskOutbox.count = mock.AsyncMock(return_value=7)
+        assert await sample_outbox() == 7
+
+@pytest.mark.asyncio
+async def test_snapshot_refresh_cached():
+    snapshot = MetricsSnapshot(ttl=60)
+    with mock.patch('app.utils.metrics_snapshot.sample_queues', mock.AsyncMock(return_value={"default": {"ready": 3, "pending": 1, "scheduled": 2}})) as mock_queues, \
+         mock.patch('app.utils.metrics_snapshot.sample_task_statuses', mock.AsyncMock(return_value={"pending": 3})), \
+         mock.patch('app.utils.metrics_snapshot.sample_outbox', mock.AsyncMock(return_value=2)):
+        await snapshot.refresh()
+        await snapshot.refresh()
+
+    mock_queues.assert_awaited_once()
+    registry = CollectorRegistry()
+    registry.register(snapshot)
+    output = generate_latest(registry).decode()
+    assert 'queue_length{queue="default"} 3.0' in output
+    assert 'queue_pending{queue="default"} 1.0' in output
+    assert 'queue_scheduled_length{queue="default"} 2.0' in output
+    assert 'task_status{status="pending"} 3.0' in output
+    assert "task_outbox_length 2.0" in output
+    assert "metrics_snapshot_age" in output
+
+@pytest.mark.asyncio
+async def test_snapshot_refresh_error_keeps_last():
+    snapshot = MetricsSnapshot(ttl=0)
+    snapshot.statuses = {"pending": 3}
+    snapshot.sampled_at = 1.0
+    with mock.patch('app.utils.metrics_snapshot.sample_queues', mock.AsyncMock(side_effect=Exception("redis down"))), \
+         mock.patch('app.utils.metrics_snapshot.sample_task_statuses', mock.AsyncMock(return_value={})), \
+         mock.patch('app.utils.metrics_snapshot.sample_outbox', mock.AsyncMock(return_value=0)), \
+         mock.patch('app.utils.metrics_snapshot.logger') as mock_logger:
+        await snapshot.refresh()
+
+    mock_logger.error.assert_called_with("Metrics snapshot error: redis down")
+    assert snapshot.statuses == {"pending": 3}
+    assert snapshot.sampled_at == 1.0
+
+def test_snapshot_collect_before_sample():
+    assert list(MetricsSnapshot(ttl=5).collect()) == []
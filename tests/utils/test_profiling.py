@@ -0,0 +1,63 @@
+import pytest
+from unittest import mock
+from app.utils.profiling import TaskProfiler
+
+@pytest.mark.asyncio
+async def test_profile_disabled():
+    profiler = TaskProfiler(False, 1.0, 0.0, "profiles")
+    with mock.patch('app.utils.profiling.cProfile') as mock_cprofile:
+        async with profiler.profile(mock.Mock(id="1")):
+            pass
+
+    mock_cprofile.Profile.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_profile_slow_task_sampled(tmp_path):
+    profiler = TaskProfiler(True, 1.0, 0.0, str(tmp_path))
+    with mock.patch('app.utils.profiling.logger') as mock_logger:
+        async with profiler.profile(mock.Mock(id="1")):
+            sum(range(1000))
+
+    assert (tmp_path / "1.prof").exists()
+    assert not profiler.active
+    message = mock_logger.warning.call_args.args[0]
+    assert message.startswith("Slow task 1 took ")
+    assert message.endswith(f"profile saved to {tmp_path / '1.prof'}")
+
+@pytest.mark.asyncio
+async def test_profile_slow_task_not_sampled(tmp_path):
+    profiler = TaskProfiler(True, 0.0, 0.0, str(tmp_path))
+    with mock.patch('app.utils.profiling.logger') as mock_logger:
+        async with profiler.profile(mock.Mock(id="1")):
+            pass
+
+    assert not (tmp_path / "1.prof").exists()
+    assert "profile saved" not in mock_logger.warning.call_args.args[0]
+
+@pytest.mark.asyncio
+async def test_profile_fast_task(tmp_path):
+    profiler = TaskProfiler(True, 1.0, 60.0, str(tmp_path))
+    with mock.patch('app.utils.profiling.logger') as mock_logger:
+        async with profiler.profile(mock.Mock(id="1")):
+            pass
+
+    assert not (tmp_path / "1.prof").exists()
+    mock_logger.warning.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_profile_one_at_a_time(tmp_path):
+    profiler = TaskProfiler(True, 1.0, 60.0, str(tmp_path))
+    with mock.patch('app.utils.profiling.cProfile') as mock_cprofile:
+        async with profiler.profile(mock.Mock(id="1")):
+            async with profiler.profile(mock.Mock(id="2")):
+                pass
+
+    mock_cprofile.Profile.assert_called_once()
+
+def test_toggle():
+    profiler = TaskProfiler(False, 1.0, 1.0, "profiles")
+    with mock.patch('app.utils.profiling.logger'):
+        profiler.toggle()
+        assert profiler.enabled
+        profiler.toggle()
+        assert not profiler.enabled
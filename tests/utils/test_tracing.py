@@ -0,0 +1,91 @@
+import json
+import pytest
+import pytest_asyncio
+from unittest import mock
+from app.queue.message import encode_message, decode_message
+from app.utils.tracing import start_span, traced, current_traceparent, parse_traceparent, set_span_attribute
+
+@pytest_asyncio.fixture
+def mock_export():
+    with mock.patch('app.utils.tracing.settings.tracing_enabled', True), \
+         mock.patch('app.utils.tracing.export_span') as MockExport:
+        yield MockExport
+
+def exported(mock_export):
+    return [call.args[0].to_dict() for call in mock_export.call_args_list]
+
+def test_start_span_disabled():
+    with mock.patch('app.utils.tracing.settings.tracing_enabled', False), \
+         mock.patch('app.utils.tracing.export_span') as mock_export:
+        with start_span("task.create") as span:
+            assert span is None
+            assert current_traceparent() is None
+
+    mock_export.assert_not_called()
+
+def test_start_span_nested(mock_export):
+    with start_span("task.create", queue="default") as parent:
+        with start_span("queue.enqueue") as child:
+            set_span_attribute("count", 2)
+
+    # the child continues the trace of the enclosing span
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+
+    child_span, parent_span = exported(mock_export)
+    assert child_span["span_id"] == child.span_id
+    assert child_span["trace_id"] == parent_span["trace_id"]
+    assert child_span["parent_id"] == parent.span_id
+    assert parent_span["parent_id"] is None
+    assert parent_span["attributes"] == {"queue": "default"}
+    assert child_span["attributes"] == {"count": 2}
+    assert child_span["duration"] >= 0
+
+def test_start_span_continues_traceparent(mock_export):
+    traceparent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+
+    with start_span("task.process", traceparent=traceparent):
+        pass
+
+    span = exported(mock_export)[0]
+    assert span["trace_id"] == "a" * 32
+    assert span["parent_id"] == "b" * 16
+
+def test_start_span_error(mock_export):
+    with pytest.raises(ValueError):
+        with start_span("task.handler"):
+            raise ValueError("handler error")
+
+    span = exported(mock_export)[0]
+    assert span["status"] == "error"
+    assert span["attributes"]["error"] == "handler error"
+
+def test_parse_traceparent_malformed():
+    assert parse_traceparent(None) is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent("00-abc-def-01") is None
+
+@pytest.mark.asyncio
+async def test_traced(mock_export):
+    @traced("task.create")
+    async def create():
+        return current_traceparent()
+
+    traceparent = await create()
+
+    span = exported(mock_export)[0]
+    assert span["name"] == "task.create"
+    assert traceparent == f"00-{span['trace_id']}-{span['span_id']}-01"
+
+def test_message_carries_traceparent(mock_export):
+    with start_span("queue.enqueue") as span:
+        data = encode_message("1")
+
+    assert json.loads(data)["tp"] == span.traceparent()
+    assert decode_message(data, "default").trace == span.traceparent()
+
+def test_message_without_traceparent():
+    data = encode_message("1")
+
+    assert "tp" not in json.loads(data)
+    assert decode_message(data, "default").trace is None